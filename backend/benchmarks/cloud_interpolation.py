@@ -0,0 +1,62 @@
+"""
+Benchmark interpolate_cloud_cover against the original per-point nearest-sample loop.
+
+Run from backend/:  python -m benchmarks.cloud_interpolation
+"""
+import math
+import time
+import numpy as np
+from services.cloud_cover_strategy import interpolate_cloud_cover
+
+CENTER = (38.9634, -92.3293)  # Columbia, MO
+
+
+def legacy_interpolate(lat, lon, sample_points, sample_clouds):
+    """The pre-vectorization implementation (nearest neighbour in degrees), kept as the baseline"""
+    valid_samples = [
+        (slat, slon, cloud)
+        for (slat, slon), cloud in zip(sample_points, sample_clouds)
+        if cloud is not None
+    ]
+    if not valid_samples:
+        return None
+
+    min_dist = float('inf')
+    nearest_cloud = None
+    for slat, slon, cloud in valid_samples:
+        dist = math.sqrt((lat - slat)**2 + (lon - slon)**2)
+        if dist < min_dist:
+            min_dist = dist
+            nearest_cloud = cloud
+    return nearest_cloud
+
+
+def main():
+    rng = np.random.default_rng(0)
+    points = 20000
+    lats = CENTER[0] + rng.uniform(-1.0, 1.0, points)
+    lons = CENTER[1] + rng.uniform(-1.3, 1.3, points)
+
+    print(f"{'samples':>8} {'points':>8} {'legacy ms':>10} {'nearest ms':>11} {'idw ms':>8}")
+    for samples in (10, 25, 100):
+        index = rng.choice(points, samples, replace=False)
+        sample_clouds = rng.uniform(0, 100, samples)
+        sample_points = list(zip(lats[index].tolist(), lons[index].tolist()))
+
+        start = time.perf_counter()
+        for lat, lon in zip(lats.tolist(), lons.tolist()):
+            legacy_interpolate(lat, lon, sample_points, sample_clouds.tolist())
+        legacy_seconds = time.perf_counter() - start
+
+        timings = []
+        for method in ("nearest", "idw"):
+            start = time.perf_counter()
+            interpolate_cloud_cover(lats, lons, lats[index], lons[index], sample_clouds, method=method)
+            timings.append(time.perf_counter() - start)
+
+        print(f"{samples:>8} {points:>8} {legacy_seconds * 1000:>10.1f} {timings[0] * 1000:>11.2f} "
+              f"{timings[1] * 1000:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Benchmark generate_grid_points against the original per-point shapely loop.
+
+Run from backend/:  python -m benchmarks.grid_points
+"""
+import math
+import time
+import numpy as np
+from shapely.geometry import Point, Polygon
+from services.isochrone import generate_grid_points, get_radius_polygon, snap_to_global_grid, GLOBAL_GRID_SPACING_DEGREES
+
+CENTER = (38.9634, -92.3293)  # Columbia, MO
+
+
+def legacy_generate_grid_points(polygon: Polygon, grid_spacing_degrees: float = GLOBAL_GRID_SPACING_DEGREES):
+    """The pre-vectorization implementation, kept here as the baseline"""
+    minlon, minlat, maxlon, maxlat = polygon.bounds
+
+    start_lat = math.floor(minlat / grid_spacing_degrees) * grid_spacing_degrees
+    start_lon = math.floor(minlon / grid_spacing_degrees) * grid_spacing_degrees
+    end_lat = math.ceil(maxlat / grid_spacing_degrees) * grid_spacing_degrees
+    end_lon = math.ceil(maxlon / grid_spacing_degrees) * grid_spacing_degrees
+
+    points = []
+
+    lat = start_lat
+    while lat <= end_lat:
+        lon = start_lon
+        while lon <= end_lon:
+            snapped_lat, snapped_lon = snap_to_global_grid(lat, lon, grid_spacing_degrees)
+
+            point = Point(snapped_lon, snapped_lat)
+            if polygon.contains(point) or polygon.boundary.distance(point) < grid_spacing_degrees * 0.1:
+                points.append((snapped_lat, snapped_lon))
+            lon += grid_spacing_degrees
+        lat += grid_spacing_degrees
+
+    points = list(set(points))
+
+    if len(points) == 0:
+        center = polygon.centroid
+        center_snapped = snap_to_global_grid(center.y, center.x, grid_spacing_degrees)
+        points.append(center_snapped)
+
+    return points
+
+
+def isochrone_like_polygon(lat: float, lon: float, radius_miles: float, vertices: int = 400, seed: int = 0) -> Polygon:
+    """Irregular star-shaped polygon resembling a drive-time isochrone (roads reach further than fields)"""
+    rng = np.random.default_rng(seed)
+    angles = np.linspace(0, 2 * math.pi, vertices, endpoint=False)
+    radii = radius_miles / 69.0 * (0.55 + 0.45 * rng.random(vertices))
+    radii = np.convolve(np.tile(radii, 3), np.ones(5) / 5, mode="same")[vertices:2 * vertices]
+    return Polygon(zip(lon + radii * np.sin(angles) / math.cos(math.radians(lat)), lat + radii * np.cos(angles)))
+
+
+def _time(func, *args, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    cases = [
+        ("radius 30 mi", get_radius_polygon(*CENTER, 30)),
+        ("radius 120 mi", get_radius_polygon(*CENTER, 120)),
+        ("isochrone ~60 min", isochrone_like_polygon(*CENTER, 50)),
+        ("isochrone ~120 min", isochrone_like_polygon(*CENTER, 110)),
+    ]
+
+    print(f"{'polygon':<20} {'points':>8} {'legacy ms':>10} {'numpy ms':>10} {'speedup':>8}  same set")
+    for name, polygon in cases:
+        legacy = legacy_generate_grid_points(polygon)
+        current = generate_grid_points(polygon)
+        legacy_seconds = _time(legacy_generate_grid_points, polygon, repeat=1)
+        current_seconds = _time(generate_grid_points, polygon)
+
+        print(f"{name:<20} {len(current):>8} {legacy_seconds * 1000:>10.1f} {current_seconds * 1000:>10.2f} "
+              f"{legacy_seconds / current_seconds:>7.0f}x  {set(legacy) == set(current)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,21 @@
 import redis
+import redis.asyncio as aioredis
 import json
+import asyncio
 import logging
+import numpy as np
 from functools import wraps
-from typing import Optional, Callable, Any
+from typing import Optional, Callable, Any, List, Tuple
 from config import settings
+from disk_cache import DiskCache, AsyncDiskCache
 import hashlib
+import fnmatch
+from collections import OrderedDict
 from datetime import datetime
+import struct
 import threading
+import time
+import uuid
 
 logger = logging.getLogger(__name__)
 
@@ -16,30 +25,100 @@ class CacheStats:
         self.hits = 0
         self.misses = 0
         self.errors = 0
+        self.l1_hits = 0
+        self.l1_misses = 0
+        self.l2_hits = 0
+        self.l2_misses = 0
+        self.coalesced = 0
+        self.stale_hits = 0
+        self.refreshes = 0
+        self.degraded = 0
+        self.prefetches = 0
+        self.prefetch_hits = 0
         self.start_time = datetime.now()
         self.by_function = {}
         self._lock = threading.Lock()
 
-    def record_hit(self, func_name: str):
+    def _function_stats(self, func_name: str) -> dict:
+        # Initialize function stats if not present (prevents unbounded growth)
+        if func_name not in self.by_function:
+            self.by_function[func_name] = {
+                "hits": 0, "misses": 0, "l1_hits": 0, "coalesced": 0, "stale_hits": 0, "degraded": 0,
+                "prefetches": 0, "prefetch_hits": 0
+            }
+        return self.by_function[func_name]
+
+    def record_l1_hit(self, func_name: str, count: int = 1):
+        with self._lock:
+            self.hits += count
+            self.l1_hits += count
+            function_stats = self._function_stats(func_name)
+            function_stats["hits"] += count
+            function_stats["l1_hits"] += count
+
+    def record_l1_miss(self, count: int = 1):
+        with self._lock:
+            self.l1_misses += count
+
+    def record_hit(self, func_name: str, count: int = 1):
+        with self._lock:
+            self.hits += count
+            self.l2_hits += count
+            self._function_stats(func_name)["hits"] += count
+
+    def record_miss(self, func_name: str, count: int = 1):
+        with self._lock:
+            self.misses += count
+            self.l2_misses += count
+            self._function_stats(func_name)["misses"] += count
+
+    def record_coalesced(self, func_name: str):
+        """A miss that waited on another caller's computation instead of running its own"""
+        with self._lock:
+            self.coalesced += 1
+            self._function_stats(func_name)["coalesced"] += 1
+
+    def record_stale(self, func_name: str):
+        """A hit past its soft TTL, served while a background refresh runs"""
+        with self._lock:
+            self.stale_hits += 1
+            self._function_stats(func_name)["stale_hits"] += 1
+
+    def record_refresh(self):
+        with self._lock:
+            self.refreshes += 1
+
+    def record_degraded(self, func_name: str):
+        """A computation that returned a DegradedResult fallback"""
         with self._lock:
-            self.hits += 1
-            # Initialize function stats if not present (prevents unbounded growth)
-            if func_name not in self.by_function:
-                self.by_function[func_name] = {"hits": 0, "misses": 0}
-            self.by_function[func_name]["hits"] += 1
+            self.degraded += 1
+            self._function_stats(func_name)["degraded"] += 1
 
-    def record_miss(self, func_name: str):
+    def record_prefetch(self, func_name: str):
+        """An entry recomputed ahead of expiry by a prefetcher"""
         with self._lock:
-            self.misses += 1
-            # Initialize function stats if not present (prevents unbounded growth)
-            if func_name not in self.by_function:
-                self.by_function[func_name] = {"hits": 0, "misses": 0}
-            self.by_function[func_name]["misses"] += 1
+            self.prefetches += 1
+            self._function_stats(func_name)["prefetches"] += 1
+
+    def record_prefetch_hit(self, func_name: str):
+        """A hit served from an entry the prefetcher wrote (a miss or stale hit without it)"""
+        with self._lock:
+            self.prefetch_hits += 1
+            self._function_stats(func_name)["prefetch_hits"] += 1
 
     def record_error(self):
         with self._lock:
             self.errors += 1
 
+    @staticmethod
+    def _tier_stats(hits: int, misses: int) -> dict:
+        lookups = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate_percent": round(hits / lookups * 100, 2) if lookups > 0 else 0
+        }
+
     def get_stats(self) -> dict:
         with self._lock:
             total_requests = self.hits + self.misses
@@ -51,9 +130,18 @@ class CacheStats:
                 "hits": self.hits,
                 "misses": self.misses,
                 "errors": self.errors,
+                "coalesced": self.coalesced,
+                "stale_hits": self.stale_hits,
+                "refreshes": self.refreshes,
+                "degraded": self.degraded,
+                "prefetches": self.prefetches,
+                "prefetch_hits": self.prefetch_hits,
+                "prefetch_hit_percent": round(self.prefetch_hits / self.hits * 100, 2) if self.hits > 0 else 0,
                 "hit_rate_percent": round(hit_rate, 2),
+                "l1": self._tier_stats(self.l1_hits, self.l1_misses),
+                "l2": self._tier_stats(self.l2_hits, self.l2_misses),
                 "uptime_seconds": round(uptime, 2),
-                "by_function": dict(self.by_function)
+                "by_function": {name: dict(stats) for name, stats in self.by_function.items()}
             }
 
     def reset(self):
@@ -61,28 +149,187 @@ class CacheStats:
             self.hits = 0
             self.misses = 0
             self.errors = 0
+            self.l1_hits = 0
+            self.l1_misses = 0
+            self.l2_hits = 0
+            self.l2_misses = 0
+            self.coalesced = 0
+            self.stale_hits = 0
+            self.refreshes = 0
+            self.degraded = 0
+            self.prefetches = 0
+            self.prefetch_hits = 0
             self.start_time = datetime.now()
             self.by_function.clear()
 
 cache_stats = CacheStats()
 
-# Initialize Redis client
-try:
-    redis_client = redis.Redis.from_url(
-        settings.redis_url,
-        decode_responses=True,
-        socket_connect_timeout=5
-    )
-    # Test connection
-    redis_client.ping()
-    print("✓ Redis connected successfully")
-    logger.info("Redis connected successfully")
-except (redis.ConnectionError, redis.TimeoutError) as e:
-    print(f"⚠ Redis connection failed: {e}")  # Keep print for startup visibility
-    print("  Running without cache")
-    logger.warning(f"⚠ Redis connection failed: {e}")
-    logger.warning("  Running without cache")
-    redis_client = None
+
+class LocalCache:
+    """
+    In-process L1 cache in front of Redis: LRU with per-entry TTL, bounded by
+    an approximate memory budget.
+
+    Values are kept as the same encoded bytes stored in Redis, so callers get
+    a fresh object on every hit and entry sizes are cheap to account for.
+    """
+
+    # Rough per-entry bookkeeping cost (dict slot, tuple, str headers)
+    ENTRY_OVERHEAD_BYTES = 120
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._entries = OrderedDict()  # key -> (value, expires_at, size)
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            value, expires_at, size = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self.current_bytes -= size
+                self.expirations += 1
+                return None
+
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: bytes, ttl_seconds: float):
+        size = len(key) + len(value) + self.ENTRY_OVERHEAD_BYTES
+        if ttl_seconds <= 0 or size > self.max_bytes:
+            return
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.current_bytes -= previous[2]
+
+            self._entries[key] = (value, time.monotonic() + ttl_seconds, size)
+            self.current_bytes += size
+
+            # Evict least recently used entries until back under budget
+            while self.current_bytes > self.max_bytes:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+
+    def invalidate(self, pattern: str) -> int:
+        """Drop entries whose key matches a Redis-style glob pattern"""
+        with self._lock:
+            keys = [key for key in self._entries if fnmatch.fnmatchcase(key, pattern)]
+            for key in keys:
+                self.current_bytes -= self._entries.pop(key)[2]
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "used_bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "evictions": self.evictions,
+                "expirations": self.expirations
+            }
+
+local_cache = LocalCache(max_bytes=settings.cache_l1_max_bytes)
+
+# Initialize Redis client (sync, used by sync-decorated functions and admin helpers).
+# Responses are raw bytes since cached values may use a binary codec.
+redis_pool = redis.ConnectionPool.from_url(
+    settings.redis_url,
+    max_connections=settings.redis_max_connections,
+    socket_connect_timeout=5
+)
+redis_client = None
+if settings.cache_backend in ("redis", "auto"):
+    try:
+        redis_client = redis.Redis(connection_pool=redis_pool)
+        # Test connection
+        redis_client.ping()
+        print("✓ Redis connected successfully")
+        logger.info("Redis connected successfully")
+    except (redis.ConnectionError, redis.TimeoutError) as e:
+        print(f"⚠ Redis connection failed: {e}")  # Keep print for startup visibility
+        logger.warning(f"⚠ Redis connection failed: {e}")
+        if settings.cache_backend == "redis":
+            print("  Running without cache")
+            logger.warning("  Running without cache")
+        redis_client = None
+
+# Embedded SQLite backend: it speaks the same command subset as Redis, so it
+# stands in for both clients and the decorators need no changes
+disk_cache: Optional[DiskCache] = None
+if settings.cache_backend == "disk" or (settings.cache_backend == "auto" and redis_client is None):
+    try:
+        disk_cache = DiskCache(settings.cache_disk_path, settings.cache_disk_max_bytes)
+        redis_client = disk_cache
+        print(f"✓ Using disk cache at {settings.cache_disk_path}")
+        logger.info(f"Using disk cache at {settings.cache_disk_path}")
+    except Exception as e:
+        print(f"⚠ Disk cache unavailable: {e}")
+        print("  Running without cache")
+        logger.warning(f"⚠ Disk cache unavailable: {e}")
+        logger.warning("  Running without cache")
+
+# Async client for async-decorated functions, created lazily because its
+# pooled connections are bound to the event loop that opened them
+_async_redis_client: Optional[aioredis.Redis] = None
+_async_redis_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def get_async_redis() -> Optional[aioredis.Redis]:
+    """
+    Get the shared async cache client for the running event loop.
+
+    Returns:
+        Redis client backed by a blocking connection pool (callers wait up
+        to settings.redis_pool_timeout for a free connection), the async
+        disk cache when that backend is selected, or None if no cache
+        backend is available
+    """
+    global _async_redis_client, _async_redis_loop
+
+    if disk_cache is not None:
+        return AsyncDiskCache(disk_cache)
+
+    if redis_client is None:
+        return None
+
+    loop = asyncio.get_running_loop()
+    if _async_redis_client is None or _async_redis_loop is not loop:
+        pool = aioredis.BlockingConnectionPool.from_url(
+            settings.redis_url,
+            max_connections=settings.redis_max_connections,
+            timeout=settings.redis_pool_timeout,
+            socket_connect_timeout=5
+        )
+        _async_redis_client = aioredis.Redis.from_pool(pool)
+        _async_redis_loop = loop
+
+    return _async_redis_client
+
+
+async def close_async_redis():
+    """Close the async client and its connection pool"""
+    global _async_redis_client, _async_redis_loop
+
+    if _async_redis_client is not None:
+        await _async_redis_client.aclose()
+        _async_redis_client = None
+        _async_redis_loop = None
+        logger.info("Async Redis connection pool closed")
 
 
 def generate_cache_key(prefix: str, *args, **kwargs) -> str:
@@ -96,87 +343,522 @@ def generate_cache_key(prefix: str, *args, **kwargs) -> str:
     return f"{prefix}:{key_hash}"
 
 
-def cache_response(ttl_seconds: int = 3600, prefix: str = "cache"):
+class JsonCodec:
+    """Default value encoding: any JSON-serializable value"""
+    lossy = False
+
+    def encode(self, value: Any) -> bytes:
+        return json.dumps(value, default=str).encode()  # default=str handles non-serializable types
+
+    def decode(self, data: bytes) -> Any:
+        return json.loads(data)
+
+
+class QuantizedCodec:
+    """
+    Fixed-point encoding of a non-negative float (or None) as one uint8/uint16.
+
+    Values are stored as round(value / step), so they decode to within step/2
+    and are capped at (2**bits - 2) * step. The top integer encodes None.
+    """
+    lossy = True
+
+    def __init__(self, step: float, bits: int = 16):
+        self.step = step
+        self.format = struct.Struct("<H" if bits == 16 else "<B")
+        self.dtype = np.dtype("<u2" if bits == 16 else "u1")
+        self.none_code = (1 << bits) - 1
+        self.max_code = self.none_code - 1
+
+    def encode(self, value: Optional[float]) -> bytes:
+        if value is None:
+            return self.format.pack(self.none_code)
+        return self.format.pack(min(max(round(value / self.step), 0), self.max_code))
+
+    def decode(self, data: bytes) -> Optional[float]:
+        (code,) = self.format.unpack(data)
+        if code == self.none_code:
+            return None
+        return code * self.step
+
+    def encode_array(self, values: np.ndarray) -> bytes:
+        """Pack a float array into a blob of codes; NaN encodes like None"""
+        values = np.asarray(values, dtype=np.float64)
+        missing = np.isnan(values)
+        codes = np.clip(np.rint(np.where(missing, 0, values) / self.step), 0, self.max_code)
+        return np.where(missing, self.none_code, codes).astype(self.dtype).tobytes()
+
+    def decode_array(self, data: bytes) -> np.ndarray:
+        codes = np.frombuffer(data, dtype=self.dtype)
+        return np.where(codes == self.none_code, np.nan, codes * self.step)
+
+
+JSON_CODEC = JsonCodec()
+# Scores in [0, 1] in 2 bytes, precision ~1.5e-5
+UNIT_INTERVAL_CODEC = QuantizedCodec(step=1 / 65534, bits=16)
+# Whole percentages (0-100) in 1 byte, exact
+PERCENT_CODEC = QuantizedCodec(step=1.0, bits=8)
+
+# Stale-while-revalidate entries are prefixed with their write time (epoch seconds)
+_SWR_HEADER = struct.Struct("<I")
+
+
+class DegradedResult(Exception):
     """
-    Decorator to cache function responses in Redis.
+    Raised by a cached function to hand back a fallback (e.g. None or [] after
+    an upstream error) that must not be cached like a real result.
+
+    The caller receives value. The cache stores it only for the decorator's
+    degraded TTL, never replaces a good entry with it during a background
+    refresh, and counts it in CacheStats.
+    """
+
+    def __init__(self, value: Any = None, reason: str = "degraded result"):
+        super().__init__(reason)
+        self.value = value
+
+
+def _degraded_ttl(degraded_ttl_seconds: Optional[int]) -> int:
+    if degraded_ttl_seconds is not None:
+        return degraded_ttl_seconds
+    return settings.cache_degraded_ttl_seconds
+
+
+# Futures of computations in progress, keyed by cache key (single-flight)
+_in_flight = {}
+
+# Stale-while-revalidate: keys being refreshed and their background tasks
+_refreshing = set()
+_background_tasks = set()
+
+# Keys whose current entry was written by prefetch() (until its hard TTL), to attribute hits
+_prefetched = {}
+_PREFETCHED_MAX_KEYS = 4096
+
+LOCK_POLL_INTERVAL_SECONDS = 0.05
+
+
+# Namespace versions: every key embeds "{prefix}:v{version}", so bumping a
+# prefix's version in Redis invalidates the whole layer in O(1).
+# prefix -> (version, monotonic time it was read from Redis)
+_namespace_versions = {}
+
+# Background SCAN/UNLINK invalidations, by job ID (most recent last)
+_invalidation_jobs = OrderedDict()
+MAX_INVALIDATION_JOBS = 20
+INVALIDATION_SCAN_COUNT = 1000
+INVALIDATION_UNLINK_BATCH = 500
+
+
+def _namespace_key(prefix: str) -> str:
+    return f"ns:{prefix}"
+
+
+def _cached_namespace(prefix: str) -> Optional[int]:
+    """Namespace version read recently enough to use without asking Redis"""
+    cached = _namespace_versions.get(prefix)
+    if cached is not None and time.monotonic() - cached[1] < settings.cache_namespace_check_seconds:
+        return cached[0]
+    return None
+
+
+def _store_namespace(prefix: str, stored: Optional[bytes]) -> int:
+    version = int(stored) if stored is not None else 0
+    _namespace_versions[prefix] = (version, time.monotonic())
+    return version
+
+
+async def _namespace(prefix: str) -> str:
+    """Versioned key prefix, e.g. "light_pollution:v2" (async callers)"""
+    version = _cached_namespace(prefix)
+    if version is None:
+        client = get_async_redis()
+        try:
+            version = _store_namespace(prefix, await client.get(_namespace_key(prefix)) if client else None)
+        except Exception as e:
+            logger.error(f"Cache namespace error: {e}")
+            cache_stats.record_error()
+            version = _namespace_versions.get(prefix, (0, 0))[0]
+    return f"{prefix}:v{version}"
+
+
+def _namespace_sync(prefix: str) -> str:
+    """Versioned key prefix (sync callers)"""
+    version = _cached_namespace(prefix)
+    if version is None:
+        try:
+            version = _store_namespace(prefix, redis_client.get(_namespace_key(prefix)) if redis_client else None)
+        except Exception as e:
+            logger.error(f"Cache namespace error: {e}")
+            cache_stats.record_error()
+            version = _namespace_versions.get(prefix, (0, 0))[0]
+    return f"{prefix}:v{version}"
+
+
+def _key_function(name: str, key_builder: Optional[Callable[..., str]]) -> Callable[..., str]:
+    """Cache key for a call in a namespace: key_builder's suffix if given, else a hash of the arguments"""
+    if key_builder is None:
+        return lambda namespace, *args, **kwargs: generate_cache_key(f"{namespace}:{name}", *args, **kwargs)
+    return lambda namespace, *args, **kwargs: f"{namespace}:{name}:{key_builder(*args, **kwargs)}"
+
+
+def _l1_ttl(ttl_seconds: int, l1_ttl_seconds: Optional[int]) -> int:
+    """TTL for L1 copies: explicit override, else the Redis TTL capped by settings"""
+    if l1_ttl_seconds is not None:
+        return min(l1_ttl_seconds, ttl_seconds)
+    return min(ttl_seconds, settings.cache_l1_max_ttl_seconds)
+
+
+async def _wait_for_value(client, cache_key: str, timeout_seconds: float) -> Optional[bytes]:
+    """Poll Redis for a value another worker is computing under a lock"""
+    deadline = time.monotonic() + timeout_seconds
+    while time.monotonic() < deadline:
+        await asyncio.sleep(LOCK_POLL_INTERVAL_SECONDS)
+        cached = await client.get(cache_key)
+        if cached is not None:
+            return cached
+    return None
+
+
+def _mark_prefetched(cache_key: str, ttl_seconds: int):
+    now = time.time()
+    if len(_prefetched) >= _PREFETCHED_MAX_KEYS:
+        for key in [key for key, expires in _prefetched.items() if expires <= now]:
+            del _prefetched[key]
+    _prefetched[cache_key] = now + ttl_seconds
+
+
+def _record_hit_source(cache_key: str, func_name: str):
+    expires = _prefetched.get(cache_key)
+    if expires is not None and expires > time.time():
+        cache_stats.record_prefetch_hit(func_name)
+
+
+def cache_response(
+    ttl_seconds: int = 3600,
+    prefix: str = "cache",
+    l1_ttl_seconds: Optional[int] = None,
+    lock_timeout_seconds: Optional[float] = None,
+    soft_ttl_seconds: Optional[int] = None,
+    key_builder: Optional[Callable[..., str]] = None,
+    codec: Any = JSON_CODEC,
+    degraded_ttl_seconds: Optional[int] = None
+):
+    """
+    Decorator to cache function responses in an in-process L1 and Redis.
+
+    Concurrent misses on the same key within a process (async functions only)
+    share one in-flight computation.
 
     Args:
-        ttl_seconds: Time to live in seconds (default 1 hour)
+        ttl_seconds: Time to live in seconds (default 1 hour). With
+            soft_ttl_seconds this is the hard TTL: older entries are gone
+            and callers block on a fresh computation.
         prefix: Cache key prefix for organization
+        l1_ttl_seconds: How long the in-process copy may be served before
+            going back to Redis. Defaults to ttl_seconds capped by
+            settings.cache_l1_max_ttl_seconds; set lower for data that changes.
+        lock_timeout_seconds: If set, a miss also takes a short Redis lock so
+            other workers wait up to this long for the value instead of
+            calling the upstream API themselves. Use the upstream timeout.
+        soft_ttl_seconds: Enables stale-while-revalidate (async functions
+            only). Entries older than this are still returned immediately,
+            and one background refresh per key is scheduled.
+        key_builder: Builds the key suffix from the call's arguments, e.g. a
+            global grid cell ID, instead of hashing the arguments
+        codec: Value encoding (JSON_CODEC, or a compact QuantizedCodec for
+            scalar scores). With a lossy codec the caller always gets the
+            decoded value, so hits and misses return identical results.
+        degraded_ttl_seconds: How long a DegradedResult fallback is cached,
+            so an outage costs one upstream call per key per TTL (default
+            settings.cache_degraded_ttl_seconds; 0 = never cached)
+
+    Async functions also get ``entry_age(*args)`` (seconds since the entry
+    was stored, None if absent; needs soft_ttl_seconds) and
+    ``prefetch(*args)``, which recomputes and stores an entry ahead of
+    expiry. Hits on prefetched entries are counted as prefetch_hits.
     """
+    l1_ttl = _l1_ttl(ttl_seconds, l1_ttl_seconds)
+    degraded_ttl = _degraded_ttl(degraded_ttl_seconds)
+
+    def encode(result: Any) -> bytes:
+        payload = codec.encode(result)
+        if soft_ttl_seconds is None:
+            return payload
+        return _SWR_HEADER.pack(int(time.time())) + payload
+
+    def decode(cached: bytes) -> Tuple[Any, bool]:
+        """Returns the cached value and whether it is past the soft TTL"""
+        if soft_ttl_seconds is None:
+            return codec.decode(cached), False
+        (stored_at,) = _SWR_HEADER.unpack_from(cached)
+        return codec.decode(cached[_SWR_HEADER.size:]), time.time() - stored_at > soft_ttl_seconds
+
+    def serialize(result: Any) -> Tuple[Any, bytes]:
+        """Encode a fresh result; lossy codecs hand back the decoded value"""
+        serialized = encode(result)
+        if codec.lossy:
+            result = decode(serialized)[0]
+        return result, serialized
+
     def decorator(func: Callable) -> Callable:
-        @wraps(func)
-        async def async_wrapper(*args, **kwargs) -> Any:
-            # If Redis is not available, just call the function
-            if redis_client is None:
-                return await func(*args, **kwargs)
+        make_key = _key_function(func.__name__, key_builder)
 
-            # Generate cache key
-            cache_key = generate_cache_key(f"{prefix}:{func.__name__}", *args, **kwargs)
+        def degraded(error: DegradedResult) -> Tuple[Any, bytes, int]:
+            cache_stats.record_degraded(func.__name__)
+            logger.warning(f"Degraded result from {func.__name__}: {error}")
+            return (*serialize(error.value), degraded_ttl)
+
+        async def compute(args: tuple, kwargs: dict) -> Tuple[Any, bytes, int]:
+            """Call func; returns the result, its serialized form and the TTL to store it for"""
+            try:
+                return (*serialize(await func(*args, **kwargs)), ttl_seconds)
+            except DegradedResult as error:
+                return degraded(error)
+
+        def compute_sync(args: tuple, kwargs: dict) -> Tuple[Any, bytes, int]:
+            try:
+                return (*serialize(func(*args, **kwargs)), ttl_seconds)
+            except DegradedResult as error:
+                return degraded(error)
+
+        def store_local(cache_key: str, serialized: bytes, ttl: int):
+            _prefetched.pop(cache_key, None)
+            if ttl > 0:
+                local_cache.set(cache_key, serialized, min(l1_ttl, ttl))
+
+        async def refresh(cache_key: str, args: tuple, kwargs: dict):
+            """Recompute a stale entry in the background"""
+            client = get_async_redis()
+            lock_key = lock_token = None
+            try:
+                if client is not None and lock_timeout_seconds:
+                    # Another worker may already be refreshing this key
+                    lock_key, lock_token = f"lock:{cache_key}", uuid.uuid4().hex
+                    if not await client.set(lock_key, lock_token, nx=True, px=int(lock_timeout_seconds * 1000)):
+                        return
+
+                try:
+                    _, serialized = serialize(await func(*args, **kwargs))
+                except DegradedResult as error:
+                    # Keep serving the stale entry; it is better than the fallback
+                    degraded(error)
+                else:
+                    if client is not None:
+                        await client.setex(cache_key, ttl_seconds, serialized)
+                    local_cache.set(cache_key, serialized, l1_ttl)
+                    _prefetched.pop(cache_key, None)
+                    cache_stats.record_refresh()
+                    logger.debug(f"↻ Refreshed stale entry: {cache_key}")
+
+                if lock_key and await client.get(lock_key) == lock_token.encode():
+                    await client.delete(lock_key)
+
+            except Exception as e:
+                logger.error(f"Background refresh failed for {cache_key}: {e}")
+                cache_stats.record_error()
+            finally:
+                _refreshing.discard(cache_key)
+
+        def serve_stale(cache_key: str, args: tuple, kwargs: dict):
+            """Record a stale hit and schedule at most one refresh per key"""
+            cache_stats.record_stale(func.__name__)
+            if cache_key in _refreshing:
+                return
+
+            _refreshing.add(cache_key)
+            task = asyncio.get_running_loop().create_task(refresh(cache_key, args, kwargs))
+            # Keep a reference so the task isn't garbage collected mid-flight
+            _background_tasks.add(task)
+            task.add_done_callback(_background_tasks.discard)
+
+        async def load(cache_key: str, args: tuple, kwargs: dict) -> Tuple[Any, str]:
+            """L2 lookup then compute; returns the result and its serialized form"""
+            # If Redis is not available, just call the function
+            client = get_async_redis()
+            if client is None:
+                result, serialized, ttl = await compute(args, kwargs)
+                store_local(cache_key, serialized, ttl)
+                return result, serialized
 
             try:
                 # Try to get from cache
-                cached = redis_client.get(cache_key)
-                if cached:
+                cached = await client.get(cache_key)
+                if cached is not None:
                     logger.debug(f"✓ Cache hit: {cache_key}")
                     cache_stats.record_hit(func.__name__)
-                    return json.loads(cached)
+                    _record_hit_source(cache_key, func.__name__)
+                    local_cache.set(cache_key, cached, l1_ttl)
+                    value, stale = decode(cached)
+                    if stale:
+                        serve_stale(cache_key, args, kwargs)
+                    return value, cached
 
                 # Cache miss - call function
                 logger.debug(f"✗ Cache miss: {cache_key}")
                 cache_stats.record_miss(func.__name__)
-                result = await func(*args, **kwargs)
 
-                # Store in cache
-                redis_client.setex(
-                    cache_key,
-                    ttl_seconds,
-                    json.dumps(result, default=str)  # default=str handles non-serializable types
-                )
+                lock_key = lock_token = None
+                if lock_timeout_seconds:
+                    lock_key, lock_token = f"lock:{cache_key}", uuid.uuid4().hex
+                    acquired = await client.set(lock_key, lock_token, nx=True, px=int(lock_timeout_seconds * 1000))
+                    if not acquired:
+                        # Another worker is computing this key; wait for its result
+                        cached = await _wait_for_value(client, cache_key, lock_timeout_seconds)
+                        if cached is not None:
+                            cache_stats.record_coalesced(func.__name__)
+                            local_cache.set(cache_key, cached, l1_ttl)
+                            return decode(cached)[0], cached
+                        lock_key = None  # Lock holder gave up or failed; compute ourselves
 
-                return result
+                try:
+                    result, serialized, ttl = await compute(args, kwargs)
+
+                    # Store in cache (degraded fallbacks only briefly, if at all)
+                    if ttl > 0:
+                        await client.setex(cache_key, ttl, serialized)
+                    store_local(cache_key, serialized, ttl)
+                finally:
+                    if lock_key and await client.get(lock_key) == lock_token.encode():
+                        await client.delete(lock_key)
+
+                return result, serialized
 
             except Exception as e:
                 logger.error(f"Cache error: {e}")
                 cache_stats.record_error()
                 # If cache fails, still return the result
-                return await func(*args, **kwargs)
+                return (await compute(args, kwargs))[:2]
+
+        @wraps(func)
+        async def async_wrapper(*args, **kwargs) -> Any:
+            # Generate cache key
+            cache_key = make_key(await _namespace(prefix), *args, **kwargs)
+
+            # In-process L1 first, no network involved
+            cached = local_cache.get(cache_key)
+            if cached is not None:
+                cache_stats.record_l1_hit(func.__name__)
+                _record_hit_source(cache_key, func.__name__)
+                value, stale = decode(cached)
+                if stale:
+                    serve_stale(cache_key, args, kwargs)
+                return value
+            cache_stats.record_l1_miss()
+
+            # Single-flight: join a computation already running for this key
+            in_flight = _in_flight.get(cache_key)
+            if in_flight is not None:
+                cache_stats.record_coalesced(func.__name__)
+                return decode(await asyncio.shield(in_flight))[0]
+
+            in_flight = asyncio.get_running_loop().create_future()
+            # Mark the outcome as retrieved even if nobody joined
+            in_flight.add_done_callback(lambda f: f.cancelled() or f.exception())
+            _in_flight[cache_key] = in_flight
+            try:
+                result, serialized = await load(cache_key, args, kwargs)
+                in_flight.set_result(serialized)
+                return result
+            except asyncio.CancelledError:
+                in_flight.cancel()
+                raise
+            except Exception as e:
+                in_flight.set_exception(e)
+                raise
+            finally:
+                _in_flight.pop(cache_key, None)
+
+        async def entry_age(*args, **kwargs) -> Optional[float]:
+            """Seconds since the entry was stored, or None if it is not cached"""
+            if soft_ttl_seconds is None:
+                raise TypeError(f"{func.__name__} has no soft TTL; entry ages are not recorded")
+
+            cache_key = make_key(await _namespace(prefix), *args, **kwargs)
+            cached = local_cache.get(cache_key)
+            client = get_async_redis()
+            if cached is None and client is not None:
+                try:
+                    cached = await client.get(cache_key)
+                except Exception as e:
+                    logger.error(f"Cache error: {e}")
+                    cache_stats.record_error()
+            if cached is None:
+                return None
+            (stored_at,) = _SWR_HEADER.unpack_from(cached)
+            return time.time() - stored_at
+
+        async def prefetch(*args, **kwargs) -> bool:
+            """Recompute and store an entry ahead of expiry; a DegradedResult leaves the entry as it was"""
+            cache_key = make_key(await _namespace(prefix), *args, **kwargs)
+            try:
+                _, serialized = serialize(await func(*args, **kwargs))
+            except DegradedResult as error:
+                degraded(error)
+                return False
+
+            client = get_async_redis()
+            if client is not None:
+                try:
+                    await client.setex(cache_key, ttl_seconds, serialized)
+                except Exception as e:
+                    logger.error(f"Cache error: {e}")
+                    cache_stats.record_error()
+            local_cache.set(cache_key, serialized, l1_ttl)
+            _mark_prefetched(cache_key, ttl_seconds)
+            cache_stats.record_prefetch(func.__name__)
+            return True
+
+        async_wrapper.entry_age = entry_age
+        async_wrapper.prefetch = prefetch
 
         @wraps(func)
         def sync_wrapper(*args, **kwargs) -> Any:
+            # Generate cache key
+            cache_key = make_key(_namespace_sync(prefix), *args, **kwargs)
+
+            # In-process L1 first, no network involved (stale entries are recomputed inline)
+            cached = local_cache.get(cache_key)
+            if cached is not None:
+                value, stale = decode(cached)
+                if not stale:
+                    cache_stats.record_l1_hit(func.__name__)
+                    return value
+            cache_stats.record_l1_miss()
+
             # If Redis is not available, just call the function
             if redis_client is None:
-                return func(*args, **kwargs)
-
-            # Generate cache key
-            cache_key = generate_cache_key(f"{prefix}:{func.__name__}", *args, **kwargs)
+                result, serialized, ttl = compute_sync(args, kwargs)
+                store_local(cache_key, serialized, ttl)
+                return result
 
             try:
                 # Try to get from cache
                 cached = redis_client.get(cache_key)
-                if cached:
-                    logger.debug(f"✓ Cache hit: {cache_key}")
-                    cache_stats.record_hit(func.__name__)
-                    return json.loads(cached)
+                if cached is not None:
+                    value, stale = decode(cached)
+                    if not stale:
+                        logger.debug(f"✓ Cache hit: {cache_key}")
+                        cache_stats.record_hit(func.__name__)
+                        local_cache.set(cache_key, cached, l1_ttl)
+                        return value
 
                 # Cache miss - call function
                 logger.debug(f"✗ Cache miss: {cache_key}")
                 cache_stats.record_miss(func.__name__)
-                result = func(*args, **kwargs)
+                result, serialized, ttl = compute_sync(args, kwargs)
 
-                # Store in cache
-                redis_client.setex(
-                    cache_key,
-                    ttl_seconds,
-                    json.dumps(result, default=str)
-                )
+                # Store in cache (degraded fallbacks only briefly, if at all)
+                if ttl > 0:
+                    redis_client.setex(cache_key, ttl, serialized)
+                store_local(cache_key, serialized, ttl)
 
                 return result
 
             except Exception as e:
                 logger.error(f"Cache error: {e}")
                 cache_stats.record_error()
-                return func(*args, **kwargs)
+                return compute_sync(args, kwargs)[0]
 
         # Return appropriate wrapper based on whether function is async
         import inspect
@@ -188,29 +870,323 @@ def cache_response(ttl_seconds: int = 3600, prefix: str = "cache"):
     return decorator
 
 
+def cache_tiles(
+    ttl_seconds: int,
+    prefix: str,
+    cell_degrees: float,
+    tile_degrees: Optional[float] = None,
+    l1_ttl_seconds: Optional[int] = None,
+    codec: QuantizedCodec = UNIT_INTERVAL_CODEC
+):
+    """
+    Decorator to cache a gridded score field as fixed geographic tiles, one
+    binary blob per tile, in an in-process L1 and Redis.
+
+    The decorated async function computes a whole tile: it takes flat arrays
+    of the tile's cell-centre latitudes and longitudes (row-major) and
+    returns an array of scores. The wrapper takes a list (or (N, 2) array)
+    of (lat, lon) points and returns a float array aligned with it. It snaps each to the global cell lattice (the one global_cell_id
+    uses), fetches the tiles they fall in (L1 first, then one MGET),
+    computes missing tiles once each, and slices the requested cells out
+    with NumPy. A search costs O(tiles) cache round trips and keys instead
+    of O(points). Stats count tiles, not points.
+
+    Args:
+        ttl_seconds: Time to live in seconds
+        prefix: Cache key prefix for organization
+        cell_degrees: Spacing of the cell lattice scores are sampled on
+        tile_degrees: Tile edge (default settings.cache_tile_degrees); a tile
+            holds (tile_degrees / cell_degrees)² cells
+        l1_ttl_seconds: See cache_response
+        codec: QuantizedCodec the tile array is packed with (NaN is stored
+            as the codec's None code and comes back as NaN)
+    """
+    cells_per_tile = max(1, round((tile_degrees or settings.cache_tile_degrees) / cell_degrees))
+    l1_ttl = _l1_ttl(ttl_seconds, l1_ttl_seconds)
+
+    def decorator(func: Callable) -> Callable:
+        name = func.__name__
+
+        def tile_key(namespace: str, tile_row: int, tile_col: int) -> str:
+            return f"{namespace}:{name}:tile{cells_per_tile}:{tile_row}:{tile_col}"
+
+        async def compute_tile(cache_key: str, tile_row: int, tile_col: int) -> bytes:
+            """Compute one tile, sharing the work with concurrent requests for it"""
+            in_flight = _in_flight.get(cache_key)
+            if in_flight is not None:
+                cache_stats.record_coalesced(name)
+                return await asyncio.shield(in_flight)
+
+            in_flight = asyncio.get_running_loop().create_future()
+            # Mark the outcome as retrieved even if nobody joined
+            in_flight.add_done_callback(lambda f: f.cancelled() or f.exception())
+            _in_flight[cache_key] = in_flight
+            try:
+                rows = np.arange(tile_row * cells_per_tile, (tile_row + 1) * cells_per_tile)
+                cols = np.arange(tile_col * cells_per_tile, (tile_col + 1) * cells_per_tile)
+                lats, lons = np.meshgrid(np.round(rows * cell_degrees, 6), np.round(cols * cell_degrees, 6), indexing="ij")
+
+                blob = codec.encode_array(await func(lats.ravel(), lons.ravel()))
+                local_cache.set(cache_key, blob, l1_ttl)
+                in_flight.set_result(blob)
+                return blob
+            except asyncio.CancelledError:
+                in_flight.cancel()
+                raise
+            except Exception as e:
+                in_flight.set_exception(e)
+                raise
+            finally:
+                _in_flight.pop(cache_key, None)
+
+        @wraps(func)
+        async def async_wrapper(points: List[Tuple[float, float]]) -> np.ndarray:
+            if len(points) == 0:
+                return np.empty(0)
+
+            coords = np.asarray(points, dtype=np.float64)
+            rows = np.rint(coords[:, 0] / cell_degrees).astype(np.int64)
+            cols = np.rint(coords[:, 1] / cell_degrees).astype(np.int64)
+
+            tiles, tile_of_point = np.unique(
+                np.stack([rows // cells_per_tile, cols // cells_per_tile], axis=1),
+                axis=0, return_inverse=True
+            )
+            tile_of_point = tile_of_point.reshape(-1)
+            namespace = await _namespace(prefix)
+            cache_keys = [tile_key(namespace, int(r), int(c)) for r, c in tiles]
+
+            # In-process L1 first
+            blobs = [local_cache.get(cache_key) for cache_key in cache_keys]
+            miss_indices = [i for i, blob in enumerate(blobs) if blob is None]
+            if len(miss_indices) < len(tiles):
+                cache_stats.record_l1_hit(name, len(tiles) - len(miss_indices))
+            if miss_indices:
+                cache_stats.record_l1_miss(len(miss_indices))
+
+            client = get_async_redis()
+            if client is not None and miss_indices:
+                try:
+                    cached_values = await client.mget([cache_keys[i] for i in miss_indices])
+                    remaining = []
+                    for i, cached in zip(miss_indices, cached_values):
+                        if cached is not None:
+                            blobs[i] = cached
+                            local_cache.set(cache_keys[i], cached, l1_ttl)
+                        else:
+                            remaining.append(i)
+
+                    cache_stats.record_hit(name, len(miss_indices) - len(remaining))
+                    cache_stats.record_miss(name, len(remaining))
+                    miss_indices = remaining
+
+                except Exception as e:
+                    logger.error(f"Cache error: {e}")
+                    cache_stats.record_error()
+
+            if miss_indices:
+                logger.debug(f"Tile cache {name}: computing {len(miss_indices)}/{len(tiles)} tiles")
+                computed = await asyncio.gather(*[
+                    compute_tile(cache_keys[i], int(tiles[i, 0]), int(tiles[i, 1])) for i in miss_indices
+                ])
+                for i, blob in zip(miss_indices, computed):
+                    blobs[i] = blob
+
+                if client is not None:
+                    try:
+                        async with client.pipeline(transaction=False) as pipe:
+                            for i in miss_indices:
+                                pipe.setex(cache_keys[i], ttl_seconds, blobs[i])
+                            await pipe.execute()
+                    except Exception as e:
+                        logger.error(f"Cache error: {e}")
+                        cache_stats.record_error()
+
+            # Slice each point's cell out of its tile
+            results = np.empty(len(points))
+            for i, blob in enumerate(blobs):
+                tile = codec.decode_array(blob).reshape(cells_per_tile, cells_per_tile)
+                members = np.flatnonzero(tile_of_point == i)
+                results[members] = tile[
+                    rows[members] - tiles[i, 0] * cells_per_tile,
+                    cols[members] - tiles[i, 1] * cells_per_tile
+                ]
+
+            return results
+
+        return async_wrapper
+
+    return decorator
+
+
+def check_invalidation_pattern(pattern: str):
+    """
+    Refuse patterns that could match namespace version keys (ns:*), which
+    would reset every layer to v0, or that have no literal key prefix
+    (e.g. "*"), which would drop the year-long raster tiles too.
+
+    Raises:
+        ValueError: if the pattern is not allowed
+    """
+    head = pattern
+    for i, char in enumerate(pattern):
+        if char in "*?[\\":
+            head = pattern[:i]
+            break
+    if not head or head.startswith("ns:") or "ns:".startswith(head):
+        raise ValueError(f"Refusing to invalidate '{pattern}': patterns need a literal key prefix other than 'ns:'")
+
+
 def invalidate_cache(pattern: str) -> int:
     """
     Invalidate all cache keys matching a pattern.
 
+    Walks the keyspace with incremental SCAN and removes matches with
+    batched UNLINK, so Redis is never blocked by one huge KEYS or DELETE.
+    This call itself blocks until done; async code should prefer
+    start_invalidation, and whole layers are cheaper to drop with
+    bump_namespace.
+
     Args:
         pattern: Redis key pattern (e.g., "light_pollution:*")
 
     Returns:
         Number of keys deleted
+
+    Raises:
+        ValueError: if the pattern is refused (see check_invalidation_pattern)
     """
+    check_invalidation_pattern(pattern)
+    # Only this process's L1 can be cleared here; other workers' copies expire via their L1 TTL
+    local_cache.invalidate(pattern)
+
     if redis_client is None:
         return 0
 
+    deleted = 0
     try:
-        keys = redis_client.keys(pattern)
-        if keys:
-            deleted = redis_client.delete(*keys)
-            logger.info(f"Invalidated {deleted} cache keys matching '{pattern}'")
-            return deleted
-        return 0
+        batch = []
+        for key in redis_client.scan_iter(match=pattern, count=INVALIDATION_SCAN_COUNT):
+            batch.append(key)
+            if len(batch) >= INVALIDATION_UNLINK_BATCH:
+                deleted += redis_client.unlink(*batch)
+                batch = []
+        if batch:
+            deleted += redis_client.unlink(*batch)
+
+        logger.info(f"Invalidated {deleted} cache keys matching '{pattern}'")
+        return deleted
     except Exception as e:
         logger.error(f"Cache invalidation error: {e}")
-        return 0
+        return deleted
+
+
+async def _run_invalidation(job: dict):
+    """SCAN/UNLINK loop behind start_invalidation, updating the job's progress"""
+    client = get_async_redis()
+    job["status"] = "running"
+    try:
+        if client is None:
+            raise ConnectionError("Redis is not available")
+
+        batch = []
+        async for key in client.scan_iter(match=job["pattern"], count=INVALIDATION_SCAN_COUNT):
+            job["scanned"] += 1
+            batch.append(key)
+            if len(batch) >= INVALIDATION_UNLINK_BATCH:
+                job["deleted"] += await client.unlink(*batch)
+                batch = []
+        if batch:
+            job["deleted"] += await client.unlink(*batch)
+
+        job["status"] = "done"
+        logger.info(f"Invalidated {job['deleted']} cache keys matching '{job['pattern']}'")
+    except Exception as e:
+        job["status"] = "failed"
+        job["error"] = str(e)
+        logger.error(f"Cache invalidation error: {e}")
+    finally:
+        job["finished_at"] = datetime.now().isoformat()
+
+
+def start_invalidation(pattern: str) -> dict:
+    """
+    Invalidate keys matching a pattern in a background task.
+
+    Returns:
+        The job's progress record (see get_invalidation_job); "scanned" and
+        "deleted" grow as the task works through the keyspace
+
+    Raises:
+        ValueError: if the pattern is refused (see check_invalidation_pattern)
+    """
+    check_invalidation_pattern(pattern)
+    local_cache.invalidate(pattern)
+
+    job = {
+        "id": uuid.uuid4().hex,
+        "pattern": pattern,
+        "status": "pending",
+        "scanned": 0,
+        "deleted": 0,
+        "started_at": datetime.now().isoformat(),
+        "finished_at": None,
+        "error": None
+    }
+    _invalidation_jobs[job["id"]] = job
+    while len(_invalidation_jobs) > MAX_INVALIDATION_JOBS:
+        _invalidation_jobs.popitem(last=False)
+
+    task = asyncio.get_running_loop().create_task(_run_invalidation(job))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return dict(job)
+
+
+def get_invalidation_job(job_id: str) -> Optional[dict]:
+    job = _invalidation_jobs.get(job_id)
+    return dict(job) if job is not None else None
+
+
+async def bump_namespace(prefix: str, purge: bool = True) -> dict:
+    """
+    Invalidate every entry under a prefix in O(1) by bumping its namespace version.
+
+    Other workers pick up the new version within
+    settings.cache_namespace_check_seconds. With purge, the orphaned keys
+    of the old version are removed by a background SCAN/UNLINK job instead
+    of lingering until their TTL (a year for raster layers).
+
+    Returns:
+        The old and new versions, and the purge job if one was started
+    """
+    check_invalidation_pattern(f"{prefix}:")
+    client = get_async_redis()
+    if client is None:
+        raise ConnectionError("Redis is not available")
+
+    version = await client.incr(_namespace_key(prefix))
+    _namespace_versions[prefix] = (version, time.monotonic())
+    local_cache.invalidate(f"{prefix}:v{version - 1}:*")
+    logger.info(f"Bumped cache namespace '{prefix}' to v{version}")
+
+    result = {"prefix": prefix, "old_version": version - 1, "version": version, "purge_job": None}
+    if purge:
+        result["purge_job"] = start_invalidation(f"{prefix}:v{version - 1}:*")
+    return result
+
+
+def _pool_usage(pool) -> dict:
+    """Connection counts and saturation for a redis-py connection pool"""
+    in_use = len(pool._in_use_connections)
+    available = len(pool._available_connections)
+
+    return {
+        "max_connections": pool.max_connections,
+        "in_use": in_use,
+        "idle": available,
+        "saturation_percent": round(in_use / pool.max_connections * 100, 2)
+    }
 
 
 def get_cache_stats() -> dict:
@@ -218,9 +1194,18 @@ def get_cache_stats() -> dict:
     Get Redis cache statistics and aggregate hit/miss metrics.
     """
     stats = {
-        "cache_performance": cache_stats.get_stats()
+        "cache_performance": cache_stats.get_stats(),
+        "l1_cache": local_cache.get_stats(),
+        "namespaces": {prefix: version for prefix, (version, _) in _namespace_versions.items()},
+        "invalidation_jobs": [dict(job) for job in _invalidation_jobs.values()]
     }
 
+    if disk_cache is not None:
+        stats["backend"] = "disk"
+        stats["disk"] = disk_cache.get_stats()
+        return stats
+
+    stats["backend"] = "redis"
     if redis_client is None:
         stats["redis"] = {"status": "disconnected"}
         return stats
@@ -232,6 +1217,10 @@ def get_cache_stats() -> dict:
             "used_memory": info.get("used_memory_human"),
             "connected_clients": info.get("connected_clients"),
             "total_keys": redis_client.dbsize(),
+            "pools": {
+                "sync": _pool_usage(redis_pool),
+                "async": _pool_usage(_async_redis_client.connection_pool) if _async_redis_client else None
+            }
         }
     except Exception as e:
         stats["redis"] = {"status": "error", "message": str(e)}
@@ -1,20 +1,69 @@
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import List, Optional
 from pathlib import Path
 
 _project_root = Path(__file__).parent.parent
 _default_data_path = _project_root / "data" / "light_pollution" / "viirs_2024.tif"
 _tree_data_path = _project_root / "data" / "tree_density" / "TreeMap2022_CONUS_ALSTK.tif"
+_road_graph_path = _project_root / "data" / "road_graph" / "road_graph.npz"
 
 class Settings(BaseSettings):
     google_places_api_key: str = "dummy_key_for_testing"
     openroute_api_key: Optional[str] = None
+    isochrone_provider: str = "openroute"  # "openroute" or "local" (road graph below, no external calls)
+    road_graph_path: str = str(_road_graph_path)  # CSR road graph (.npz); also the fallback when ORS fails
+    road_graph_concave_ratio: float = 0.3  # shapely concave_hull ratio for local isochrones (1 = convex)
+    isochrone_ladder_minutes: List[int] = [10, 20, 30, 45, 60]  # Drive-time steps served from OpenRouteService (max 10)
+    isochrone_max_range_minutes: int = 60  # ORS driving-car limit (3600 s); longer drive times are clamped to it
+    isochrone_origin_snap_degrees: float = 0.01  # Isochrone origins snap to this lattice (~1 km) to share entries
+    isochrone_max_vertices: int = 400  # Cached isochrone rings are simplified to at most this many vertices
     redis_url: str = "redis://localhost:6379"
+    cache_backend: str = "redis"  # "redis", "disk" (SQLite file), or "auto" (Redis, else disk)
+    cache_disk_path: str = str(_project_root / "data" / "cache" / "cache.sqlite3")
+    cache_disk_max_bytes: int = 1024 * 1024 * 1024  # Payload budget before LRU eviction
+    redis_max_connections: int = 50  # Per pool (one sync, one async)
+    redis_pool_timeout: float = 2.0  # Seconds to wait for a free async pool connection
+    cache_l1_max_bytes: int = 64 * 1024 * 1024  # In-process LRU in front of Redis (0 disables)
+    cache_l1_max_ttl_seconds: int = 3600  # L1 copies are refreshed from Redis at least this often
+    cache_degraded_ttl_seconds: int = 60  # Negative-cache TTL for DegradedResult fallbacks (0 = never store)
+    cache_tile_degrees: float = 1.0  # Edge of the square tiles raster scores are cached in
+    cache_admin_token: Optional[str] = None  # X-Admin-Token for the cache invalidation endpoints (unset = endpoints disabled)
+    cache_namespace_check_seconds: int = 30  # How often workers re-read namespace versions from Redis
     light_pollution_data_path: str = str(_default_data_path)
     openweather_api_key: Optional[str] = None
+    cloud_field_source: Optional[str] = None  # Gridded cloud-cover raster (path/URL, EPSG:4326); replaces per-point API calls
+    cloud_field_band: int = 1  # Band holding total cloud cover
+    cloud_field_scale: float = 1.0  # Multiplier to percent (e.g. 100 for 0-1 fractions)
+    cloud_field_bounds: Optional[List[float]] = None  # [west, south, east, north] to keep in memory (None = whole file)
+    cloud_field_refresh_seconds: int = 1800  # Background re-ingestion interval
+    cloud_field_max_age_seconds: int = 6 * 3600  # Older fields are ignored and lookups fall back to the API
+    cloud_sample_lattice_degrees: float = 0.25  # Cloud samples sit on this global lattice (doubled to fit the budget)
+    cloud_sample_strategy: str = "adaptive"  # /api/spots: "single", "sparse", "moderate", "adaptive" or "all"
+    cloud_adaptive_initial_nodes_per_axis: int = 2  # Adaptive sampling starts with at least this many lattice steps across the area
+    cloud_adaptive_max_samples: int = 25  # Per-request cloud API budget for adaptive sampling
+    cloud_adaptive_spread_percent: float = 20.0  # Neighbouring samples differing by more than this get refined
+    cloud_prefetch_hourly_budget: int = 0  # OpenWeather calls/hour spent keeping popular cells fresh, shared by all workers via Redis (0 disables)
+    cloud_prefetch_min_headroom_percent: float = 50.0  # Prefetching pauses while the OpenWeather rate limit has less than this left for users
+    cloud_prefetch_interval_seconds: int = 60  # How often the prefetcher looks for popular cells about to go stale
+    cloud_prefetch_lead_seconds: int = 300  # Refresh this long before an entry's soft TTL
+    cloud_prefetch_half_life_seconds: int = 6 * 3600  # Request popularity halves over this period
+    cloud_prefetch_min_score: float = 2.0  # Cells below this decayed request count are not prefetched
+    cloud_prefetch_max_keys: int = 5000  # Cells tracked for popularity (least popular dropped beyond this)
+    cloud_interpolation: str = "idw"  # "idw" (inverse distance weighting) or "nearest" sample
+    cloud_idw_power: float = 2.0  # IDW weight = distance ** -power
+    cloud_idw_radius_miles: float = 50.0  # Samples further away are ignored (nearest one used if none in range)
     astronomy_id: Optional[str] = None
     astronomy_secret: Optional[str] = None
     tree_density_data_path: str = str(_tree_data_path)
+    raster_io_workers: int = 4  # Threads for blocking raster reads (one dataset handle each)
+    search_grid_mode: str = "equal_area"  # "equal_area" (longitude spacing widened by latitude) or "square"
+    search_point_budget: int = 6000  # Larger search grids are refined coarse-to-fine (0 = always full grid)
+    outbound_failure_threshold: int = 5  # Consecutive provider failures before its circuit opens
+    outbound_recovery_seconds: float = 30.0  # How long an open circuit fails fast before probing again
+    outbound_max_wait_seconds: float = 2.0  # Longest a call queues for a rate-limit token before failing
+    outbound_connect_timeout_seconds: float = 5.0  # Connect timeout of the pooled provider clients
+    outbound_keepalive_seconds: float = 30.0  # Idle pooled connections are closed after this long
+    outbound_http2: bool = True  # Use HTTP/2 where the provider supports it (needs the h2 package)
     log_level: str = "INFO"  # Can be: DEBUG, INFO, WARNING, ERROR, CRITICAL
     model_config = {
         "env_file": ".env"
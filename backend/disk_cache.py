@@ -0,0 +1,283 @@
+"""
+Embedded on-disk cache backend (SQLite) for deployments without Redis
+"""
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Iterator, List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+
+def _to_bytes(value: Union[bytes, str, int, float]) -> bytes:
+    if isinstance(value, bytes):
+        return value
+    return str(value).encode()
+
+
+class DiskCache:
+    """
+    Size-bounded key-value cache in a single SQLite file, with per-entry TTL.
+
+    Implements the subset of Redis commands the cache layer uses (get, mget,
+    setex, set nx/px, delete/unlink, incr, expire, scan_iter), so it can stand in for
+    the sync Redis client. Entries survive restarts. When the file's payload
+    exceeds max_bytes, expired entries go first, then least recently used ones.
+    """
+
+    # Rows fetched at a time while choosing eviction victims
+    EVICTION_BATCH = 256
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        self.expirations = 0
+        self._lock = threading.Lock()
+
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " key TEXT PRIMARY KEY,"
+            " value BLOB NOT NULL,"
+            " expires_at REAL,"  # Epoch seconds, NULL = no expiry
+            " accessed_at REAL NOT NULL,"
+            " size INTEGER NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed_at ON cache (accessed_at)")
+        self.current_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+
+    def ping(self) -> bool:
+        with self._lock:
+            self._conn.execute("SELECT 1").fetchone()
+        return True
+
+    def _get(self, key: str, now: float) -> Optional[bytes]:
+        row = self._conn.execute("SELECT value, expires_at, size FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+
+        value, expires_at, size = row
+        if expires_at is not None and expires_at <= now:
+            self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+            self.current_bytes -= size
+            self.expirations += 1
+            return None
+
+        self._conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+        return value
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            return self._get(key, time.time())
+
+    def mget(self, keys: List[str]) -> List[Optional[bytes]]:
+        with self._lock:
+            now = time.time()
+            self._conn.execute("BEGIN")
+            try:
+                return [self._get(key, now) for key in keys]
+            finally:
+                self._conn.execute("COMMIT")
+
+    def _set(self, key: str, value: bytes, ttl_seconds: Optional[float], now: float):
+        value = _to_bytes(value)
+        size = len(key) + len(value)
+        previous = self._conn.execute("SELECT size FROM cache WHERE key = ?", (key,)).fetchone()
+        if previous is not None:
+            self.current_bytes -= previous[0]
+
+        expires_at = now + ttl_seconds if ttl_seconds is not None else None
+        self._conn.execute(
+            "INSERT OR REPLACE INTO cache (key, value, expires_at, accessed_at, size) VALUES (?, ?, ?, ?, ?)",
+            (key, value, expires_at, now, size)
+        )
+        self.current_bytes += size
+
+    def _evict(self, now: float):
+        """Drop expired, then least recently used, entries until back under budget"""
+        if self.current_bytes <= self.max_bytes:
+            return
+
+        expired = self._conn.execute(
+            "DELETE FROM cache WHERE expires_at IS NOT NULL AND expires_at <= ? RETURNING size", (now,)
+        ).fetchall()
+        self.expirations += len(expired)
+        self.current_bytes -= sum(size for (size,) in expired)
+
+        excess = self.current_bytes - self.max_bytes
+        if excess <= 0:
+            return
+
+        cursor = self._conn.execute("SELECT key, size FROM cache ORDER BY accessed_at")
+        victims = []
+        while excess > 0:
+            rows = cursor.fetchmany(self.EVICTION_BATCH)
+            if not rows:
+                break
+            for key, size in rows:
+                if excess <= 0:
+                    break
+                victims.append((key,))
+                excess -= size
+                self.current_bytes -= size
+        cursor.close()
+
+        self._conn.executemany("DELETE FROM cache WHERE key = ?", victims)
+        self.evictions += len(victims)
+
+    def setex(self, key: str, ttl_seconds: float, value: bytes) -> bool:
+        return self.set_many([(key, ttl_seconds, value)])
+
+    def set_many(self, entries: List[tuple]) -> bool:
+        """Write (key, ttl_seconds, value) entries in one transaction"""
+        with self._lock:
+            now = time.time()
+            self._conn.execute("BEGIN")
+            try:
+                for key, ttl_seconds, value in entries:
+                    self._set(key, value, ttl_seconds, now)
+                self._evict(now)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                self.current_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+                raise
+        return True
+
+    def set(self, key: str, value: bytes, nx: bool = False, px: Optional[int] = None) -> Optional[bool]:
+        with self._lock:
+            now = time.time()
+            if nx and self._get(key, now) is not None:
+                return None
+            self._set(key, value, px / 1000 if px is not None else None, now)
+            self._evict(now)
+        return True
+
+    def delete(self, *keys: str) -> int:
+        with self._lock:
+            deleted = 0
+            for key in keys:
+                row = self._conn.execute("DELETE FROM cache WHERE key = ? RETURNING size", (key,)).fetchone()
+                if row is not None:
+                    self.current_bytes -= row[0]
+                    deleted += 1
+            return deleted
+
+    unlink = delete
+
+    def incr(self, key: str) -> int:
+        """Increment a counter, keeping its expiry like Redis INCR"""
+        with self._lock:
+            now = time.time()
+            current = self._get(key, now)
+            value = int(current) + 1 if current is not None else 1
+            row = self._conn.execute("SELECT expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+            ttl_seconds = row[0] - now if row is not None and row[0] is not None else None
+            self._set(key, _to_bytes(value), ttl_seconds, now)
+            return value
+
+    def expire(self, key: str, ttl_seconds: float) -> bool:
+        with self._lock:
+            now = time.time()
+            if self._get(key, now) is None:
+                return False
+            self._conn.execute("UPDATE cache SET expires_at = ? WHERE key = ?", (now + ttl_seconds, key))
+            return True
+
+    def scan_iter(self, match: str = "*", count: Optional[int] = None) -> Iterator[str]:
+        # SQLite GLOB uses the same wildcards as Redis patterns
+        with self._lock:
+            keys = [key for (key,) in self._conn.execute("SELECT key FROM cache WHERE key GLOB ?", (match,))]
+        yield from keys
+
+    def dbsize(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+    def get_stats(self) -> dict:
+        try:
+            self.ping()
+            status = "healthy"
+        except sqlite3.Error as e:
+            status = f"error: {e}"
+
+        return {
+            "status": status,
+            "path": self.path,
+            "entries": self.dbsize() if status == "healthy" else None,
+            "used_bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+            "file_bytes": Path(self.path).stat().st_size if Path(self.path).exists() else 0,
+            "evictions": self.evictions,
+            "expirations": self.expirations
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class AsyncDiskCache:
+    """Async view of a DiskCache; each command runs in a worker thread so SQLite I/O stays off the event loop"""
+
+    def __init__(self, disk: DiskCache):
+        self.disk = disk
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await asyncio.to_thread(self.disk.get, key)
+
+    async def mget(self, keys: List[str]) -> List[Optional[bytes]]:
+        return await asyncio.to_thread(self.disk.mget, keys)
+
+    async def setex(self, key: str, ttl_seconds: float, value: bytes) -> bool:
+        return await asyncio.to_thread(self.disk.setex, key, ttl_seconds, value)
+
+    async def set(self, key: str, value: bytes, nx: bool = False, px: Optional[int] = None) -> Optional[bool]:
+        return await asyncio.to_thread(self.disk.set, key, value, nx, px)
+
+    async def delete(self, *keys: str) -> int:
+        return await asyncio.to_thread(self.disk.delete, *keys)
+
+    unlink = delete
+
+    async def incr(self, key: str) -> int:
+        return await asyncio.to_thread(self.disk.incr, key)
+
+    async def expire(self, key: str, ttl_seconds: float) -> bool:
+        return await asyncio.to_thread(self.disk.expire, key, ttl_seconds)
+
+    async def scan_iter(self, match: str = "*", count: Optional[int] = None):
+        for key in await asyncio.to_thread(lambda: list(self.disk.scan_iter(match))):
+            yield key
+
+    def pipeline(self, transaction: bool = True) -> "AsyncDiskPipeline":
+        return AsyncDiskPipeline(self.disk)
+
+
+class AsyncDiskPipeline:
+    """Buffers SETEX commands and writes them in one SQLite transaction"""
+
+    def __init__(self, disk: DiskCache):
+        self.disk = disk
+        self.entries = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def setex(self, key: str, ttl_seconds: float, value: bytes):
+        self.entries.append((key, ttl_seconds, value))
+
+    async def execute(self) -> List[bool]:
+        entries, self.entries = self.entries, []
+        await asyncio.to_thread(self.disk.set_many, entries)
+        return [True] * len(entries)
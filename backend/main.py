@@ -3,30 +3,45 @@ import os
 # This prevents memory leaks from GDAL's internal caching on low-memory servers
 os.environ.setdefault('GDAL_CACHEMAX', '64')  # 64 MB max cache
 
-from fastapi import FastAPI, HTTPException
+from fastapi import Depends, FastAPI, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from shapely.geometry import Point
-from models.schemas import CustomSpot, HeatmapPoint, SpotRequest, SpotResponse, RecommendedSpot
-from services.isochrone import get_search_area, generate_grid_points, polygon_to_geojson
+from models.schemas import CloudSampling, CustomSpot, HeatmapPoint, SpotRequest, SpotResponse, RecommendedSpot
+from services.isochrone import get_search_area, SearchGrid, polygon_to_geojson, served_drive_time_minutes
 from services.light_pollution import (
     get_light_pollution_score,
+    get_light_pollution_scores_batch,
+    get_light_pollution_grid,
     get_quality_description,
     load_light_pollution_data,
     close_light_pollution_data,
     get_dataset_info
 )
-from services.places import calculate_stargazing_score, find_best_stargazing_spots
-from services.cloud_cover import get_cloud_cover, get_cloud_quality_score
-from services.cloud_cover_strategy import get_cloud_cover_for_area, estimate_api_calls
-from cache import get_cache_stats
+from services.places import calculate_stargazing_score, calculate_stargazing_scores, find_best_stargazing_spots
+from services.cloud_cover import get_cloud_cover, get_cloud_quality_score, cloud_prefetcher
+from services.cloud_cover_strategy import sample_cloud_cover_grid
+from cache import get_cache_stats, close_async_redis, start_invalidation, get_invalidation_job, bump_namespace
 from services.get_astronomy_details import get_astronomy_details
 import traceback
 import logging
+import secrets
+from typing import Optional
 import asyncio
 from datetime import datetime
-from services.tree_density import load_tree_density_data, close_tree_density_data, get_tree_density_scores_batch
-from services.conversion_utils import relative_weight
+from services.tree_density import (
+    load_tree_density_data,
+    close_tree_density_data,
+    get_tree_density_scores_batch,
+    get_tree_density_grid
+)
+from services.raster_executor import raster_executor
+from services.road_graph import load_road_graph, close_road_graph
+from services.outbound import get_provider_stats, start_http_clients, close_http_clients
+from services.cloud_field import start_cloud_field_ingestion, stop_cloud_field_ingestion, get_cloud_field_stats
+from services.grid_refinement import refine_search_grid
+from services.conversion_utils import relative_weight, nan_to_none
+import numpy as np
 from tinydb import TinyDB, Query
 from config import settings
 import os
@@ -132,12 +147,22 @@ async def startup_event():
     load_light_pollution_data()
     logger.info("Loading tree density data...")
     load_tree_density_data()
+    load_road_graph()
+    await start_http_clients()
+    start_cloud_field_ingestion()
+    cloud_prefetcher.start()
 
 @app.on_event("shutdown")
 async def shutdown_event():
     logger.info("Shutting down and cleaning up resources...")
+    await stop_cloud_field_ingestion()
+    await cloud_prefetcher.stop()
+    raster_executor.shutdown()
+    await close_async_redis()
+    await close_http_clients()
     close_light_pollution_data()
     close_tree_density_data()
+    close_road_graph()
     db.close()
     logger.info("All resources closed successfully")
 
@@ -162,42 +187,67 @@ async def get_stargazing_spots(request: SpotRequest):
             request.radius_miles
         )
 
-        grid_points = generate_grid_points(polygon)
-
-        pollution_tasks = [
-            get_light_pollution_score(lat, lon)
-            for lat, lon in grid_points
-        ]
-        pollution_scores = await asyncio.gather(*pollution_tasks)
-        tree_scores = await get_tree_density_scores_batch(grid_points)
+        # Every layer below is a 2-D array of the grid's shape, NaN outside the search area
+        grid = SearchGrid.from_polygon(polygon, equal_area=settings.search_grid_mode == "equal_area")
 
-        cloud_covers = await get_cloud_cover_for_area(
-            grid_points,
-            sample_strategy="sparse"
+        cloud_layer, cloud_sampling = await sample_cloud_cover_grid(
+            grid,
+            sample_strategy=settings.cloud_sample_strategy
+        )
+        logger.info(
+            f"Cloud cover: {cloud_sampling['samples']} samples ({cloud_sampling['strategy']}, "
+            f"variance {cloud_sampling['variance']}) for {grid.size} points"
         )
-
-        api_calls = estimate_api_calls(len(grid_points), "sparse")
-        logger.info(f"Cloud cover: {api_calls} API calls for {len(grid_points)} points")
 
         relative_pollution_weight = relative_weight(request.pollution_weight, request.cloud_weight, request.tree_weight)
         relative_cloud_weight = relative_weight(request.cloud_weight, request.pollution_weight, request.tree_weight)
         relative_tree_weight = relative_weight(request.tree_weight, request.pollution_weight, request.cloud_weight)
 
+        async def evaluate_cells(rows: np.ndarray, cols: np.ndarray) -> np.ndarray:
+            points = np.column_stack([grid.lats[rows], grid.lons[cols]])
+            return calculate_stargazing_scores(
+                await get_light_pollution_scores_batch(points),
+                cloud_layer[rows, cols],
+                await get_tree_density_scores_batch(points),
+                pollution_weight=relative_pollution_weight,
+                cloud_weight=relative_cloud_weight,
+                tree_weight=relative_tree_weight,
+            )
+
+        # Large areas: score coarse-to-fine and keep only the evaluated cells
+        grid = await refine_search_grid(grid, evaluate_cells, settings.search_point_budget)
+        grid_points = grid.points()
+
+        pollution_layer = await get_light_pollution_grid(grid)
+        tree_layer = await get_tree_density_grid(grid)
+
+        score_layer = calculate_stargazing_scores(
+            pollution_layer,
+            cloud_layer,
+            tree_layer,
+            pollution_weight=relative_pollution_weight,
+            cloud_weight=relative_cloud_weight,
+            tree_weight=relative_tree_weight,
+        )
+
+        pollution_scores = grid.gather(pollution_layer)
+        cloud_covers = grid.gather(cloud_layer)
+        tree_scores = grid.gather(tree_layer)
+
         heatmap = [
             HeatmapPoint(lat=lat,
                          lon=lon,
                          pollution_score=score,
                          cloud_cover=cloud,
                          tree_density=tree,
-                         stargazing_score=calculate_stargazing_score(
-                            score,
-                            cloud,
-                            tree,
-                            pollution_weight=relative_pollution_weight,
-                            cloud_weight=relative_cloud_weight,
-                            tree_weight=relative_tree_weight,
-                        ))
-            for (lat, lon), score, cloud, tree in zip(grid_points, pollution_scores, cloud_covers, tree_scores)
+                         stargazing_score=stargazing_score)
+            for (lat, lon), score, cloud, tree, stargazing_score in zip(
+                grid_points.tolist(),
+                pollution_scores.tolist(),
+                nan_to_none(cloud_covers),
+                tree_scores.tolist(),
+                grid.gather(score_layer).tolist()
+            )
         ]
 
         best_spots = await find_best_stargazing_spots(
@@ -233,11 +283,13 @@ async def get_stargazing_spots(request: SpotRequest):
             spot for spot in custom_spots
             if polygon.contains(Point(spot['lon'], spot['lat']))
         ]
-        custom_tree_scores = await get_tree_density_scores_batch([(spot['lat'], spot['lon']) for spot in spots_in_polygon])
+        custom_points = [(spot['lat'], spot['lon']) for spot in spots_in_polygon]
+        custom_pollution_scores = await get_light_pollution_scores_batch(custom_points)
+        custom_tree_scores = await get_tree_density_scores_batch(custom_points)
         i = 0
         for spot in spots_in_polygon:
             lat, lon = spot['lat'], spot['lon']
-            pollution = await get_light_pollution_score(lat, lon)
+            pollution = custom_pollution_scores[i]
             cloud_cover = await get_cloud_cover(lat, lon)
             tree_density = custom_tree_scores[i]
             stargazing_score = calculate_stargazing_score(
@@ -265,7 +317,9 @@ async def get_stargazing_spots(request: SpotRequest):
         return SpotResponse(
             heatmap=heatmap,
             recommended_spots=recommended_spots,
-            search_area=polygon_to_geojson(polygon)
+            search_area=polygon_to_geojson(polygon),
+            cloud_sampling=CloudSampling(**cloud_sampling),
+            drive_time_minutes=served_drive_time_minutes(request.drive_time_minutes) if request.drive_time_minutes else None
         )
     except Exception as e:
         print(f"Error: {str(e)}")
@@ -284,6 +338,38 @@ async def health():
 async def get_cache_stats_endpoint():
     return get_cache_stats()
 
+def require_admin_token(x_admin_token: Optional[str] = Header(None)):
+    """Cache admin endpoints need settings.cache_admin_token; without one configured they are disabled"""
+    if not settings.cache_admin_token:
+        raise HTTPException(status_code=403, detail="Cache admin endpoints are disabled")
+    if x_admin_token is None or not secrets.compare_digest(x_admin_token, settings.cache_admin_token):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+@app.post("/cache/invalidate", dependencies=[Depends(require_admin_token)])
+async def invalidate_cache_endpoint(pattern: str):
+    """Start a background SCAN/UNLINK of keys matching pattern; poll the returned job for progress"""
+    try:
+        return start_invalidation(pattern)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/cache/invalidate/{job_id}", dependencies=[Depends(require_admin_token)])
+async def get_invalidation_job_endpoint(job_id: str):
+    job = get_invalidation_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Invalidation job not found")
+    return job
+
+@app.post("/cache/namespaces/{prefix}/bump", dependencies=[Depends(require_admin_token)])
+async def bump_namespace_endpoint(prefix: str, purge: bool = True):
+    """Invalidate a whole cache layer (e.g. light_pollution after a new VIIRS year) in O(1)"""
+    try:
+        return await bump_namespace(prefix, purge=purge)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ConnectionError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
 @app.get("/api/astronomy")
 async def get_astronomy(latitude: float, longitude: float, date: str = None, time: str = "20:00:00"):
 
@@ -303,6 +389,26 @@ async def debug_dataset():
     """Get information about the light pollution dataset"""
     return get_dataset_info()
 
+@app.get("/debug/raster-io")
+async def debug_raster_io():
+    """Get queue depth and wait times of the raster I/O thread pool"""
+    return raster_executor.get_stats()
+
+@app.get("/debug/providers")
+async def debug_providers():
+    """Get circuit breaker, rate limit and concurrency state of each outbound API"""
+    return get_provider_stats()
+
+@app.get("/debug/cloud-field")
+async def debug_cloud_field():
+    """Get the ingested cloud field's source, coverage, age and refresh history"""
+    return get_cloud_field_stats()
+
+@app.get("/debug/cloud-prefetch")
+async def debug_cloud_prefetch():
+    """Get the hottest cloud cells, prefetch budget use and the hits prefetching contributed"""
+    return await cloud_prefetcher.get_stats()
+
 @app.get("/debug/tree-density")
 async def debug_tree_density(lat: float = 38.9634, lon: float = -92.3293):
     """Test tree density lookup for a specific location"""
@@ -31,10 +31,18 @@ class RecommendedSpot(BaseModel):
     address: Optional[str] = None
     google_place_id: Optional[str] = None
 
+class CloudSampling(BaseModel):
+    strategy: str
+    samples: int
+    variance: Optional[float] = None
+    lattice_degrees: Optional[float] = None
+
 class SpotResponse(BaseModel):
     heatmap: List[HeatmapPoint]
     recommended_spots: List[RecommendedSpot]
     search_area: Optional[dict] = None
+    cloud_sampling: Optional[CloudSampling] = None
+    drive_time_minutes: Optional[int] = None  # Drive time the search area was built for (ladder step, capped at the provider limit)
 
 class CustomSpot(BaseModel):
     lat: float
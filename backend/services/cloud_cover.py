@@ -1,12 +1,33 @@
-import httpx
 import logging
 from typing import Optional
 from config import settings
-from cache import cache_response
+from cache import cache_response, DegradedResult, PERCENT_CODEC
+from services.isochrone import global_cell_id
+from services.outbound import get_provider
+from services.cloud_field import get_cloud_field
+from services.cloud_prefetch import CloudPrefetcher
 
 logger = logging.getLogger(__name__)
 
-@cache_response(ttl_seconds=1800, prefix="cloud_cover")
+# Cache precision: lookups are rounded to 0.1° (~7 mi) and keyed by that
+# global grid cell; cloud cover is stored as a whole percentage in one byte
+CLOUD_COVER_CELL_DEGREES = 0.1
+
+def _cell_key(lat: float, lon: float) -> str:
+    return str(global_cell_id(lat, lon, CLOUD_COVER_CELL_DEGREES))
+
+# Fresh for 30 minutes; up to an hour old it is served immediately while refreshed in the background
+CLOUD_COVER_SOFT_TTL_SECONDS = 1800
+
+@cache_response(
+    ttl_seconds=3600,
+    soft_ttl_seconds=CLOUD_COVER_SOFT_TTL_SECONDS,
+    prefix="cloud_cover",
+    l1_ttl_seconds=300,
+    lock_timeout_seconds=6,
+    key_builder=_cell_key,
+    codec=PERCENT_CODEC
+)
 async def _get_cloud_cover_cached(lat: float, lon: float) -> Optional[float]:
     if not hasattr(settings, 'openweather_api_key') or not settings.openweather_api_key:
         logger.warning("OpenWeather API key not configured")
@@ -21,8 +42,8 @@ async def _get_cloud_cover_cached(lat: float, lon: float) -> Optional[float]:
     }
 
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, params=params, timeout=5.0)
+        async with get_provider("openweather").call() as client:
+            response = await client.get(url, params=params)
             response.raise_for_status()
             data = response.json()
 
@@ -30,9 +51,20 @@ async def _get_cloud_cover_cached(lat: float, lon: float) -> Optional[float]:
             return float(cloud_cover)
     except Exception as e:
         logger.error(f"Error fetching cloud cover: {e}")
-        return None
+        raise DegradedResult(None, f"OpenWeather error: {e}")
+
+# Popular cells are refreshed before they go stale, so busy areas rarely wait on OpenWeather
+cloud_prefetcher = CloudPrefetcher("cloud_cover", _get_cloud_cover_cached, CLOUD_COVER_SOFT_TTL_SECONDS,
+                                   provider=get_provider("openweather"))
 
 async def get_cloud_cover(lat: float, lon: float) -> Optional[float]:
+    # The ingested gridded field answers from memory when it covers the point
+    field = get_cloud_field()
+    if field is not None:
+        value = float(field.sample([lat], [lon])[0])
+        if value == value:
+            return value
+
     lat_rounded = round(lat, 1)
     lon_rounded = round(lon, 1)
 
@@ -42,6 +74,7 @@ async def get_cloud_cover(lat: float, lon: float) -> Optional[float]:
             f"({lat_rounded:.1f}, {lon_rounded:.1f})"
         )
 
+    cloud_prefetcher.record(lat_rounded, lon_rounded)
     return await _get_cloud_cover_cached(lat_rounded, lon_rounded)
 
 def get_cloud_quality_score(cloud_cover: Optional[float]) -> float:
@@ -2,9 +2,22 @@
 Smart cloud cover fetching strategy to avoid API spam
 """
 import asyncio
+import math
 from typing import List, Tuple, Optional
+from config import settings
 from services.cloud_cover import get_cloud_cover
-import math
+from services.cloud_field import get_cloud_field
+from services.conversion_utils import nan_to_none
+from services.isochrone import SearchGrid
+import numpy as np
+
+MILES_PER_DEGREE = 69.0
+
+# Grid points interpolated per block, bounding the points x samples distance matrix
+INTERPOLATION_CHUNK = 2048
+
+# Most OpenWeather samples each interpolating strategy may use per search
+SAMPLE_BUDGETS = {"sparse": 10, "moderate": 25}
 
 async def get_cloud_cover_for_area(
     grid_points: List[Tuple[float, float]],
@@ -15,8 +28,10 @@ async def get_cloud_cover_for_area(
 
     Strategies:
         "single": One API call for center, apply to all points
-        "sparse": Sample 5-10 points, interpolate for the rest
-        "moderate": Sample 20-30 points, interpolate for the rest
+        "sparse": Sample up to 10 global lattice points, interpolate for the rest
+        "moderate": Sample up to 25 global lattice points, interpolate for the rest
+        "adaptive": Start coarse and add samples only where neighbouring
+            samples disagree, within settings.cloud_adaptive_max_samples
         "all": Call API for every point (NOT RECOMMENDED)
 
     Returns:
@@ -26,6 +41,12 @@ async def get_cloud_cover_for_area(
     if len(grid_points) == 0:
         return []
 
+    # A fresh ingested field covering the area replaces sampling altogether
+    points = np.array(grid_points, dtype=np.float64).reshape(-1, 2)
+    field_clouds = _from_cloud_field(points)
+    if field_clouds is not None:
+        return nan_to_none(field_clouds)
+
     if sample_strategy == "single":
         # Just get cloud cover for the center point
         # Cloud cover is usually consistent across 25-50 mile radius
@@ -37,13 +58,10 @@ async def get_cloud_cover_for_area(
         # Apply same cloud cover to all points
         return [center_clouds] * len(grid_points)
 
-    elif sample_strategy == "sparse":
-        # Sample ~10 points across the area, interpolate for others
-        return await _sample_and_interpolate(grid_points, num_samples=10)
-
-    elif sample_strategy == "moderate":
-        # Sample ~25 points
-        return await _sample_and_interpolate(grid_points, num_samples=25)
+    elif sample_strategy in SAMPLE_BUDGETS or sample_strategy == "adaptive":
+        # Sample lattice points across the area, interpolate for others
+        clouds, _ = await sample_cloud_cover(points[:, 0], points[:, 1], sample_strategy)
+        return nan_to_none(clouds)
 
     elif sample_strategy == "all":
         # Call API for every point (use with caution!)
@@ -54,91 +72,300 @@ async def get_cloud_cover_for_area(
         raise ValueError(f"Unknown strategy: {sample_strategy}")
 
 
-async def _sample_and_interpolate(
-    grid_points: List[Tuple[float, float]],
-    num_samples: int
-) -> List[Optional[float]]:
+async def get_cloud_cover_grid(grid: SearchGrid, sample_strategy: str = "sparse") -> np.ndarray:
     """
-    Sample a subset of points and interpolate cloud cover for the rest.
+    Cloud cover (%) as a layer of the grid's shape.
+
+    Returns:
+        Array of the grid's shape, NaN where unknown or outside the mask
     """
-    if len(grid_points) <= num_samples:
-        # If we have fewer points than samples, just get all of them
-        tasks = [get_cloud_cover(lat, lon) for lat, lon in grid_points]
-        return await asyncio.gather(*tasks)
+    return (await sample_cloud_cover_grid(grid, sample_strategy))[0]
 
-    # Sample points evenly across the grid
-    sample_indices = _get_sample_indices(len(grid_points), num_samples)
-    sample_points = [grid_points[i] for i in sample_indices]
 
-    # Get cloud cover for sample points
-    tasks = [get_cloud_cover(lat, lon) for lat, lon in sample_points]
-    sample_clouds = await asyncio.gather(*tasks)
+async def sample_cloud_cover_grid(grid: SearchGrid, sample_strategy: str = "sparse") -> Tuple[np.ndarray, dict]:
+    """
+    Cloud cover layer plus how it was sampled.
 
-    # Interpolate for all points
-    all_clouds = []
-    for lat, lon in grid_points:
-        cloud = _interpolate_cloud_cover(lat, lon, sample_points, sample_clouds)
-        all_clouds.append(cloud)
+    Returns:
+        (layer, sampling) where sampling holds the strategy, the number of
+        samples (API lookups), the variance of the sampled values (%^2,
+        None if unknown) and the finest lattice spacing used
+    """
+    points = grid.points()
+    lats, lons = points[:, 0], points[:, 1]
+    field_clouds = _from_cloud_field(points)
+    if field_clouds is not None:
+        field = get_cloud_field()
+        clouds = field_clouds
+        sampling = {
+            "strategy": "field",
+            "samples": 0,
+            "variance": _variance(clouds),
+            "lattice_degrees": field.res_x if field is not None else None
+        }
+    elif sample_strategy in SAMPLE_BUDGETS or sample_strategy == "adaptive":
+        clouds, sampling = await sample_cloud_cover(lats, lons, sample_strategy)
+    else:
+        clouds = await get_cloud_cover_for_area([tuple(point) for point in points.tolist()], sample_strategy)
+        clouds = np.array(clouds, dtype=np.float64)
+        sampling = {
+            "strategy": sample_strategy,
+            "samples": estimate_api_calls(points, sample_strategy),
+            "variance": _variance(clouds),
+            "lattice_degrees": None
+        }
+    return grid.scatter(clouds), sampling
+
+
+async def sample_cloud_cover(lats: np.ndarray, lons: np.ndarray, sample_strategy: str) -> Tuple[np.ndarray, dict]:
+    """Cloud cover per point for the lattice strategies ("sparse", "moderate", "adaptive"); NaN where unknown"""
+    if len(lats) == 0:
+        return np.empty(0), {"strategy": sample_strategy, "samples": 0, "variance": None, "lattice_degrees": None}
+
+    if sample_strategy == "adaptive":
+        sample_lats, sample_lons, sample_clouds, spacing = await _adaptive_samples(lats, lons)
+    else:
+        # Sample the global lattice nodes covering the points, so overlapping searches share cache keys
+        sample_lats, sample_lons, spacing = cloud_sample_lattice(lats, lons, SAMPLE_BUDGETS[sample_strategy])
+        sample_clouds = await _fetch_samples(sample_lats, sample_lons)
+
+    sampling = {
+        "strategy": sample_strategy,
+        "samples": len(sample_clouds),
+        "variance": _variance(sample_clouds),
+        "lattice_degrees": spacing
+    }
+    # Interpolate for all points at once
+    return interpolate_cloud_cover(lats, lons, sample_lats, sample_lons, sample_clouds), sampling
 
-    return all_clouds
+
+def _from_cloud_field(points: np.ndarray) -> Optional[np.ndarray]:
+    """Cloud cover for every point from the ingested field, or None if it is missing, stale or partial"""
+    field = get_cloud_field()
+    if field is None or len(points) == 0 or not field.covers(points[:, 0], points[:, 1]):
+        return None
+    return field.sample(points[:, 0], points[:, 1])
 
 
-def _get_sample_indices(total: int, num_samples: int) -> List[int]:
+async def _fetch_samples(sample_lats: np.ndarray, sample_lons: np.ndarray) -> np.ndarray:
+    tasks = [get_cloud_cover(lat, lon) for lat, lon in zip(sample_lats.tolist(), sample_lons.tolist())]
+    return np.array(await asyncio.gather(*tasks), dtype=np.float64)
+
+
+def _variance(values: np.ndarray) -> Optional[float]:
+    known = values[~np.isnan(values)]
+    return round(float(np.var(known)), 2) if len(known) > 0 else None
+
+
+def cloud_sample_lattice(
+    lats: np.ndarray,
+    lons: np.ndarray,
+    max_samples: int,
+    spacing_degrees: Optional[float] = None
+) -> Tuple[np.ndarray, np.ndarray, float]:
     """
-    Get evenly distributed sample indices.
+    Nodes of a fixed global lattice covering the points: every node whose
+    cell (the square of the lattice spacing around it) holds a point.
+
+    The lattice starts at settings.cloud_sample_lattice_degrees and doubles
+    until at most max_samples nodes remain. Nodes only depend on which cells
+    the points fall in, never on point order, so identical and overlapping
+    searches sample the same coordinates.
+
+    Returns:
+        (sample_lats, sample_lons, spacing) with nodes in row-major order
     """
-    if num_samples >= total:
-        return list(range(total))
+    spacing = spacing_degrees or settings.cloud_sample_lattice_degrees
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    while True:
+        cells = np.unique(np.column_stack([np.round(lats / spacing), np.round(lons / spacing)]), axis=0)
+        if len(cells) <= max(max_samples, 1):
+            return np.round(cells[:, 0] * spacing, 6), np.round(cells[:, 1] * spacing, 6), spacing
+        spacing *= 2
 
-    step = total / num_samples
-    return [int(i * step) for i in range(num_samples)]
 
+def _neighbour_spread(cells: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """
+    For each lattice node, the largest difference to a sampled neighbouring
+    node; inf when it has no known neighbour, since nothing says its cell is
+    uniform. Unknown (NaN) nodes get 0: refining around a failed lookup would
+    only spend more calls on a failing API.
+    """
+    offsets = np.abs(cells[:, None, :] - cells[None, :, :]).max(axis=2)
+    with np.errstate(invalid="ignore"):
+        diffs = np.abs(values[:, None] - values[None, :])
+    compared = (offsets == 1) & ~np.isnan(diffs)
+    spread = np.where(compared.any(axis=1), np.where(compared, diffs, 0.0).max(axis=1), np.inf)
+    return np.where(np.isnan(values), 0.0, spread)
 
-def _interpolate_cloud_cover(
-    lat: float,
-    lon: float,
-    sample_points: List[Tuple[float, float]],
-    sample_clouds: List[Optional[float]]
-) -> Optional[float]:
+
+def _initial_spacing(lats: np.ndarray, lons: np.ndarray) -> float:
     """
-    Interpolate cloud cover using inverse distance weighting.
+    Coarsest lattice spacing (the finest lattice times a power of two) that
+    still puts cloud_adaptive_initial_nodes_per_axis steps across the
+    shorter side of the points' bounding box
     """
-    # Filter out None values
-    valid_samples = [
-        (slat, slon, cloud)
-        for (slat, slon), cloud in zip(sample_points, sample_clouds)
-        if cloud is not None
-    ]
+    finest = settings.cloud_sample_lattice_degrees
+    extent = min(np.ptp(lats), np.ptp(lons)) / max(settings.cloud_adaptive_initial_nodes_per_axis, 1)
+    if extent < 2 * finest:
+        return finest
+    return finest * 2 ** math.floor(math.log2(extent / finest))
 
-    if not valid_samples:
-        return None
 
-    # Find nearest sample point
-    min_dist = float('inf')
-    nearest_cloud = None
+async def _adaptive_samples(lats: np.ndarray, lons: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, float]:
+    """
+    Coarse-to-fine lattice sampling: begin on a lattice sized to the area
+    (see _initial_spacing), then halve the spacing inside the cells whose
+    node differs from a neighbour by more than cloud_adaptive_spread_percent
+    or has no measured neighbour (most disagreeing first), until the finest
+    lattice, agreement or cloud_adaptive_max_samples is reached. Unknown
+    nodes are not refined, and refinement stops once a level returns only
+    unknowns.
+
+    Returns:
+        (sample_lats, sample_lons, sample_clouds, finest spacing)
+    """
+    budget = settings.cloud_adaptive_max_samples
+    finest = settings.cloud_sample_lattice_degrees
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+
+    node_lats, node_lons, spacing = cloud_sample_lattice(lats, lons, budget, _initial_spacing(lats, lons))
+    node_clouds = await _fetch_samples(node_lats, node_lons)
+    samples = dict(zip(zip(node_lats.tolist(), node_lons.tolist()), node_clouds.tolist()))
+
+    while spacing / 2 >= finest - 1e-9 and len(samples) < budget:
+        cells = np.column_stack([np.round(node_lats / spacing), np.round(node_lons / spacing)])
+        spread = _neighbour_spread(cells, node_clouds)
+        flagged = spread > settings.cloud_adaptive_spread_percent
+        if not flagged.any():
+            break
+
+        # Children: half-spacing nodes covering the points inside flagged cells
+        point_cells = np.column_stack([np.round(lats / spacing), np.round(lons / spacing)])
+        point_spread = np.full(len(lats), -1.0)
+        for cell, cell_spread in zip(cells[flagged], spread[flagged]):
+            point_spread[(point_cells == cell).all(axis=1)] = cell_spread
+        inside = point_spread >= 0
+
+        spacing /= 2
+        child_cells, first = np.unique(
+            np.column_stack([np.round(lats[inside] / spacing), np.round(lons[inside] / spacing)]),
+            axis=0, return_index=True
+        )
+        order = np.argsort(-point_spread[inside][first], kind="stable")
+        child_lats = np.round(child_cells[order, 0] * spacing, 6)
+        child_lons = np.round(child_cells[order, 1] * spacing, 6)
+
+        # Only new nodes cost an API call; stop adding them at the budget
+        is_new = np.array([key not in samples for key in zip(child_lats.tolist(), child_lons.tolist())])
+        keep = ~is_new | (np.cumsum(is_new) <= budget - len(samples))
+        child_lats, child_lons, is_new = child_lats[keep], child_lons[keep], is_new[keep]
+
+        new_clouds = await _fetch_samples(child_lats[is_new], child_lons[is_new])
+        samples.update(zip(zip(child_lats[is_new].tolist(), child_lons[is_new].tolist()), new_clouds.tolist()))
+        if len(new_clouds) > 0 and np.isnan(new_clouds).all():
+            # Nothing came back at this level (API down); don't refine further
+            break
+
+        node_lats, node_lons = child_lats, child_lons
+        node_clouds = np.array([samples[key] for key in zip(node_lats.tolist(), node_lons.tolist())])
 
-    for slat, slon, cloud in valid_samples:
-        dist = math.sqrt((lat - slat)**2 + (lon - slon)**2)
-        if dist < min_dist:
-            min_dist = dist
-            nearest_cloud = cloud
+    keys = list(samples)
+    sample_lats = np.array([lat for lat, _ in keys])
+    sample_lons = np.array([lon for _, lon in keys])
+    return sample_lats, sample_lons, np.array(list(samples.values()), dtype=np.float64), spacing
 
-    # For cloud cover, nearest neighbor is usually good enough
-    # (clouds don't vary much over small distances)
-    return nearest_cloud
 
+def interpolate_cloud_cover(
+    lats: np.ndarray,
+    lons: np.ndarray,
+    sample_lats: np.ndarray,
+    sample_lons: np.ndarray,
+    sample_clouds: np.ndarray,
+    method: Optional[str] = None,
+    power: Optional[float] = None,
+    radius_miles: Optional[float] = None
+) -> np.ndarray:
+    """
+    Interpolate sampled cloud cover onto points, vectorized over all points.
+
+    Distances are in miles (longitude scaled by cos(latitude)). Unknown
+    samples (NaN) are ignored.
 
-def estimate_api_calls(num_grid_points: int, strategy: str) -> int:
+    Args:
+        method: "idw" (inverse distance weighting) or "nearest"; defaults to
+            settings.cloud_interpolation
+        power: IDW distance exponent (settings.cloud_idw_power)
+        radius_miles: IDW only uses samples within this distance; points
+            with none in range take the nearest sample
+            (settings.cloud_idw_radius_miles)
+
+    Returns:
+        Cloud cover per point, NaN if no sample is known
+    """
+    method = method or settings.cloud_interpolation
+    power = settings.cloud_idw_power if power is None else power
+    radius_miles = settings.cloud_idw_radius_miles if radius_miles is None else radius_miles
+    if method not in ("idw", "nearest"):
+        raise ValueError(f"Unknown interpolation method: {method}")
+
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    sample_clouds = np.asarray(sample_clouds, dtype=np.float64)
+    valid = ~np.isnan(sample_clouds)
+    if not valid.any():
+        return np.full(len(lats), np.nan)
+
+    sample_lats = np.asarray(sample_lats, dtype=np.float64)[valid]
+    sample_lons = np.asarray(sample_lons, dtype=np.float64)[valid]
+    sample_clouds = sample_clouds[valid]
+
+    # Work in squared degrees (longitude scaled by cos(latitude)) to skip square roots
+    radius_sq = (radius_miles / MILES_PER_DEGREE) ** 2
+    lon_scale = np.cos(np.radians(lats))
+
+    result = np.empty(len(lats))
+    for start in range(0, len(lats), INTERPOLATION_CHUNK):
+        chunk = slice(start, start + INTERPOLATION_CHUNK)
+        dlat = lats[chunk, None] - sample_lats
+        dlon = (lons[chunk, None] - sample_lons) * lon_scale[chunk, None]
+        dist_sq = dlat * dlat + dlon * dlon
+
+        nearest = sample_clouds[np.argmin(dist_sq, axis=1)]
+        if method == "nearest":
+            result[chunk] = nearest
+            continue
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            weights = np.where(dist_sq <= radius_sq, dist_sq ** (-power / 2), 0.0)
+            weight_sums = weights.sum(axis=1)
+            idw = (weights @ sample_clouds) / weight_sums
+        # Points on a sample take its value; points with no sample in range take the nearest
+        result[chunk] = np.where(np.isinf(weight_sums) | (weight_sums == 0), nearest, idw)
+
+    return result
+
+
+def estimate_api_calls(grid_points, strategy: str) -> int:
     """
     Estimate how many API calls a strategy will use.
+
+    Args:
+        grid_points: (N, 2) array or list of (lat, lon)
     """
+    points = np.asarray(grid_points, dtype=np.float64).reshape(-1, 2)
     if strategy == "single":
         return 1
-    elif strategy == "sparse":
-        return min(10, num_grid_points)
-    elif strategy == "moderate":
-        return min(25, num_grid_points)
+    elif strategy in SAMPLE_BUDGETS:
+        if len(points) == 0:
+            return 0
+        return len(cloud_sample_lattice(points[:, 0], points[:, 1], SAMPLE_BUDGETS[strategy])[0])
+    elif strategy == "adaptive":
+        # Depends on the observed clouds; this is the upper bound
+        return min(settings.cloud_adaptive_max_samples, len(points))
     elif strategy == "all":
-        return num_grid_points
+        return len(points)
     else:
         return 0
@@ -0,0 +1,189 @@
+"""
+Gridded cloud-cover field, ingested in the background and served from memory
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Optional, Tuple
+import numpy as np
+import rasterio
+from rasterio.windows import Window, from_bounds
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# The field currently served; replaced whole by each refresh, so readers never see a partial update
+_cloud_field: Optional["CloudField"] = None
+_ingestion_task: Optional[asyncio.Task] = None
+_ingestion_stats = {"refreshes": 0, "failures": 0, "last_error": None, "last_attempt": None}
+
+
+class CloudField:
+    """
+    Read-only float32 raster of cloud cover (%) on a regular lat/lon grid.
+
+    Cells are addressed from the north-west corner: row = (north - lat) / res_y,
+    col = (lon - west) / res_x. Products on a 0-360° longitude axis (e.g. GFS)
+    are looked up with longitudes wrapped into that range. NaN means unknown.
+    """
+
+    def __init__(self, data: np.ndarray, west: float, north: float, res_x: float, res_y: float,
+                 source: str, source_mtime: Optional[float] = None):
+        self.data = np.asarray(data, dtype=np.float32)
+        self.data.setflags(write=False)
+        self.west = west
+        self.north = north
+        self.res_x = res_x
+        self.res_y = res_y
+        self.source = source
+        self.source_mtime = source_mtime
+        self.loaded_at = time.time()
+        # Age counts from the file's write time when known (a file drop that stops updating goes stale)
+        self.produced_at = source_mtime if source_mtime is not None else self.loaded_at
+        self.wraps_360 = west + res_x * self.data.shape[1] > 180.0
+
+    @property
+    def age_seconds(self) -> float:
+        return time.time() - self.produced_at
+
+    @property
+    def is_fresh(self) -> bool:
+        return self.age_seconds <= settings.cloud_field_max_age_seconds
+
+    def _cells(self, lats: np.ndarray, lons: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        lons = np.mod(lons, 360.0) if self.wraps_360 else lons
+        rows = np.floor((self.north - lats) / self.res_y).astype(np.int64)
+        cols = np.floor((lons - self.west) / self.res_x).astype(np.int64)
+        inside = (rows >= 0) & (rows < self.data.shape[0]) & (cols >= 0) & (cols < self.data.shape[1])
+        return rows, cols, inside
+
+    def covers(self, lats, lons) -> bool:
+        """Whether every point falls inside the field"""
+        _, _, inside = self._cells(np.asarray(lats, dtype=np.float64), np.asarray(lons, dtype=np.float64))
+        return bool(inside.all())
+
+    def sample(self, lats, lons) -> np.ndarray:
+        """Cloud cover at each point (nearest cell), NaN outside the field or where unknown"""
+        rows, cols, inside = self._cells(np.asarray(lats, dtype=np.float64), np.asarray(lons, dtype=np.float64))
+        values = np.full(len(rows), np.nan)
+        values[inside] = self.data[rows[inside], cols[inside]]
+        return values
+
+    def get_stats(self) -> dict:
+        return {
+            "source": self.source,
+            "shape": list(self.data.shape),
+            "resolution_degrees": [self.res_y, self.res_x],
+            "bounds": {
+                "west": self.west, "north": self.north,
+                "east": self.west + self.res_x * self.data.shape[1],
+                "south": self.north - self.res_y * self.data.shape[0]
+            },
+            "age_seconds": round(self.age_seconds, 1),
+            "fresh": self.is_fresh,
+            "known_percent": round(float(np.isfinite(self.data).mean() * 100), 2)
+        }
+
+
+def load_cloud_field(source: str) -> CloudField:
+    """
+    Read a gridded cloud-cover product with rasterio (GeoTIFF, GRIB2, or any
+    GDAL format; URLs work through GDAL's /vsicurl). The file must be on a
+    north-up EPSG:4326 grid. Only settings.cloud_field_bounds is kept, if set.
+    """
+    source_mtime = os.path.getmtime(source) if os.path.exists(source) else None
+    with rasterio.open(source) as dataset:
+        if dataset.crs is not None and not dataset.crs.is_geographic:
+            raise ValueError(f"Cloud field must be on a lat/lon grid, got {dataset.crs}")
+
+        window = None
+        if settings.cloud_field_bounds:
+            west, south, east, north = settings.cloud_field_bounds
+            if dataset.bounds.right > 180.0:
+                west, east = west % 360.0, east % 360.0
+            window = from_bounds(west, south, east, north, dataset.transform).round_offsets().round_lengths()
+            window = window.intersection(Window(0, 0, dataset.width, dataset.height))
+
+        data = dataset.read(settings.cloud_field_band, window=window, masked=True)
+        transform = dataset.window_transform(window) if window is not None else dataset.transform
+
+    values = data.astype(np.float32).filled(np.nan) * np.float32(settings.cloud_field_scale)
+    return CloudField(values, transform.c, transform.f, transform.a, -transform.e, source, source_mtime)
+
+
+def get_cloud_field() -> Optional[CloudField]:
+    """The current field, or None if none is loaded or it is too old to trust"""
+    field = _cloud_field
+    if field is None or not field.is_fresh:
+        return None
+    return field
+
+
+async def refresh_cloud_field() -> bool:
+    """
+    Load the configured source and swap it in. A local file that has not
+    changed since the last load is skipped. On failure the previous field
+    stays in place until it ages out.
+    """
+    global _cloud_field
+
+    source = settings.cloud_field_source
+    if not source:
+        return False
+
+    _ingestion_stats["last_attempt"] = time.time()
+    try:
+        current = _cloud_field
+        if current is not None and current.source == source and os.path.exists(source):
+            if os.path.getmtime(source) == current.source_mtime:
+                return False
+
+        field = await asyncio.to_thread(load_cloud_field, source)
+        _cloud_field = field
+        _ingestion_stats["refreshes"] += 1
+        logger.info(f"✓ Cloud field refreshed from {source}: {field.data.shape[0]}x{field.data.shape[1]} cells")
+        return True
+    except Exception as e:
+        _ingestion_stats["failures"] += 1
+        _ingestion_stats["last_error"] = str(e)
+        logger.error(f"Cloud field refresh failed: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+async def _ingestion_loop():
+    while True:
+        await refresh_cloud_field()
+        await asyncio.sleep(settings.cloud_field_refresh_seconds)
+
+
+def start_cloud_field_ingestion():
+    """Start the background refresh task (FastAPI startup); no-op without a configured source"""
+    global _ingestion_task
+    if not settings.cloud_field_source or _ingestion_task is not None:
+        return
+    _ingestion_task = asyncio.get_running_loop().create_task(_ingestion_loop())
+    logger.info(f"Cloud field ingestion every {settings.cloud_field_refresh_seconds}s from {settings.cloud_field_source}")
+
+
+async def stop_cloud_field_ingestion():
+    global _ingestion_task
+    task, _ingestion_task = _ingestion_task, None
+    if task is not None:
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+
+def get_cloud_field_stats() -> dict:
+    field = _cloud_field
+    return {
+        "source": settings.cloud_field_source,
+        "running": _ingestion_task is not None and not _ingestion_task.done(),
+        **_ingestion_stats,
+        "field": field.get_stats() if field is not None else None
+    }
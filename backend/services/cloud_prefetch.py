@@ -0,0 +1,240 @@
+"""
+Popularity-driven prefetching: cells that are requested often are refreshed
+shortly before their cache entries go stale, within an hourly API budget
+"""
+import asyncio
+import logging
+import math
+import threading
+import time
+from collections import deque
+from typing import Callable, Hashable, List, Optional, Tuple
+from config import settings
+import cache
+from cache import cache_stats
+
+logger = logging.getLogger(__name__)
+
+
+class PopularityCounter:
+    """
+    Exponentially decaying request counts: each request adds 1 and scores halve
+    every half_life_seconds, so yesterday evening's hot spots still rank above
+    cells seen once this morning. Decay is applied lazily per key. Beyond
+    max_keys the least popular keys are dropped.
+    """
+
+    def __init__(self, half_life_seconds: float, max_keys: int):
+        self.half_life_seconds = half_life_seconds
+        self.max_keys = max_keys
+        self._scores = {}  # key -> (score, updated)
+        self._lock = threading.Lock()
+
+    def _decayed(self, score: float, updated: float, now: float) -> float:
+        return score * math.pow(0.5, (now - updated) / self.half_life_seconds)
+
+    def record(self, key: Hashable, now: Optional[float] = None):
+        now = time.time() if now is None else now
+        with self._lock:
+            score, updated = self._scores.get(key, (0.0, now))
+            self._scores[key] = (self._decayed(score, updated, now) + 1.0, now)
+            if len(self._scores) > self.max_keys:
+                self._prune(now)
+
+    def _prune(self, now: float):
+        ranked = sorted(self._scores, key=lambda key: self._decayed(*self._scores[key], now), reverse=True)
+        for key in ranked[self.max_keys * 3 // 4:]:
+            del self._scores[key]
+
+    def score(self, key: Hashable, now: Optional[float] = None) -> float:
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self._scores.get(key)
+        return self._decayed(*entry, now) if entry else 0.0
+
+    def top(self, count: int, min_score: float = 0.0, now: Optional[float] = None) -> List[Tuple[Hashable, float]]:
+        """The count most popular keys scoring at least min_score, hottest first"""
+        now = time.time() if now is None else now
+        with self._lock:
+            scored = [(key, self._decayed(score, updated, now)) for key, (score, updated) in self._scores.items()]
+        scored = [(key, score) for key, score in scored if score >= min_score]
+        scored.sort(key=lambda item: item[1], reverse=True)
+        return scored[:count]
+
+    def __len__(self) -> int:
+        return len(self._scores)
+
+    def clear(self):
+        with self._lock:
+            self._scores.clear()
+
+
+class CloudPrefetcher:
+    """
+    Keeps the hottest keys of a cache_response function with a soft TTL (the
+    cloud-cover cells) fresh. Every interval it walks the most popular keys and calls
+    cached_func.prefetch(*key) for those whose entry is missing or within
+    lead_seconds of its soft TTL.
+
+    The hourly budget is one Redis counter per clock hour shared by every
+    worker (per process when Redis is down), so N workers still spend at most
+    cloud_prefetch_hourly_budget calls. Popularity is counted per process.
+    Prefetches run one at a time, pause while the provider's rate limit has
+    less than cloud_prefetch_min_headroom_percent left for user requests, and
+    a pass stops at the first failure so an upstream outage is not hammered.
+    """
+
+    def __init__(self, name: str, cached_func: Callable, soft_ttl_seconds: int,
+                 popularity: Optional[PopularityCounter] = None, provider=None):
+        self.name = name
+        self.cached_func = cached_func
+        self.soft_ttl_seconds = soft_ttl_seconds
+        self.provider = provider
+        self.popularity = popularity or PopularityCounter(
+            settings.cloud_prefetch_half_life_seconds,
+            settings.cloud_prefetch_max_keys
+        )
+        self._spent = deque()  # Timestamps of prefetch calls in the last hour (without Redis)
+        self._task: Optional[asyncio.Task] = None
+        self.passes = 0
+        self.prefetched = 0
+        self.failed = 0
+        self.skipped_fresh = 0
+        self.skipped_budget = 0
+        self.skipped_busy = 0
+
+    @property
+    def enabled(self) -> bool:
+        return settings.cloud_prefetch_hourly_budget > 0
+
+    def record(self, *key):
+        """Note a request for key (the cached function's positional arguments)"""
+        if self.enabled:
+            self.popularity.record(key)
+
+    def _budget_key(self) -> str:
+        return f"prefetch_budget:{self.name}:{int(time.time() // 3600)}"
+
+    def _local_spent(self) -> int:
+        now = time.time()
+        while self._spent and self._spent[0] <= now - 3600:
+            self._spent.popleft()
+        return len(self._spent)
+
+    async def _take_budget(self) -> bool:
+        """Spend one call from the hourly budget; False once it is used up"""
+        client = cache.get_async_redis()
+        if client is not None:
+            try:
+                key = self._budget_key()
+                spent = await client.incr(key)
+                if spent == 1:
+                    await client.expire(key, 3600)
+                return spent <= settings.cloud_prefetch_hourly_budget
+            except Exception as e:
+                logger.error(f"Prefetch budget error, using the per-process budget: {e}")
+
+        if self._local_spent() >= settings.cloud_prefetch_hourly_budget:
+            return False
+        self._spent.append(time.time())
+        return True
+
+    async def budget_remaining(self) -> int:
+        spent = None
+        client = cache.get_async_redis()
+        if client is not None:
+            try:
+                spent = int(await client.get(self._budget_key()) or 0)
+            except Exception as e:
+                logger.error(f"Prefetch budget error: {e}")
+        if spent is None:
+            spent = self._local_spent()
+        return max(0, settings.cloud_prefetch_hourly_budget - spent)
+
+    def _has_headroom(self) -> bool:
+        """Whether the provider's rate limit has room to spare for users"""
+        if self.provider is None:
+            return True
+        bucket = self.provider.bucket
+        return bucket.available() >= bucket.burst * settings.cloud_prefetch_min_headroom_percent / 100
+
+    async def run_once(self) -> int:
+        """One prefetch pass over the hottest keys; returns how many entries were refreshed"""
+        self.passes += 1
+        due_after = self.soft_ttl_seconds - settings.cloud_prefetch_lead_seconds
+        refreshed = 0
+
+        for key, _ in self.popularity.top(settings.cloud_prefetch_max_keys, settings.cloud_prefetch_min_score):
+            age = await self.cached_func.entry_age(*key)
+            if age is not None and age < due_after:
+                self.skipped_fresh += 1
+                continue
+
+            if not self._has_headroom():
+                self.skipped_busy += 1
+                break
+            if not await self._take_budget():
+                self.skipped_budget += 1
+                break
+
+            if not await self.cached_func.prefetch(*key):
+                self.failed += 1
+                logger.warning(f"{self.name} prefetch failed for {key}; pausing until the next pass")
+                break
+            refreshed += 1
+            self.prefetched += 1
+
+        if refreshed:
+            logger.debug(f"↻ Prefetched {refreshed} {self.name} entries")
+        return refreshed
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"{self.name} prefetch pass failed: {e}")
+                import traceback
+                traceback.print_exc()
+            await asyncio.sleep(settings.cloud_prefetch_interval_seconds)
+
+    def start(self):
+        """Start the background prefetch task (FastAPI startup); no-op without a budget"""
+        if not self.enabled or self._task is not None:
+            return
+        self._task = asyncio.get_running_loop().create_task(self._loop())
+        logger.info(f"{self.name} prefetching every {settings.cloud_prefetch_interval_seconds}s, "
+                    f"budget {settings.cloud_prefetch_hourly_budget} calls/hour")
+
+    async def stop(self):
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def get_stats(self) -> dict:
+        function_stats = cache_stats.get_stats()["by_function"].get(self.cached_func.__name__, {})
+        hits = function_stats.get("hits", 0)
+        prefetch_hits = function_stats.get("prefetch_hits", 0)
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "tracked_keys": len(self.popularity),
+            "hottest": [
+                {"key": list(key), "score": round(score, 2)}
+                for key, score in self.popularity.top(10, settings.cloud_prefetch_min_score)
+            ],
+            "passes": self.passes,
+            "prefetched": self.prefetched,
+            "failed": self.failed,
+            "skipped_fresh": self.skipped_fresh,
+            "skipped_budget": self.skipped_budget,
+            "skipped_busy": self.skipped_busy,
+            "budget_per_hour": settings.cloud_prefetch_hourly_budget,
+            "budget_remaining": await self.budget_remaining(),
+            # Cache hits that would have been misses or stale hits without prefetching
+            "prefetch_hits": prefetch_hits,
+            "prefetch_hit_percent": round(prefetch_hits / hits * 100, 2) if hits > 0 else 0
+        }
@@ -1,2 +1,9 @@
+from typing import List, Optional
+import numpy as np
+
 def relative_weight(val: int, *args: int) -> float:
     return val / max(sum([val, *args]), 1)
+
+def nan_to_none(values: np.ndarray) -> List[Optional[float]]:
+    """Array values as Python floats, with NaN (unknown) as None"""
+    return [None if value != value else value for value in np.asarray(values, dtype=np.float64).tolist()]
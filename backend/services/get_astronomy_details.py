@@ -1,7 +1,7 @@
 import os
-import httpx
 from requests.auth import HTTPBasicAuth
 from dotenv import load_dotenv
+from services.outbound import get_provider
 
 async def get_astronomy_details(latitude, longitude, date, time="20:00:00"):
 
@@ -22,8 +22,9 @@ async def get_astronomy_details(latitude, longitude, date, time="20:00:00"):
     }
 
     try:
-        async with httpx.AsyncClient() as client:
+        async with get_provider("astronomy").call() as client:
             response = await client.get(endpoint_url, params=params, auth=HTTPBasicAuth(application_id, application_secret))
+            response.raise_for_status()
             response_json = response.json()
 
         celestial_bodies = {}
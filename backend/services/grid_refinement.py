@@ -0,0 +1,122 @@
+"""
+Coarse-to-fine evaluation of large search grids under a point budget
+"""
+import logging
+from typing import Awaitable, Callable
+import numpy as np
+from services.isochrone import SearchGrid
+
+logger = logging.getLogger(__name__)
+
+# Cells keep being refined while their optimistic score could reach this many best cells
+REFINE_TOP_CANDIDATES = 40
+
+# Neighbour offsets (in units of the current stride) used to estimate local variation
+_NEIGHBOURS = [(-1, 0), (1, 0), (0, -1), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1)]
+
+
+def _block_any(mask: np.ndarray, stride: int) -> np.ndarray:
+    """For each stride x stride block, whether any cell of mask is set"""
+    rows = -(-mask.shape[0] // stride) * stride
+    cols = -(-mask.shape[1] // stride) * stride
+    padded = np.zeros((rows, cols), dtype=bool)
+    padded[:mask.shape[0], :mask.shape[1]] = mask
+    return padded.reshape(rows // stride, stride, cols // stride, stride).any(axis=(1, 3))
+
+
+def _optimistic_scores(scores: np.ndarray, rows: np.ndarray, cols: np.ndarray, stride: int) -> np.ndarray:
+    """
+    Upper-bound estimate of the best score inside each cell's block: its own
+    score plus the largest change to an evaluated neighbour one stride away.
+    """
+    own = scores[rows, cols]
+    margin = np.zeros(len(rows))
+    for dr, dc in _NEIGHBOURS:
+        r, c = rows + dr * stride, cols + dc * stride
+        inside = (r >= 0) & (r < scores.shape[0]) & (c >= 0) & (c < scores.shape[1])
+        neighbour = np.full(len(rows), np.nan)
+        neighbour[inside] = scores[r[inside], c[inside]]
+        margin = np.fmax(margin, np.abs(neighbour - own))
+    return own + margin
+
+
+async def refine_search_grid(
+    grid: SearchGrid,
+    evaluate: Callable[[np.ndarray, np.ndarray], Awaitable[np.ndarray]],
+    point_budget: int,
+    top_candidates: int = REFINE_TOP_CANDIDATES
+) -> SearchGrid:
+    """
+    Evaluate a grid coarse-to-fine, refining only where the best spots can be.
+
+    The grid is first scored on a coarse sub-lattice (every 2^k-th cell, with
+    k chosen so this pass uses about a quarter of the budget). Each level then
+    halves the stride inside the blocks whose optimistic score could still
+    reach the top candidates, best blocks first, until the full resolution is
+    reached or the budget is spent. Grids already within the budget are
+    returned unchanged.
+
+    Args:
+        grid: Full-resolution search grid
+        evaluate: async evaluate(rows, cols) returning scores for those grid
+            cells (higher is better)
+        point_budget: Maximum number of cells to evaluate (0 = unlimited)
+        top_candidates: How many of the best cells refinement must preserve
+
+    Returns:
+        Grid with the same geometry whose mask holds only the evaluated
+        cells inside the search area
+    """
+    if point_budget <= 0 or grid.size <= point_budget:
+        return grid
+
+    stride = 2
+    while _block_any(grid.mask, stride).sum() > point_budget // 4:
+        stride *= 2
+
+    scores = np.full(grid.shape, np.nan)
+    evaluated = np.zeros(grid.shape, dtype=bool)
+
+    # Coarse pass: one anchor per block that touches the search area
+    block_rows, block_cols = np.nonzero(_block_any(grid.mask, stride))
+    rows, cols = block_rows * stride, block_cols * stride
+    scores[rows, cols] = await evaluate(rows, cols)
+    evaluated[rows, cols] = True
+    remaining = point_budget - len(rows)
+    levels = [(stride, len(rows))]
+
+    while stride > 1 and remaining > 0:
+        half = stride // 2
+        k = min(top_candidates, int(evaluated.sum()))
+        threshold = np.partition(scores[evaluated], -k)[-k]
+
+        bounds = _optimistic_scores(scores, rows, cols, stride)
+        order = np.argsort(-bounds, kind="stable")
+        order = order[bounds[order] >= threshold]
+        rows, cols = rows[order], cols[order]
+
+        # Each refined anchor splits into four half-stride anchors (itself plus three children)
+        child_rows = (rows[:, None] + np.array([0, 0, half, half])).ravel()
+        child_cols = (cols[:, None] + np.array([0, half, 0, half])).ravel()
+        inside = (child_rows < grid.shape[0]) & (child_cols < grid.shape[1])
+        child_rows, child_cols = child_rows[inside], child_cols[inside]
+        touches_area = _block_any(grid.mask, half)[child_rows // half, child_cols // half]
+        child_rows, child_cols = child_rows[touches_area], child_cols[touches_area]
+
+        new = ~evaluated[child_rows, child_cols]
+        new_rows, new_cols = child_rows[new][:remaining], child_cols[new][:remaining]
+        if len(new_rows) > 0:
+            scores[new_rows, new_cols] = await evaluate(new_rows, new_cols)
+            evaluated[new_rows, new_cols] = True
+            remaining -= len(new_rows)
+
+        keep = evaluated[child_rows, child_cols]
+        rows, cols = child_rows[keep], child_cols[keep]
+        stride = half
+        levels.append((stride, len(new_rows)))
+
+    logger.info(
+        f"Adaptive grid: evaluated {int(evaluated.sum())}/{grid.size} cells "
+        f"(stride, new cells per level: {levels})"
+    )
+    return SearchGrid(grid.origin_row, grid.origin_col, grid.spacing, evaluated & grid.mask, grid.lon_spacing)
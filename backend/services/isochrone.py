@@ -1,18 +1,77 @@
-import httpx
 from typing import List, Tuple, Optional
-from shapely.geometry import Point, Polygon
+from shapely.geometry import Polygon
 from shapely.ops import transform
+import shapely
+import numpy as np
 import math
 from config import settings
-from cache import cache_response
+from cache import cache_response, DegradedResult
+from services.road_graph import get_local_isochrone, get_road_graph
+from services.outbound import get_provider
 import logging
 
 logger = logging.getLogger(__name__)
 
 GLOBAL_GRID_SPACING_DEGREES = 0.02
 
-@cache_response(ttl_seconds=2592000, prefix="isochrone")
-async def get_isochrone_polygon(lat: float, lon: float, drive_time_minutes: int) -> dict:
+# Equal-area grids: longitude spacing is fixed per latitude band of this height,
+# so every search in a band shares one global lattice
+EQUAL_AREA_BAND_DEGREES = 5.0
+
+def simplify_to_vertex_budget(coords: List[List[float]], max_vertices: int) -> List[List[float]]:
+    """
+    Simplify a polygon ring until it has at most max_vertices vertices.
+
+    The tolerance starts at ~10 m and doubles until the ring fits, so
+    detailed isochrones lose only as much shape as the budget requires.
+    Coordinates are rounded to 5 decimals (~1 m) to keep cache entries small.
+    """
+    polygon = Polygon(coords)
+    tolerance = 0.0001
+    while len(polygon.exterior.coords) > max_vertices and tolerance < 1.0:
+        polygon = Polygon(coords).simplify(tolerance, preserve_topology=True)
+        tolerance *= 2
+    return [[round(x, 5), round(y, 5)] for x, y in polygon.exterior.coords]
+
+def nearest_ladder_step(drive_time_minutes: int, ladder: Tuple[int, ...]) -> int:
+    """Ladder range closest to the requested drive time (ties go to the longer range)"""
+    return min(ladder, key=lambda minutes: (abs(minutes - drive_time_minutes), -minutes))
+
+def isochrone_ladder() -> Tuple[int, ...]:
+    """
+    The configured ladder without steps above settings.isochrone_max_range_minutes
+    (the provider's limit). It is always fetched whole, under one cache key per origin.
+    """
+    ladder = tuple(sorted(minutes for minutes in settings.isochrone_ladder_minutes
+                          if minutes <= settings.isochrone_max_range_minutes))
+    return ladder or (settings.isochrone_max_range_minutes,)
+
+def served_drive_time_minutes(drive_time_minutes: int) -> int:
+    """
+    The drive time a search area is actually built for: the exact time with
+    the local road graph, otherwise the nearest ladder step, so requests
+    above the provider limit come back capped
+    """
+    if settings.isochrone_provider == "local":
+        return drive_time_minutes
+    return nearest_ladder_step(drive_time_minutes, isochrone_ladder())
+
+def _ladder_key(lat: float, lon: float, ladder: Tuple[int, ...]) -> str:
+    return f"{lat:.4f}:{lon:.4f}:{'-'.join(str(minutes) for minutes in ladder)}"
+
+@cache_response(ttl_seconds=2592000, prefix="isochrone", lock_timeout_seconds=31, key_builder=_ladder_key)
+async def get_isochrone_ladder(lat: float, lon: float, ladder: Tuple[int, ...]) -> dict:
+    """
+    Nested isochrones for every drive time in the ladder, from one
+    OpenRouteService call. Callers pass an origin already snapped with
+    snap_to_global_grid so nearby users share the cached entry.
+
+    Returns:
+        {"ranges": {"<minutes>": [[lon, lat], ...]}} with each ring
+        simplified to settings.isochrone_max_vertices. After an upstream
+        error "ranges" is empty, and that result is only negative-cached
+        briefly (see DegradedResult).
+    """
     url = "https://api.openrouteservice.org/v2/isochrones/driving-car"
 
     headers = {
@@ -22,18 +81,66 @@ async def get_isochrone_polygon(lat: float, lon: float, drive_time_minutes: int)
 
     body = {
         "locations": [[lon, lat]],
-        "range": [drive_time_minutes * 60],
+        "range": [minutes * 60 for minutes in ladder],
         "range_type": "time"
     }
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(url, json=body, headers=headers, timeout=30.0)
+        async with get_provider("openroute").call() as client:
+            response = await client.post(url, json=body, headers=headers)
             response.raise_for_status()
             data = response.json()
 
-        coords = data["features"][0]["geometry"]["coordinates"][0]
+        ranges = {}
+        for feature in data["features"]:
+            minutes = round(feature["properties"]["value"] / 60)
+            coords = feature["geometry"]["coordinates"][0]
+            ranges[str(minutes)] = simplify_to_vertex_budget(coords, settings.isochrone_max_vertices)
 
-        return {"coordinates": coords}
+        missing = [minutes for minutes in ladder if str(minutes) not in ranges]
+        if missing:
+            raise ValueError(f"Isochrone response is missing ranges {missing}")
+    except Exception as e:
+        raise DegradedResult({"ranges": {}}, f"OpenRouteService error: {e}")
+
+    return {"ranges": ranges}
+
+@cache_response(ttl_seconds=2592000, prefix="isochrone_local")
+async def get_offline_isochrone(lat: float, lon: float, drive_time_minutes: int) -> dict:
+    """Isochrone from the local road graph (see services.road_graph), simplified like ladder rings"""
+    coords = await get_local_isochrone(lat, lon, drive_time_minutes)
+    return {"coordinates": simplify_to_vertex_budget(coords, settings.isochrone_max_vertices)}
+
+async def get_isochrone_polygon(lat: float, lon: float, drive_time_minutes: int) -> dict:
+    """
+    Isochrone for a drive time. The origin is snapped to
+    settings.isochrone_origin_snap_degrees so nearby users share entries.
+
+    With isochrone_provider "openroute" it is served from the cached ladder,
+    the drive time snapped to the nearest ladder range (at most
+    settings.isochrone_max_range_minutes), so a slider only triggers one
+    upstream call per origin; if that call fails and a road graph is loaded,
+    the local graph answers instead. With "local" the road graph
+    is used for the exact drive time.
+    """
+    snapped_lat, snapped_lon = snap_to_global_grid(lat, lon, settings.isochrone_origin_snap_degrees)
+    try:
+        if settings.isochrone_provider == "local":
+            return await get_offline_isochrone(snapped_lat, snapped_lon, drive_time_minutes)
+
+        try:
+            ladder = isochrone_ladder()
+            step = nearest_ladder_step(drive_time_minutes, ladder)
+            if drive_time_minutes > ladder[-1]:
+                logger.warning(f"Drive time {drive_time_minutes} min exceeds the provider limit, capped to {step} min")
+            polygons = await get_isochrone_ladder(snapped_lat, snapped_lon, ladder)
+            if not polygons["ranges"]:
+                raise RuntimeError("OpenRouteService isochrones are unavailable")
+            return {"coordinates": polygons["ranges"][str(step)]}
+        except Exception as e:
+            if get_road_graph() is None:
+                raise
+            logger.warning(f"OpenRouteService isochrone failed, using local road graph: {e}")
+            return await get_offline_isochrone(snapped_lat, snapped_lon, drive_time_minutes)
     except Exception as e:
         logger.error(f"Error getting isochrone, falling back to point polygon: {e}")
         import traceback
@@ -86,36 +193,152 @@ def snap_to_global_grid(lat: float, lon: float, grid_spacing: float = GLOBAL_GRI
 
     return (snapped_lat, snapped_lon)
 
-def generate_grid_points(polygon: Polygon, grid_spacing_degrees: float = GLOBAL_GRID_SPACING_DEGREES) -> List[Tuple[float, float]]:
-    minlon, minlat, maxlon, maxlat = polygon.bounds
+def global_cell_id(lat: float, lon: float, grid_spacing: float = GLOBAL_GRID_SPACING_DEGREES) -> int:
+    """
+    Integer ID of the global grid cell a point snaps to.
 
-    start_lat = math.floor(minlat / grid_spacing_degrees) * grid_spacing_degrees
-    start_lon = math.floor(minlon / grid_spacing_degrees) * grid_spacing_degrees
-    end_lat = math.ceil(maxlat / grid_spacing_degrees) * grid_spacing_degrees
-    end_lon = math.ceil(maxlon / grid_spacing_degrees) * grid_spacing_degrees
+    Uses the same lattice as snap_to_global_grid, so coordinates that snap to
+    the same point (e.g. 38.96 and 38.960000001) share an ID. Cells are
+    numbered row-major from (-90, -180), which makes the ID a compact,
+    deterministic cache key.
+    """
+    row = round(lat / grid_spacing) + round(90 / grid_spacing)
+    col = round(lon / grid_spacing) + round(180 / grid_spacing)
+    cols_per_row = round(360 / grid_spacing) + 1
+    return row * cols_per_row + col
 
-    points = []
+def equal_area_lon_spacing(lat: float, grid_spacing: float = GLOBAL_GRID_SPACING_DEGREES) -> float:
+    """
+    Longitude spacing giving roughly square cells (in miles) at a latitude.
 
-    lat = start_lat
-    while lat <= end_lat:
-        lon = start_lon
-        while lon <= end_lon:
-            snapped_lat, snapped_lon = snap_to_global_grid(lat, lon, grid_spacing_degrees)
+    Longitude degrees shrink with cos(lat), so the spacing is widened by
+    1/cos of the centre of the latitude band (EQUAL_AREA_BAND_DEGREES) and
+    rounded to 0.001°. It is constant within a band, so grids in the same
+    band share a lattice, and never narrower than grid_spacing.
+    """
+    band_center = (math.floor(abs(lat) / EQUAL_AREA_BAND_DEGREES) + 0.5) * EQUAL_AREA_BAND_DEGREES
+    widened = grid_spacing / math.cos(math.radians(min(band_center, 85.0)))
+    return max(round(widened, 3), grid_spacing)
 
-            point = Point(snapped_lon, snapped_lat)
-            if polygon.contains(point) or polygon.boundary.distance(point) < grid_spacing_degrees * 0.1:
-                points.append((snapped_lat, snapped_lon))
-            lon += grid_spacing_degrees
-        lat += grid_spacing_degrees
+class SearchGrid:
+    """
+    Search area as a masked 2-D window of a global lattice.
 
-    points = list(set(points))
+    Cell (i, j) is at (origin_lat + i * spacing, origin_lon + j * lon_spacing)
+    and mask marks the cells covering the search polygon. Per-cell layers
+    (pollution, clouds, scores) are either 2-D arrays of the grid's shape or
+    flat arrays aligned with points(), which lists masked cells row-major.
+    """
 
-    if len(points) == 0:
-        center = polygon.centroid
-        center_snapped = snap_to_global_grid(center.y, center.x, grid_spacing_degrees)
-        points.append(center_snapped)
+    def __init__(self, origin_row: int, origin_col: int, spacing: float, mask: np.ndarray,
+                 lon_spacing: Optional[float] = None):
+        self.origin_row = origin_row  # Global lattice indices of cell (0, 0)
+        self.origin_col = origin_col
+        self.spacing = spacing
+        self.lon_spacing = lon_spacing or spacing
+        self.mask = mask
+
+    @classmethod
+    def from_polygon(cls, polygon: Polygon, grid_spacing_degrees: float = GLOBAL_GRID_SPACING_DEGREES,
+                     equal_area: bool = False) -> "SearchGrid":
+        """
+        Grid over a polygon's bounds. Cells are masked in if inside the polygon
+        or within a tenth of the spacing of its boundary, tested in bulk
+        against the prepared polygon; if none qualify, the cell holding the
+        centroid is used.
+
+        With equal_area, longitude spacing follows equal_area_lon_spacing for
+        the latitude band of the polygon's centroid, so point density per
+        square mile stays about the same at any latitude.
+        """
+        lon_spacing = grid_spacing_degrees
+        if equal_area:
+            lon_spacing = equal_area_lon_spacing(polygon.centroid.y, grid_spacing_degrees)
+
+        minlon, minlat, maxlon, maxlat = polygon.bounds
+        origin_row = math.floor(minlat / grid_spacing_degrees)
+        origin_col = math.floor(minlon / lon_spacing)
+        shape = (math.ceil(maxlat / grid_spacing_degrees) - origin_row + 1,
+                 math.ceil(maxlon / lon_spacing) - origin_col + 1)
+        grid = cls(origin_row, origin_col, grid_spacing_degrees, np.zeros(shape, dtype=bool), lon_spacing)
+
+        lats, lons = np.meshgrid(grid.lats, grid.lons, indexing="ij")
+        lats, lons = lats.ravel(), lons.ravel()
+
+        shapely.prepare(polygon)
+        keep = shapely.contains_xy(polygon, lons, lats)
+
+        # Points just outside still count if they sit on the boundary. A slightly
+        # wider buffer narrows the candidates before the exact distance test.
+        tolerance = grid_spacing_degrees * 0.1
+        near = polygon.buffer(tolerance * 1.5)
+        shapely.prepare(near)
+        candidates = np.flatnonzero(~keep & shapely.contains_xy(near, lons, lats))
+        if len(candidates) > 0:
+            keep[candidates] = shapely.dwithin(polygon.boundary, shapely.points(lons[candidates], lats[candidates]), tolerance)
+
+        grid.mask = keep.reshape(shape)
+
+        if not grid.mask.any():
+            center = polygon.centroid
+            row = round(center.y / grid_spacing_degrees) - origin_row
+            col = round(center.x / lon_spacing) - origin_col
+            grid.mask[min(max(row, 0), shape[0] - 1), min(max(col, 0), shape[1] - 1)] = True
+
+        return grid
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return self.mask.shape
+
+    @property
+    def size(self) -> int:
+        """Number of masked-in cells"""
+        return int(self.mask.sum())
+
+    @property
+    def lats(self) -> np.ndarray:
+        """Latitude of each row, matching snap_to_global_grid exactly"""
+        return np.round((self.origin_row + np.arange(self.shape[0])) * self.spacing, 6)
+
+    @property
+    def lons(self) -> np.ndarray:
+        """Longitude of each column"""
+        return np.round((self.origin_col + np.arange(self.shape[1])) * self.lon_spacing, 6)
+
+    @property
+    def origin_lat(self) -> float:
+        return float(self.lats[0])
+
+    @property
+    def origin_lon(self) -> float:
+        return float(self.lons[0])
+
+    def points(self) -> np.ndarray:
+        """(N, 2) array of (lat, lon) for masked-in cells, row-major"""
+        rows, cols = np.nonzero(self.mask)
+        return np.column_stack([self.lats[rows], self.lons[cols]])
+
+    def scatter(self, values, fill: float = np.nan) -> np.ndarray:
+        """2-D layer from values aligned with points(); cells outside the mask get fill"""
+        layer = np.full(self.shape, fill, dtype=np.float64)
+        layer[self.mask] = values
+        return layer
+
+    def gather(self, layer: np.ndarray) -> np.ndarray:
+        """Values of a 2-D layer at the masked-in cells, aligned with points()"""
+        return layer[self.mask]
+
+def generate_grid_array(polygon: Polygon, grid_spacing_degrees: float = GLOBAL_GRID_SPACING_DEGREES) -> np.ndarray:
+    """
+    Global-lattice points covering a polygon, as an (N, 2) array of (lat, lon)
+    ordered row-major: by latitude, then longitude, ascending.
+    """
+    return SearchGrid.from_polygon(polygon, grid_spacing_degrees).points()
 
-    return points
+def generate_grid_points(polygon: Polygon, grid_spacing_degrees: float = GLOBAL_GRID_SPACING_DEGREES) -> List[Tuple[float, float]]:
+    """Global-lattice (lat, lon) points covering a polygon, row-major (see generate_grid_array)"""
+    return [tuple(point) for point in generate_grid_array(polygon, grid_spacing_degrees).tolist()]
 
 def generate_coarse_grid(polygon: Polygon) -> List[Tuple[float, float]]:
     return generate_grid_points(polygon, grid_spacing_degrees=0.1)
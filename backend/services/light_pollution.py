@@ -1,7 +1,9 @@
 import logging
-from typing import Optional
-from cache import cache_response
+from typing import List, Tuple
+from cache import cache_tiles
 from config import settings
+from services.raster_executor import raster_executor
+from services.isochrone import SearchGrid
 import rasterio
 from rasterio.session import AWSSession
 from rasterio.transform import rowcol
@@ -13,6 +15,10 @@ logger = logging.getLogger(__name__)
 _light_pollution_dataset = None
 _dataset_stats = None
 
+# Cache precision: lookups snap to the 0.01° global lattice (~0.7 mi, a few
+# VIIRS pixels) and are cached as tiles of uint16 scores (±8e-6)
+LIGHT_POLLUTION_CELL_DEGREES = 0.01
+
 def load_light_pollution_data():
     global _light_pollution_dataset, _dataset_stats
 
@@ -62,78 +68,115 @@ def close_light_pollution_data():
         logger.info("Light pollution dataset closed")
 
 
-@cache_response(ttl_seconds=31536000, prefix="light_pollution")
-async def _get_light_pollution_score_cached(lat: float, lon: float) -> float:
+def _radiance_to_score(radiance):
     """
-    Get light pollution score (0-1) for a location.
+    Convert VIIRS radiance (scalar or array) to a 0-1 pollution score.
+
+    Logarithmic scaling:
+        radiance=0.1 -> score≈0.15 (dark rural)
+        radiance=1.0 -> score≈0.4 (suburban)
+        radiance=10 -> score≈0.65 (city)
+        radiance=100 -> score≈0.9 (bright city center)
+    """
+    radiance = np.maximum(radiance, 0)  # radiance <= 0 -> score 0.0
+    return np.clip(np.log10(radiance + 1) / 2.3, 0.0, 1.0)
+
+def _read_light_pollution_window(dataset, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """
+    Read radiance-based scores for many points with one windowed raster read
+    (runs on a raster worker thread).
 
     Returns:
-        float: Pollution score from 0 (darkest) to 1 (brightest)
+        Array of scores aligned with the inputs, NaN where the point is out of
+        bounds or the pixel is NoData (callers fall back to the distance model)
     """
-    global _light_pollution_dataset
+    scores = np.full(len(lats), np.nan)
+
+    rows, cols = rowcol(dataset.transform, lons, lats)
+    rows = np.asarray(rows, dtype=np.int64)
+    cols = np.asarray(cols, dtype=np.int64)
+
+    in_bounds = (rows >= 0) & (rows < dataset.height) & (cols >= 0) & (cols < dataset.width)
+    if not in_bounds.any():
+        return scores
+
+    rows = rows[in_bounds]
+    cols = cols[in_bounds]
+    min_row, max_row = int(rows.min()), int(rows.max())
+    min_col, max_col = int(cols.min()), int(cols.max())
+
+    # One read covering every point; masked=True masks the dataset's NoData value
+    window = ((min_row, max_row + 1), (min_col, max_col + 1))
+    raster_data = dataset.read(1, window=window, masked=True)
+
+    radiance = np.ma.masked_invalid(raster_data[rows - min_row, cols - min_col])
+    valid = ~np.ma.getmaskarray(radiance)
+
+    scores[in_bounds] = np.where(valid, _radiance_to_score(radiance.filled(0)), np.nan)
+    return scores
+
+@cache_tiles(ttl_seconds=31536000, prefix="light_pollution", cell_degrees=LIGHT_POLLUTION_CELL_DEGREES)
+async def _get_light_pollution_tile(lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """
+    Compute pollution scores for every cell of a cache tile with one raster read.
+
+    Out of bounds or NoData cells use the distance-based model; raster errors
+    propagate uncached.
+    """
+    scores = await raster_executor.run(
+        _light_pollution_dataset.name, _read_light_pollution_window, lats, lons
+    )
+
+    fallback = np.isnan(scores)
+    if fallback.any():
+        logger.debug(f"Using distance fallback for {fallback.sum()}/{len(lats)} points")
+        scores[fallback] = _distance_based_scores(lats[fallback], lons[fallback])
+
+    return scores
+
+async def _get_light_pollution_scores(points: List[Tuple[float, float]]) -> np.ndarray:
+    """Scores from the cached tiles, or the uncached distance model without a readable dataset"""
+    if len(points) == 0:
+        return np.empty(0)
 
     if _light_pollution_dataset is not None:
         try:
-            # Convert lat/lon to raster coordinates
-            row, col = rowcol(_light_pollution_dataset.transform, lon, lat)
-
-            # Check if coordinates are within bounds
-            if not (0 <= row < _light_pollution_dataset.height and 0 <= col < _light_pollution_dataset.width):
-                logger.debug(f"Coordinates ({lat}, {lon}) -> pixel ({row}, {col}) out of bounds "
-                           f"(dataset size: {_light_pollution_dataset.width}x{_light_pollution_dataset.height})")
-                return await _get_distance_based_score(lat, lon)
-
-            # Read the radiance value
-            radiance = _light_pollution_dataset.read(1, window=((row, row+1), (col, col+1)))[0, 0]
-
-            # Check for NoData
-            if radiance == _light_pollution_dataset.nodata or np.isnan(radiance):
-                logger.debug(f"NoData at ({lat}, {lon}) -> pixel ({row}, {col}), using fallback")
-                return await _get_distance_based_score(lat, lon)
-
-            # Log raw value occasionally for debugging
-            if np.random.random() < 0.01:  # 1% of the time
-                logger.debug(f"Sample: ({lat:.4f}, {lon:.4f}) -> radiance={radiance:.4f}")
-
-            # VIIRS data is in nanoWatts/cm²/sr
-            # Typical range: 0-100+ for bright cities, 0.1-10 for rural/suburban
-            # We'll use a logarithmic scale to compress the range
-
-            if radiance <= 0:
-                score = 0.0
-            else:
-                # Logarithmic scaling:
-                # radiance=0.1 -> score≈0.15 (dark rural)
-                # radiance=1.0 -> score≈0.4 (suburban)
-                # radiance=10 -> score≈0.65 (city)
-                # radiance=100 -> score≈0.9 (bright city center)
-                score = np.log10(radiance + 1) / 2.3
-                score = min(1.0, max(0.0, score))
-
-            return float(score)
-
+            return await _get_light_pollution_tile(points)
         except Exception as e:
-            logger.error(f"Error reading raster at ({lat}, {lon}): {e}")
+            logger.error(f"Error in raster read for {len(points)} points: {e}")
             logger.debug(f"Dataset stats: {_dataset_stats}")
             import traceback
             traceback.print_exc()
 
-    # Fallback to distance-based model
-    return await _get_distance_based_score(lat, lon)
+    coords = np.asarray(points, dtype=np.float64)
+    return _distance_based_scores(coords[:, 0], coords[:, 1])
 
 async def get_light_pollution_score(lat: float, lon: float) -> float:
-    lat_rounded = round(lat, 2)
-    lon_rounded = round(lon, 2)
+    """
+    Get light pollution score (0-1) for a location.
 
-    if np.random.random() < 0.01:  # 1% of requests
-        logger.debug(
-            f"Coordinate rounding: ({lat:.5f}, {lon:.5f}) → "
-            f"({lat_rounded:.2f}, {lon_rounded:.2f})"
-        )
+    Returns:
+        float: Pollution score from 0 (darkest) to 1 (brightest)
+    """
+    return float((await _get_light_pollution_scores([(lat, lon)]))[0])
 
-    return await _get_light_pollution_score_cached(lat_rounded, lon_rounded)
+async def get_light_pollution_scores_batch(points: List[Tuple[float, float]]) -> List[float]:
+    """
+    Get light pollution scores for multiple points efficiently.
+
+    Points snap to the 0.01° global lattice and are served from the few
+    cached tiles they fall in; a missing tile costs one raster window read.
+
+    Returns:
+        List of pollution scores (0-1), one per input point
+    """
+    return (await _get_light_pollution_scores(points)).tolist()
+
+async def get_light_pollution_grid(grid: SearchGrid) -> np.ndarray:
+    """Pollution scores (0-1) as a layer of the grid's shape, NaN outside its mask"""
+    return grid.scatter(await _get_light_pollution_scores(grid.points()))
 
-async def _get_distance_based_score(lat: float, lon: float) -> float:
+def _distance_based_scores(lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
     """
     Fallback: Simple distance-based light pollution estimate.
 
@@ -149,18 +192,27 @@ async def _get_distance_based_score(lat: float, lon: float) -> float:
         (38.9517, -92.3341, 0.7),  # Columbia MO
     ]
 
-    min_pollution = 0.1
+    min_pollution = np.full(len(lats), 0.1)
 
     for city_lat, city_lon, city_intensity in cities:
-        distance = ((lat - city_lat)**2 + (lon - city_lon)**2)**0.5
+        distance = np.hypot(lats - city_lat, lons - city_lon)
         # Distance in degrees, roughly 69 miles per degree
         distance_miles = distance * 69
 
-        if distance_miles < 100:
-            pollution_contribution = city_intensity * (1 - (distance_miles / 100))
-            min_pollution = max(min_pollution, pollution_contribution)
+        pollution_contribution = np.where(distance_miles < 100, city_intensity * (1 - (distance_miles / 100)), 0.0)
+        min_pollution = np.maximum(min_pollution, pollution_contribution)
+
+    return np.clip(min_pollution, 0.0, 1.0)
+
+# Upper pollution score of Bortle classes 1-8; anything brighter is class 9
+BORTLE_THRESHOLDS = (0.10, 0.20, 0.30, 0.40, 0.50, 0.60, 0.75, 0.90)
 
-    return min(max(min_pollution, 0.0), 1.0)
+def pollution_score_to_bortle(score: float) -> int:
+    """Approximate Bortle dark-sky class (1 = darkest, 9 = inner city) for a pollution score"""
+    for bortle, upper in enumerate(BORTLE_THRESHOLDS, start=1):
+        if score < upper:
+            return bortle
+    return 9
 
 def get_quality_description(score: float) -> str:
     if score <= 0.15:
@@ -0,0 +1,290 @@
+"""
+Shared guard for outbound HTTP providers: pooled clients, rate limiting,
+concurrency caps and circuit breaking
+"""
+import asyncio
+import logging
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+import httpx
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+try:
+    import h2  # noqa: F401 (optional: enables HTTP/2 in httpx)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# Per-provider limits, sized to each API's quota: sustained calls per second, burst,
+# concurrent calls (also the keep-alive pool size) and read timeout
+PROVIDER_LIMITS = {
+    "openweather": {"rate_per_second": 1.0, "burst": 20, "max_concurrency": 10, "timeout_seconds": 5.0},  # 60/min
+    "openroute": {"rate_per_second": 0.33, "burst": 5, "max_concurrency": 4, "timeout_seconds": 30.0},    # 20/min
+    "google_places": {"rate_per_second": 10.0, "burst": 20, "max_concurrency": 10, "timeout_seconds": 10.0},
+    "astronomy": {"rate_per_second": 2.0, "burst": 5, "max_concurrency": 4, "timeout_seconds": 10.0},
+}
+
+
+class ProviderUnavailable(Exception):
+    """An outbound call was refused locally, without reaching the provider"""
+
+    def __init__(self, provider: str, reason: str):
+        super().__init__(f"{provider}: {reason}")
+        self.provider = provider
+
+
+class CircuitOpenError(ProviderUnavailable):
+    pass
+
+
+class RateLimitExceeded(ProviderUnavailable):
+    pass
+
+
+class TokenBucket:
+    """
+    Token bucket allowing rate_per_second calls on average and bursts of up to
+    burst calls. Callers reserve a token and sleep until it is theirs, so
+    waiting calls are served in arrival order.
+    """
+
+    def __init__(self, rate_per_second: float, burst: int):
+        self.rate = rate_per_second
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def available(self) -> float:
+        """Tokens currently in the bucket, without taking one"""
+        with self._lock:
+            return min(self.burst, self.tokens + (time.monotonic() - self.updated) * self.rate)
+
+    def reserve(self, max_wait_seconds: float) -> Optional[float]:
+        """Take a token; returns how long to wait for it, or None if that exceeds max_wait_seconds"""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+            wait = max(0.0, (1 - self.tokens) / self.rate)
+            if wait > max_wait_seconds:
+                return None
+            self.tokens -= 1
+            return wait
+
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive failures so calls fail fast.
+    After recovery_seconds one probe call is let through (half-open): success
+    closes the breaker, failure keeps it open for another recovery period.
+    """
+
+    def __init__(self, failure_threshold: int, recovery_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.recovery_seconds = recovery_seconds
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.recovery_seconds:
+                self.state = "half_open"
+            if self.state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.consecutive_failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            self._probing = False
+            if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+                if self.state != "open":
+                    self.times_opened += 1
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+    def release_probe(self):
+        """A probe ended without a verdict (e.g. cancelled); let the next call probe instead"""
+        with self._lock:
+            self._probing = False
+
+
+def _is_provider_failure(error: BaseException) -> bool:
+    """
+    Errors that say the provider is unhealthy: transport errors, timeouts, 5xx
+    and 429. Other 4xx responses and our own errors (e.g. parsing a response)
+    are not the provider's fault.
+    """
+    if isinstance(error, httpx.HTTPStatusError):
+        status = error.response.status_code
+        return status >= 500 or status == 429
+    return isinstance(error, (httpx.TransportError, asyncio.TimeoutError))
+
+
+class Provider:
+    """Pooled HTTP client, rate limiter, concurrency cap and circuit breaker for one upstream API"""
+
+    def __init__(self, name: str, rate_per_second: float, burst: int, max_concurrency: int,
+                 failure_threshold: int, recovery_seconds: float, timeout_seconds: float = 10.0):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self.timeout_seconds = timeout_seconds
+        self.bucket = TokenBucket(rate_per_second, burst)
+        self.breaker = CircuitBreaker(failure_threshold, recovery_seconds)
+        # asyncio primitives and connections belong to one event loop; recreated if the loop changes
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._semaphore_loop = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._client_loop = None
+
+        self.in_flight = 0
+        self.calls = 0
+        self.failures = 0
+        self.rejected_open = 0
+        self.rejected_rate_limit = 0
+        self.total_wait_seconds = 0.0
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._semaphore_loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._semaphore_loop = loop
+        return self._semaphore
+
+    def get_client(self) -> httpx.AsyncClient:
+        """The provider's keep-alive client, created on first use (normally at startup)"""
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client.is_closed or self._client_loop is not loop:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout_seconds, connect=settings.outbound_connect_timeout_seconds),
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency,
+                    max_keepalive_connections=self.max_concurrency,
+                    keepalive_expiry=settings.outbound_keepalive_seconds
+                ),
+                http2=settings.outbound_http2 and HTTP2_AVAILABLE
+            )
+            self._client_loop = loop
+        return self._client
+
+    async def close(self):
+        client, self._client = self._client, None
+        if client is not None and not client.is_closed and self._client_loop is asyncio.get_running_loop():
+            await client.aclose()
+
+    @asynccontextmanager
+    async def call(self):
+        """
+        Guard one outbound call and lend the provider's pooled client:
+
+            async with get_provider("openweather").call() as client:
+                response = await client.get(...)
+
+        Raises CircuitOpenError or RateLimitExceeded (both ProviderUnavailable)
+        instead of calling a provider that is down or over its quota.
+        """
+        if not self.breaker.allow():
+            self.rejected_open += 1
+            raise CircuitOpenError(self.name, "circuit open")
+
+        wait = self.bucket.reserve(settings.outbound_max_wait_seconds)
+        if wait is None:
+            self.rejected_rate_limit += 1
+            self.breaker.release_probe()
+            raise RateLimitExceeded(self.name, "rate limit exceeded")
+
+        start = time.monotonic()
+        try:
+            if wait > 0:
+                await asyncio.sleep(wait)
+            async with self._get_semaphore():
+                self.total_wait_seconds += time.monotonic() - start
+                self.in_flight += 1
+                self.calls += 1
+                try:
+                    yield self.get_client()
+                finally:
+                    self.in_flight -= 1
+        except BaseException as e:
+            if _is_provider_failure(e):
+                self.failures += 1
+                self.breaker.record_failure()
+                if self.breaker.state == "open":
+                    logger.warning(f"Circuit open for {self.name} after {self.breaker.consecutive_failures} failures: {e}")
+            elif isinstance(e, httpx.HTTPStatusError):
+                self.breaker.record_success()  # The provider answered
+            else:
+                self.breaker.release_probe()  # Cancelled or failed on our side: no verdict
+            raise
+        else:
+            self.breaker.record_success()
+
+    def get_stats(self) -> dict:
+        return {
+            "state": self.breaker.state,
+            "consecutive_failures": self.breaker.consecutive_failures,
+            "times_opened": self.breaker.times_opened,
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "tokens_available": round(max(self.bucket.tokens, 0.0), 2),
+            "rate_per_second": self.bucket.rate,
+            "calls": self.calls,
+            "failures": self.failures,
+            "rejected_open": self.rejected_open,
+            "rejected_rate_limit": self.rejected_rate_limit,
+            "avg_wait_ms": round(self.total_wait_seconds / self.calls * 1000, 2) if self.calls else 0.0
+        }
+
+
+_providers: Dict[str, Provider] = {}
+_providers_lock = threading.Lock()
+
+
+def get_provider(name: str) -> Provider:
+    with _providers_lock:
+        provider = _providers.get(name)
+        if provider is None:
+            provider = Provider(
+                name,
+                failure_threshold=settings.outbound_failure_threshold,
+                recovery_seconds=settings.outbound_recovery_seconds,
+                **PROVIDER_LIMITS[name]
+            )
+            _providers[name] = provider
+        return provider
+
+
+def get_provider_stats() -> dict:
+    return {name: get_provider(name).get_stats() for name in PROVIDER_LIMITS}
+
+
+async def start_http_clients():
+    """Open every provider's connection pool up front (FastAPI startup)"""
+    for name in PROVIDER_LIMITS:
+        get_provider(name).get_client()
+    if settings.outbound_http2 and not HTTP2_AVAILABLE:
+        logger.info("HTTP/2 requested but the h2 package is not installed; using HTTP/1.1 keep-alive")
+
+
+async def close_http_clients():
+    for provider in list(_providers.values()):
+        await provider.close()
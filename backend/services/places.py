@@ -1,11 +1,21 @@
-import httpx
+import numpy as np
 from typing import List, Tuple, Optional
 import logging
 from config import settings
-from cache import cache_response
+from cache import cache_response, DegradedResult
+from services.isochrone import global_cell_id
+from services.conversion_utils import nan_to_none
+from services.outbound import get_provider
 
 logger = logging.getLogger(__name__)
 
+# Cache precision: searches are snapped to 0.1° (~7 mi) and keyed by that
+# global grid cell plus the search radius
+PLACES_CELL_DEGREES = 0.1
+
+def _cell_key(lat: float, lon: float, radius_meters: int = 8000) -> str:
+    return f"{global_cell_id(lat, lon, PLACES_CELL_DEGREES)}:{radius_meters}"
+
 EXCLUDED_KEYWORDS = [
     'advertising', 'construction', 'storage', 'concrete', 'church',
     'hotel', 'motel', 'gas station', 'store', 'shop', 'restaurant',
@@ -66,6 +76,31 @@ def calculate_stargazing_score(
 
     return combined_score
 
+def calculate_stargazing_scores(
+    pollution_scores: np.ndarray,
+    cloud_covers: np.ndarray,
+    tree_densities: np.ndarray,
+    pollution_weight: float = 0.6,
+    cloud_weight: float = 0.3,
+    tree_weight: float = 0.1
+) -> np.ndarray:
+    """
+    Vectorized calculate_stargazing_score over aligned arrays (flat or 2-D).
+
+    NaN cloud cover or tree density means unknown and scores as neutral 0.5,
+    like None does for a single point; NaN pollution (outside a grid's mask)
+    gives a NaN score.
+    """
+    pollution_quality = 1.0 - np.asarray(pollution_scores, dtype=np.float64)
+    cloud_quality = np.nan_to_num(1.0 - np.asarray(cloud_covers, dtype=np.float64) / 100.0, nan=0.5)
+    tree_quality = np.nan_to_num(1.0 - np.asarray(tree_densities, dtype=np.float64), nan=0.5)
+
+    return (
+        (pollution_quality * pollution_weight) +
+        (cloud_quality * cloud_weight) +
+        (tree_quality * tree_weight)
+    )
+
 async def search_nearby_places(lat: float, lon: float, radius_meters: int = 5000) -> List[dict]:
     # Snap to coarse grid - places don't change that much over ~7 miles
     lat_rounded = round(lat, 1)
@@ -75,7 +110,7 @@ async def search_nearby_places(lat: float, lon: float, radius_meters: int = 5000
     # and in actual API request
     return await _search_nearby_places_impl(lat_rounded, lon_rounded, radius_meters)
 
-@cache_response(ttl_seconds=31536000, prefix="places")
+@cache_response(ttl_seconds=31536000, prefix="places", lock_timeout_seconds=11, key_builder=_cell_key)
 async def _search_nearby_places_impl(lat: float, lon: float, radius_meters: int = 8000) -> List[dict]:
     if not settings.google_places_api_key or settings.google_places_api_key == "dummy_key_for_testing":
         logger.warning("Google Places API key not configured")
@@ -107,8 +142,8 @@ async def _search_nearby_places_impl(lat: float, lon: float, radius_meters: int
     places = []
 
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(url, json=body, headers=headers, timeout=10.0)
+        async with get_provider("google_places").call() as client:
+            response = await client.post(url, json=body, headers=headers)
             response.raise_for_status()
             data = response.json()
 
@@ -135,7 +170,7 @@ async def _search_nearby_places_impl(lat: float, lon: float, radius_meters: int
                     })
     except Exception as e:
         logger.error(f"Error searching for places: {e}")
-        return []
+        raise DegradedResult([], f"Google Places error: {e}")
 
     return places
 
@@ -149,27 +184,32 @@ async def find_best_stargazing_spots(
     cloud_weight: float = 0.25,
     tree_weight: float = 0.25
 ) -> List[dict]:
-    if cloud_covers is None:
-        cloud_covers = [None] * len(grid_points)
-    if tree_density_scores is None:
-        tree_density_scores = [None] * len(grid_points)
-
-    combined_scores = [
-        calculate_stargazing_score(
-            pollution,
-            cloud,
-            tree_density,
-            pollution_weight,
-            cloud_weight,
-            tree_weight
-        )
-        for pollution, cloud, tree_density in zip(pollution_scores, cloud_covers, tree_density_scores)
-    ]
-
-    sorted_points = sorted(
-        zip(grid_points, pollution_scores, cloud_covers, tree_density_scores, combined_scores),
-        key=lambda x: x[4],
-        reverse=True
+    # None (unknown) becomes NaN, which scores as neutral
+    pollution_scores = np.asarray(pollution_scores, dtype=np.float64)
+    cloud_covers = np.asarray(
+        [None] * len(pollution_scores) if cloud_covers is None else cloud_covers, dtype=np.float64
+    )
+    tree_density_scores = np.asarray(
+        [None] * len(pollution_scores) if tree_density_scores is None else tree_density_scores, dtype=np.float64
+    )
+
+    combined_scores = calculate_stargazing_scores(
+        pollution_scores,
+        cloud_covers,
+        tree_density_scores,
+        pollution_weight,
+        cloud_weight,
+        tree_weight
+    )
+
+    # Ten best cells, highest score first (stable, so ties keep grid order)
+    best_indices = np.argsort(-combined_scores, kind="stable")[:10]
+    sorted_points = zip(
+        [tuple(grid_points[i]) for i in best_indices],
+        pollution_scores[best_indices].tolist(),
+        nan_to_none(cloud_covers[best_indices]),
+        nan_to_none(tree_density_scores[best_indices]),
+        combined_scores[best_indices].tolist()
     )
 
     recommended_spots = []
@@ -177,8 +217,8 @@ async def find_best_stargazing_spots(
 
     priority_types = ['campground', 'park', 'point_of_interest']
 
-    for (lat, lon), pollution, cloud, tree_density, combined_score in sorted_points[:10]:
-        places = await search_nearby_places(lat, lon, radius_meters=8000)
+    for (lat, lon), pollution, cloud, tree_density, combined_score in sorted_points:
+        places = await search_nearby_places(float(lat), float(lon), radius_meters=8000)
 
         def place_priority(place):
             try:
@@ -0,0 +1,135 @@
+"""
+Bounded thread pool for blocking raster I/O, keeping rasterio reads off the event loop
+"""
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+import rasterio
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class RasterExecutor:
+    """
+    Runs raster reads on a dedicated pool of worker threads.
+
+    rasterio dataset handles are not thread-safe, so every worker lazily
+    opens its own handle per dataset path and reuses it for later tasks.
+    """
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._local = threading.local()
+        self._handles = []  # Every per-thread handle, so shutdown can close them
+        self._lock = threading.Lock()
+
+        self.queued = 0
+        self.active = 0
+        self.completed = 0
+        self.failed = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix="raster-io"
+                )
+            return self._executor
+
+    def _get_dataset(self, path: str):
+        """Return this worker thread's handle for a dataset, opening it on first use"""
+        datasets = getattr(self._local, "datasets", None)
+        if datasets is None:
+            datasets = self._local.datasets = {}
+
+        dataset = datasets.get(path)
+        if dataset is None or dataset.closed:
+            dataset = rasterio.open(path)
+            datasets[path] = dataset
+            with self._lock:
+                self._handles.append(dataset)
+            logger.debug(f"Opened {path} on {threading.current_thread().name}")
+        return dataset
+
+    def _call(self, submitted_at: float, path: str, func: Callable, args: tuple) -> Any:
+        wait = time.monotonic() - submitted_at
+        with self._lock:
+            self.queued -= 1
+            self.active += 1
+            self.total_wait_seconds += wait
+            self.max_wait_seconds = max(self.max_wait_seconds, wait)
+
+        try:
+            result = func(self._get_dataset(path), *args)
+        except Exception:
+            with self._lock:
+                self.failed += 1
+            raise
+        finally:
+            with self._lock:
+                self.active -= 1
+                self.completed += 1
+
+        return result
+
+    async def run(self, path: str, func: Callable, *args) -> Any:
+        """
+        Run func(dataset, *args) on a raster worker thread.
+
+        Args:
+            path: Dataset path or URL (a handle is opened per worker thread)
+            func: Blocking function taking the dataset handle as first argument
+
+        Returns:
+            Whatever func returns; exceptions propagate to the caller
+        """
+        executor = self._get_executor()
+        with self._lock:
+            self.queued += 1
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, self._call, time.monotonic(), path, func, args)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            started = self.completed + self.active
+            avg_wait = (self.total_wait_seconds / started * 1000) if started > 0 else 0
+
+            return {
+                "max_workers": self.max_workers,
+                "queue_depth": self.queued,
+                "active": self.active,
+                "completed": self.completed,
+                "failed": self.failed,
+                "avg_wait_ms": round(avg_wait, 2),
+                "max_wait_ms": round(self.max_wait_seconds * 1000, 2),
+                "open_handles": len(self._handles)
+            }
+
+    def shutdown(self):
+        """Stop the worker threads and close every per-thread dataset handle"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+        with self._lock:
+            handles, self._handles = self._handles, []
+        for dataset in handles:
+            dataset.close()
+
+        # Workers are gone; a later run() starts fresh threads with fresh handles
+        self._local = threading.local()
+        logger.info(f"Raster executor shut down ({len(handles)} dataset handles closed)")
+
+
+raster_executor = RasterExecutor(max_workers=settings.raster_io_workers)
@@ -0,0 +1,186 @@
+"""
+Offline isochrones from a preprocessed road graph, without OpenRouteService
+"""
+import asyncio
+import heapq
+import logging
+import math
+from pathlib import Path
+from typing import List, Optional, Tuple
+import numpy as np
+import shapely
+from shapely.geometry import Polygon
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+_road_graph = None
+
+# Frontier edges are cut where the time budget runs out; ignore cuts shorter than this share of an edge
+MIN_FRONTIER_FRACTION = 0.05
+
+
+class RoadGraph:
+    """
+    Directed road network in compressed sparse row (CSR) form.
+
+    The graph file is an .npz archive with:
+        lat, lon          float arrays, one entry per node
+        indptr            int array (nodes + 1); edges of node i are indptr[i]:indptr[i + 1]
+        indices           int array, target node of each edge
+        travel_seconds    float array, driving time of each edge
+
+    Any preprocessing pipeline (e.g. an OSM extract with per-edge speeds)
+    can produce it through from_edges() and save().
+    """
+
+    def __init__(self, lat: np.ndarray, lon: np.ndarray, indptr: np.ndarray, indices: np.ndarray,
+                 travel_seconds: np.ndarray):
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lon = np.asarray(lon, dtype=np.float64)
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int64)
+        self.travel_seconds = np.asarray(travel_seconds, dtype=np.float64)
+
+        if len(self.indptr) != len(self.lat) + 1 or len(self.indices) != len(self.travel_seconds):
+            raise ValueError("Malformed road graph: CSR arrays do not match the node count")
+        if len(self.lat) == 0:
+            raise ValueError("Road graph has no nodes")
+
+        # Nodes ordered by latitude, so nearest_node only scans a narrow band
+        self._lat_order = np.argsort(self.lat, kind="stable")
+        self._sorted_lat = self.lat[self._lat_order]
+
+    @classmethod
+    def from_edges(cls, lat: np.ndarray, lon: np.ndarray, sources: np.ndarray, targets: np.ndarray,
+                   travel_seconds: np.ndarray) -> "RoadGraph":
+        """Build the CSR arrays from an edge list (add both directions for two-way roads)"""
+        sources = np.asarray(sources, dtype=np.int64)
+        order = np.argsort(sources, kind="stable")
+        counts = np.bincount(sources, minlength=len(lat))
+        indptr = np.concatenate([[0], np.cumsum(counts)])
+        return cls(lat, lon, indptr, np.asarray(targets)[order], np.asarray(travel_seconds)[order])
+
+    @classmethod
+    def load(cls, path: str) -> "RoadGraph":
+        with np.load(path) as data:
+            return cls(data["lat"], data["lon"], data["indptr"], data["indices"], data["travel_seconds"])
+
+    def save(self, path: str):
+        np.savez_compressed(
+            path, lat=self.lat, lon=self.lon, indptr=self.indptr, indices=self.indices,
+            travel_seconds=self.travel_seconds
+        )
+
+    @property
+    def node_count(self) -> int:
+        return len(self.lat)
+
+    @property
+    def edge_count(self) -> int:
+        return len(self.indices)
+
+    def nearest_node(self, lat: float, lon: float, search_degrees: float = 0.05) -> int:
+        """Closest node to a point, widening the latitude band until the answer is certain"""
+        scale = math.cos(math.radians(lat))
+        while True:
+            lo = np.searchsorted(self._sorted_lat, lat - search_degrees)
+            hi = np.searchsorted(self._sorted_lat, lat + search_degrees)
+            if hi > lo:
+                candidates = self._lat_order[lo:hi]
+                dist = (self.lat[candidates] - lat) ** 2 + ((self.lon[candidates] - lon) * scale) ** 2
+                best = int(candidates[np.argmin(dist)])
+                # Nodes outside the band are at least search_degrees away
+                if math.sqrt(dist.min()) <= search_degrees or (lo == 0 and hi == self.node_count):
+                    return best
+            search_degrees *= 2
+
+    def reachable(self, source: int, max_seconds: float) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Bounded Dijkstra from source.
+
+        Returns:
+            (lat, lon) arrays of every node reachable within max_seconds, plus
+            the points where the budget runs out part-way along an edge
+        """
+        indptr, indices, travel_seconds = self.indptr, self.indices, self.travel_seconds
+        best = {source: 0.0}
+        settled = set()
+        heap = [(0.0, source)]
+        frontier: List[Tuple[int, int, float]] = []
+
+        while heap:
+            seconds, node = heapq.heappop(heap)
+            if node in settled:
+                continue
+            settled.add(node)
+
+            start, end = indptr[node], indptr[node + 1]
+            for target, edge_seconds in zip(indices[start:end].tolist(), travel_seconds[start:end].tolist()):
+                arrival = seconds + edge_seconds
+                if arrival > max_seconds:
+                    fraction = (max_seconds - seconds) / edge_seconds if edge_seconds > 0 else 0.0
+                    if fraction >= MIN_FRONTIER_FRACTION:
+                        frontier.append((node, target, fraction))
+                elif arrival < best.get(target, math.inf):
+                    best[target] = arrival
+                    heapq.heappush(heap, (arrival, target))
+
+        nodes = np.fromiter(settled, dtype=np.int64, count=len(settled))
+        lats, lons = self.lat[nodes], self.lon[nodes]
+        if frontier:
+            a, b, fraction = (np.array(column) for column in zip(*frontier))
+            a, b = a.astype(np.int64), b.astype(np.int64)
+            lats = np.concatenate([lats, self.lat[a] + (self.lat[b] - self.lat[a]) * fraction])
+            lons = np.concatenate([lons, self.lon[a] + (self.lon[b] - self.lon[a]) * fraction])
+        return lats, lons
+
+    def isochrone(self, lat: float, lon: float, drive_time_minutes: float,
+                  concave_ratio: Optional[float] = None) -> Polygon:
+        """Concave hull of everything reachable from the nearest node within the drive time"""
+        if concave_ratio is None:
+            concave_ratio = settings.road_graph_concave_ratio
+
+        source = self.nearest_node(lat, lon)
+        lats, lons = self.reachable(source, drive_time_minutes * 60)
+        points = shapely.multipoints(np.column_stack([lons, lats]))
+        hull = shapely.concave_hull(points, ratio=concave_ratio)
+        if not isinstance(hull, Polygon) or hull.is_empty:
+            # Too few reachable points for an area (e.g. a dead-end origin)
+            hull = shapely.buffer(points, 0.005).convex_hull
+        return hull
+
+
+def load_road_graph():
+    global _road_graph
+
+    path = settings.road_graph_path
+    if not Path(path).exists():
+        if settings.isochrone_provider == "local":
+            logger.warning(f"Road graph not found at {path}; drive-time searches will fall back to a point")
+        return
+
+    try:
+        _road_graph = RoadGraph.load(path)
+        logger.info(f"✓ Road graph loaded: {_road_graph.node_count} nodes, {_road_graph.edge_count} edges")
+    except Exception as e:
+        logger.error(f"Failed to load road graph: {e}")
+        import traceback
+        traceback.print_exc()
+        _road_graph = None
+
+def close_road_graph():
+    global _road_graph
+    _road_graph = None
+
+def get_road_graph() -> Optional[RoadGraph]:
+    return _road_graph
+
+async def get_local_isochrone(lat: float, lon: float, drive_time_minutes: int) -> List[List[float]]:
+    """Offline isochrone ring as [[lon, lat], ...]; the search runs in a worker thread"""
+    graph = _road_graph
+    if graph is None:
+        raise RuntimeError("Road graph is not loaded")
+
+    polygon = await asyncio.to_thread(graph.isochrone, lat, lon, drive_time_minutes)
+    return [list(coord) for coord in polygon.exterior.coords]
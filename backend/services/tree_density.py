@@ -1,8 +1,11 @@
 import logging
-from typing import Optional, List, Tuple
-from cache import cache_response
+from typing import List, Tuple
+from cache import cache_tiles
 from config import settings
+from services.raster_executor import raster_executor
+from services.isochrone import SearchGrid
 import rasterio
+from rasterio.enums import Resampling
 from rasterio.transform import rowcol
 from rasterio.warp import transform
 import numpy as np
@@ -12,6 +15,13 @@ logger = logging.getLogger(__name__)
 _tree_density_dataset = None
 _tree_dataset_stats = None
 
+# Cache precision: lookups snap to the 0.01° global lattice (~0.7 mi) and are
+# cached as tiles of uint16 scores (±8e-6)
+TREE_DENSITY_CELL_DEGREES = 0.01
+
+# Decimated reads keep about this many raster pixels per requested point
+TREE_DENSITY_PIXELS_PER_POINT = 4
+
 def load_tree_density_data():
     """Load TreeMap2022 ALSTK (Above-ground Live STocK) raster data"""
     global _tree_density_dataset, _tree_dataset_stats
@@ -68,124 +78,91 @@ def close_tree_density_data():
         _tree_density_dataset = None
         logger.info("Tree density dataset closed")
 
-@cache_response(ttl_seconds=31536000, prefix="tree_density")
-async def get_tree_density_score(lat: float, lon: float) -> float:
+def _read_tree_density_window(dataset, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
     """
-    Get tree density score (0-1) for a location.
-    ALSTK = Above-ground Live Stock (tons per acre)
+    Read tree density for many points with one windowed read (runs on a raster worker thread).
 
-    Returns:
-        float: Tree density from 0 (no trees) to 1 (dense forest)
-    """
-    global _tree_density_dataset
+    The 30 m raster is far finer than the 0.01° cells, so the window is read
+    decimated (nearest pixel) to about TREE_DENSITY_PIXELS_PER_POINT pixels
+    per point: a 1° tile reads ~40k values instead of ~10M.
 
-    if _tree_density_dataset is None:
-        logger.warning("Tree density dataset not loaded, returning default 0.0")
-        return 0.0  # If dataset not loaded, assume open sky
+    Out of bounds (outside CONUS forest data) and NoData (urban/water) are
+    treated as open sky, score 0.0.
+    """
+    scores = np.zeros(len(lats))
 
-    try:
-        # Transform lat/lon (EPSG:4326) to dataset CRS (EPSG:5070)
-        xs, ys = transform('EPSG:4326', _tree_density_dataset.crs, [lon], [lat])
-        x, y = xs[0], ys[0]
+    # Transform all lat/lon points (EPSG:4326) to dataset CRS (EPSG:5070) at once
+    xs, ys = transform('EPSG:4326', dataset.crs, list(lons), list(lats))
+    rows, cols = rowcol(dataset.transform, xs, ys)
+    rows = np.asarray(rows, dtype=np.int64)
+    cols = np.asarray(cols, dtype=np.int64)
 
-        logger.debug(f"Transformed ({lat}, {lon}) -> ({x:.2f}, {y:.2f}) in {_tree_density_dataset.crs}")
+    in_bounds = (rows >= 0) & (rows < dataset.height) & (cols >= 0) & (cols < dataset.width)
+    if not in_bounds.any():
+        return scores
 
-        # Convert projected coordinates to raster row/col
-        row, col = rowcol(_tree_density_dataset.transform, x, y)
+    rows = rows[in_bounds]
+    cols = cols[in_bounds]
+    min_row, max_row = int(rows.min()), int(rows.max())
+    min_col, max_col = int(cols.min()), int(cols.max())
 
-        logger.debug(f"Pixel coordinates: row={row}, col={col} (bounds: 0-{_tree_density_dataset.height}, 0-{_tree_density_dataset.width})")
+    height, width = max_row - min_row + 1, max_col - min_col + 1
+    factor = max(1, int(np.sqrt(height * width / (TREE_DENSITY_PIXELS_PER_POINT * len(rows)))))
+    out_height, out_width = -(-height // factor), -(-width // factor)
 
-        if not (0 <= row < _tree_density_dataset.height and
-                0 <= col < _tree_density_dataset.width):
-            logger.debug(f"Coordinates ({lat}, {lon}) -> pixel ({row}, {col}) OUT OF BOUNDS")
-            return 0.0  # Out of bounds = not in CONUS forest areas = assume open
+    window = ((min_row, max_row + 1), (min_col, max_col + 1))
+    raster_data = dataset.read(1, window=window, out_shape=(out_height, out_width),
+                               resampling=Resampling.nearest, masked=True)
 
-        alstk_value = _tree_density_dataset.read(1, window=((row, row+1), (col, col+1)))[0, 0]
+    out_rows = (rows - min_row) * out_height // height
+    out_cols = (cols - min_col) * out_width // width
+    alstk = np.ma.masked_invalid(raster_data[out_rows, out_cols])
+    valid = ~np.ma.getmaskarray(alstk)
 
-        logger.debug(f"Raw ALSTK value: {alstk_value}, NoData value: {_tree_density_dataset.nodata}")
+    # ALSTK values typically range from 0-200+ tons/acre
+    # Normalize to 0-1 scale
+    # Higher values = denser forest (worse for stargazing due to blocked sky)
+    scores[in_bounds] = np.where(valid, np.minimum(alstk.filled(0) / 150.0, 1.0), 0.0)
+    return scores
 
-        if alstk_value == _tree_density_dataset.nodata or np.isnan(alstk_value):
-            logger.debug(f"NoData at ({lat}, {lon}), assuming no forest cover (urban/water), returning 0.0")
-            return 0.0  # NoData = no forest coverage = open sky = good for stargazing
+@cache_tiles(ttl_seconds=31536000, prefix="tree_density", cell_degrees=TREE_DENSITY_CELL_DEGREES)
+async def _get_tree_density_tile(lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """Tree density for every cell of a cache tile; raster errors propagate uncached"""
+    return await raster_executor.run(_tree_density_dataset.name, _read_tree_density_window, lats, lons)
 
-        # ALSTK values typically range from 0-200+ tons/acre
-        # Normalize to 0-1 scale
-        # Higher values = denser forest (worse for stargazing due to blocked sky)
-        normalized = min(alstk_value / 150.0, 1.0)
+async def get_tree_density_score(lat: float, lon: float) -> float:
+    """
+    Get tree density score (0-1) for a location.
+    ALSTK = Above-ground Live Stock (tons per acre)
 
-        logger.debug(f"SUCCESS: Tree density at ({lat}, {lon}) = {normalized:.3f} (raw ALSTK={alstk_value:.2f})")
+    Returns:
+        float: Tree density from 0 (no trees) to 1 (dense forest)
+    """
+    global _tree_density_dataset
 
-        return float(normalized)
+    if _tree_density_dataset is None:
+        logger.warning("Tree density dataset not loaded, returning default 0.0")
+        return 0.0  # If dataset not loaded, assume open sky
 
-    except Exception as e:
-        logger.error(f"Error reading tree density at ({lat}, {lon}): {e}")
-        import traceback
-        traceback.print_exc()
-        return 0.0  # Error = assume open sky
+    return (await get_tree_density_scores_batch([(lat, lon)]))[0]
 
 # Batch processing for performance
 async def get_tree_density_scores_batch(points: List[Tuple[float, float]]) -> List[float]:
-    """Get tree density for multiple points efficiently"""
+    """Get tree density for multiple points efficiently, served from cached 0.01° tiles"""
     global _tree_density_dataset
 
     if _tree_density_dataset is None or len(points) == 0:
         return [0.0] * len(points)  # No dataset = assume open sky
 
     try:
-        # Transform all lat/lon points to dataset CRS at once
-        lats = [p[0] for p in points]
-        lons = [p[1] for p in points]
-        xs, ys = transform('EPSG:4326', _tree_density_dataset.crs, lons, lats)
-
-        # Find bounding box in projected coordinates
-        min_x, max_x = min(xs), max(xs)
-        min_y, max_y = min(ys), max(ys)
-
-        min_row, min_col = rowcol(_tree_density_dataset.transform, min_x, min_y)
-        max_row, max_col = rowcol(_tree_density_dataset.transform, max_x, max_y)
-
-        if min_row > max_row:
-            min_row, max_row = max_row, min_row
-        if min_col > max_col:
-            min_col, max_col = max_col, min_col
-
-        min_row = max(0, min_row - 1)
-        min_col = max(0, min_col - 1)
-        max_row = min(_tree_density_dataset.height - 1, max_row + 1)
-        max_col = min(_tree_density_dataset.width - 1, max_col + 1)
-
-        window = ((min_row, max_row + 1), (min_col, max_col + 1))
-        raster_data = _tree_density_dataset.read(1, window=window)
-
-        scores = []
-        for x, y in zip(xs, ys):
-            try:
-                row, col = rowcol(_tree_density_dataset.transform, x, y)
-                rel_row = row - min_row
-                rel_col = col - min_col
-
-                if not (0 <= rel_row < raster_data.shape[0] and
-                        0 <= rel_col < raster_data.shape[1]):
-                    scores.append(0.0)  # Out of bounds = open
-                    continue
-
-                alstk_value = raster_data[rel_row, rel_col]
-
-                if alstk_value == _tree_density_dataset.nodata or np.isnan(alstk_value):
-                    scores.append(0.0)  # NoData = no forest = open sky
-                    continue
-
-                normalized = min(alstk_value / 150.0, 1.0)
-                scores.append(float(normalized))
-
-            except Exception as e:
-                logger.error(f"Error processing point: {e}")
-                scores.append(0.0)  # Error = assume open
-
-        return scores
+        return (await _get_tree_density_tile(points)).tolist()
 
     except Exception as e:
         logger.error(f"Error in batch processing: {e}")
         import traceback
         traceback.print_exc()
         return [0.0] * len(points)  # Error = assume open
+
+async def get_tree_density_grid(grid: SearchGrid) -> np.ndarray:
+    """Tree density (0-1) as a layer of the grid's shape, NaN outside its mask"""
+    return grid.scatter(await get_tree_density_scores_batch(grid.points()))
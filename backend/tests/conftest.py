@@ -1,6 +1,16 @@
 import pytest
 from fastapi.testclient import TestClient
 from main import app
+from cache import local_cache, _namespace_versions
+
+@pytest.fixture(autouse=True)
+def clear_local_cache():
+    """Keep the in-process L1 cache and namespace versions from leaking between tests"""
+    local_cache.clear()
+    _namespace_versions.clear()
+    yield
+    local_cache.clear()
+    _namespace_versions.clear()
 
 @pytest.fixture
 def client():
@@ -175,3 +175,24 @@ def test_response_performance(client, sample_request):
     assert response.status_code == status.HTTP_200_OK
     # Should respond in under 2 seconds (generous for testing)
     assert elapsed < 2.0
+
+def test_cache_admin_endpoints_require_token(client, monkeypatch):
+    """Test that cache invalidation is disabled without a token and refuses wrong tokens and ns: patterns"""
+    from config import settings
+
+    response = client.post("/cache/invalidate", params={"pattern": "places:*"})
+    assert response.status_code == status.HTTP_403_FORBIDDEN
+
+    monkeypatch.setattr(settings, "cache_admin_token", "secret")
+    response = client.post("/cache/namespaces/places/bump", headers={"X-Admin-Token": "wrong"})
+    assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    for pattern in ("*", "ns:*", "n*"):
+        response = client.post("/cache/invalidate", params={"pattern": pattern}, headers={"X-Admin-Token": "secret"})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+def test_drive_time_above_provider_limit_is_reported_capped(client, sample_request):
+    """Test that the response says which drive time the search area was built for"""
+    response = client.post("/api/spots", json={**sample_request, "drive_time_minutes": 120})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["drive_time_minutes"] == 60
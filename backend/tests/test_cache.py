@@ -0,0 +1,423 @@
+import asyncio
+import fnmatch
+import numpy as np
+import pytest
+import redis
+import cache
+
+def _to_bytes(value):
+    return value.encode() if isinstance(value, str) else value
+
+class FakeAsyncRedis:
+    """Minimal in-memory stand-in for the async (bytes-returning) Redis client"""
+    def __init__(self):
+        self.store = {}
+        self.mget_calls = 0
+        self.pipeline_calls = 0
+        self.unlink_calls = 0
+        self.ttls = {}
+
+    async def get(self, key):
+        return self.store.get(key)
+
+    async def setex(self, key, ttl, value):
+        self.store[key] = _to_bytes(value)
+        self.ttls[key] = ttl
+
+    async def set(self, key, value, nx=False, px=None):
+        if nx and key in self.store:
+            return None
+        self.store[key] = _to_bytes(value)
+        return True
+
+    async def delete(self, *keys):
+        for key in keys:
+            self.store.pop(key, None)
+
+    async def unlink(self, *keys):
+        self.unlink_calls += 1
+        return sum(self.store.pop(key, None) is not None for key in keys)
+
+    async def incr(self, key):
+        self.store[key] = str(int(self.store.get(key, 0)) + 1).encode()
+        return int(self.store[key])
+
+    async def expire(self, key, ttl):
+        self.ttls[key] = ttl
+        return key in self.store
+
+    async def scan_iter(self, match=None, count=None):
+        for key in list(self.store):
+            if fnmatch.fnmatchcase(key, match):
+                yield key
+
+    async def mget(self, keys):
+        self.mget_calls += 1
+        return [self.store.get(key) for key in keys]
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+class FakePipeline:
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def setex(self, key, ttl, value):
+        self.commands.append((key, value))
+
+    async def execute(self):
+        self.client.pipeline_calls += 1
+        for key, value in self.commands:
+            self.client.store[key] = _to_bytes(value)
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    client = FakeAsyncRedis()
+    monkeypatch.setattr(cache, "get_async_redis", lambda: client)
+    cache.cache_stats.reset()
+    yield client
+    cache.cache_stats.reset()
+
+def test_pool_usage_reports_saturation():
+    """Test pool saturation is computed from in-use connections"""
+    pool = redis.ConnectionPool(max_connections=4)
+    pool._in_use_connections.update({object(), object(), object()})
+
+    usage = cache._pool_usage(pool)
+
+    assert usage["max_connections"] == 4
+    assert usage["in_use"] == 3
+    assert usage["saturation_percent"] == 75.0
+
+@pytest.mark.asyncio
+async def test_cache_response_without_redis(monkeypatch):
+    """Test that the decorator still works when Redis is unavailable"""
+    monkeypatch.setattr(cache, "redis_client", None)
+    monkeypatch.setattr(cache, "disk_cache", None)
+    calls = []
+
+    @cache.cache_response(ttl_seconds=60, prefix="test")
+    async def double(x):
+        calls.append(x)
+        return x * 2
+
+    assert cache.get_async_redis() is None
+    assert await double(2) == 4
+    assert await double(2) == 4
+    # Redis is down, but the in-process L1 still serves the repeat call
+    assert calls == [2]
+
+@pytest.mark.asyncio
+async def test_l1_serves_before_redis(fake_redis):
+    """Test that repeat lookups are served from L1 without touching Redis"""
+    calls = []
+
+    @cache.cache_response(ttl_seconds=60, prefix="test")
+    async def lookup(x):
+        calls.append(x)
+        return x + 1
+
+    assert await lookup(1) == 2
+    fake_redis.store.clear()  # Redis lost the entry, L1 still has it
+    assert await lookup(1) == 2
+    assert calls == [1]
+
+    stats = cache.cache_stats.get_stats()
+    assert stats["l1"]["hits"] == 1
+    assert stats["l2"]["misses"] == 1
+
+@pytest.mark.asyncio
+async def test_l1_populated_on_redis_hit(fake_redis):
+    """Test that a Redis hit is copied into L1"""
+    @cache.cache_response(ttl_seconds=60, prefix="test")
+    async def lookup(x):
+        return [x]
+
+    await lookup(5)
+    cache.local_cache.clear()
+
+    assert await lookup(5) == [5]  # L2 hit, fills L1
+    assert await lookup(5) == [5]  # L1 hit
+
+    stats = cache.cache_stats.get_stats()
+    assert stats["l2"] == {"hits": 1, "misses": 1, "hit_rate_percent": 50.0}
+    assert stats["l1"]["hits"] == 1
+
+def test_local_cache_evicts_lru_within_budget():
+    """Test that the L1 evicts least recently used entries to stay under budget"""
+    entry_size = len("k0") + len("v" * 100) + cache.LocalCache.ENTRY_OVERHEAD_BYTES
+    local = cache.LocalCache(max_bytes=entry_size * 2)
+
+    local.set("k0", "v" * 100, ttl_seconds=60)
+    local.set("k1", "v" * 100, ttl_seconds=60)
+    local.get("k0")  # k1 becomes least recently used
+    local.set("k2", "v" * 100, ttl_seconds=60)
+
+    assert local.get("k0") is not None
+    assert local.get("k1") is None
+    assert local.get("k2") is not None
+    assert local.get_stats()["evictions"] == 1
+    assert local.current_bytes <= local.max_bytes
+
+def test_local_cache_expires_entries(monkeypatch):
+    """Test per-entry TTL in the L1"""
+    local = cache.LocalCache(max_bytes=10_000)
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now[0])
+
+    local.set("short", "1", ttl_seconds=5)
+    local.set("long", "2", ttl_seconds=500)
+    now[0] += 10
+
+    assert local.get("short") is None
+    assert local.get("long") == "2"
+    assert local.get_stats()["expirations"] == 1
+
+@pytest.mark.asyncio
+async def test_concurrent_misses_are_coalesced(monkeypatch):
+    """Test that concurrent misses on one key share a single computation"""
+    monkeypatch.setattr(cache, "redis_client", None)
+    cache.cache_stats.reset()
+    calls = []
+
+    @cache.cache_response(ttl_seconds=60, prefix="test")
+    async def slow_lookup(x):
+        calls.append(x)
+        await asyncio.sleep(0.05)
+        return {"value": x}
+
+    results = await asyncio.gather(*[slow_lookup(7) for _ in range(5)])
+
+    assert results == [{"value": 7}] * 5
+    assert calls == [7]
+    assert cache.cache_stats.get_stats()["coalesced"] == 4
+
+    # Each caller gets its own copy
+    results[0]["value"] = 0
+    assert results[1] == {"value": 7}
+
+@pytest.mark.asyncio
+async def test_concurrent_miss_errors_reach_every_caller(monkeypatch):
+    """Test that a failing computation fails all coalesced callers"""
+    monkeypatch.setattr(cache, "redis_client", None)
+
+    @cache.cache_response(ttl_seconds=60, prefix="test")
+    async def failing_lookup(x):
+        await asyncio.sleep(0.01)
+        raise ValueError("upstream down")
+
+    results = await asyncio.gather(*[failing_lookup(1) for _ in range(3)], return_exceptions=True)
+
+    assert all(isinstance(r, ValueError) for r in results)
+    assert cache._in_flight == {}
+
+@pytest.mark.asyncio
+async def test_redis_lock_waits_for_other_worker(fake_redis, monkeypatch):
+    """Test that a miss waits for the value while another worker holds the lock"""
+    monkeypatch.setattr(cache, "LOCK_POLL_INTERVAL_SECONDS", 0.01)
+    calls = []
+
+    @cache.cache_response(ttl_seconds=60, prefix="test", lock_timeout_seconds=1)
+    async def upstream(x):
+        calls.append(x)
+        return "ours"
+
+    cache_key = cache.generate_cache_key("test:v0:upstream", 3)
+    await fake_redis.set(f"lock:{cache_key}", "other-worker")
+
+    async def other_worker_finishes():
+        await asyncio.sleep(0.05)
+        await fake_redis.setex(cache_key, 60, '"theirs"')
+
+    result, _ = await asyncio.gather(upstream(3), other_worker_finishes())
+
+    assert result == "theirs"
+    assert calls == []
+    assert cache.cache_stats.get_stats()["by_function"]["upstream"]["coalesced"] == 1
+
+@pytest.mark.asyncio
+async def test_stale_while_revalidate(monkeypatch):
+    """Test that entries past the soft TTL are served at once and refreshed in the background"""
+    monkeypatch.setattr(cache, "redis_client", None)
+    cache.cache_stats.reset()
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, "time", lambda: now[0])
+    version = [1]
+
+    @cache.cache_response(ttl_seconds=3600, soft_ttl_seconds=60, prefix="test")
+    async def forecast(lat):
+        await asyncio.sleep(0.01)
+        return version[0]
+
+    assert await forecast(38.9) == 1
+
+    # Past the soft TTL: old value now, one deduplicated refresh behind it
+    now[0] += 120
+    version[0] = 2
+    assert await asyncio.gather(forecast(38.9), forecast(38.9)) == [1, 1]
+    await asyncio.gather(*cache._background_tasks)
+
+    assert await forecast(38.9) == 2
+    stats = cache.cache_stats.get_stats()
+    assert stats["stale_hits"] == 2
+    assert stats["refreshes"] == 1
+
+@pytest.mark.asyncio
+async def test_degraded_results_are_negative_cached_briefly(fake_redis):
+    """Test that a DegradedResult fallback is returned but only stored for the degraded TTL"""
+    calls = []
+
+    @cache.cache_response(ttl_seconds=2592000, prefix="test", degraded_ttl_seconds=30)
+    async def lookup(x):
+        calls.append(x)
+        raise cache.DegradedResult([], "upstream down")
+
+    @cache.cache_response(ttl_seconds=2592000, prefix="test", degraded_ttl_seconds=0)
+    async def uncached_lookup(x):
+        calls.append(x)
+        raise cache.DegradedResult(None)
+
+    assert await lookup(1) == []
+    assert await lookup(1) == []
+    assert list(fake_redis.ttls.values()) == [30]
+
+    assert await uncached_lookup(2) is None
+    assert await uncached_lookup(2) is None
+    assert calls == [1, 2, 2]
+    assert len(fake_redis.store) == 1
+
+    stats = cache.cache_stats.get_stats()
+    assert stats["degraded"] == 3
+    assert stats["by_function"]["lookup"]["degraded"] == 1
+
+@pytest.mark.asyncio
+async def test_degraded_refresh_keeps_stale_entry(monkeypatch):
+    """Test that a background refresh hitting an outage does not overwrite the good entry"""
+    monkeypatch.setattr(cache, "get_async_redis", lambda: None)
+    cache.cache_stats.reset()
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, "time", lambda: now[0])
+    healthy = [True]
+
+    @cache.cache_response(ttl_seconds=3600, soft_ttl_seconds=60, prefix="test")
+    async def forecast(lat):
+        if not healthy[0]:
+            raise cache.DegradedResult(None)
+        return 42
+
+    assert await forecast(38.9) == 42
+
+    now[0] += 120
+    healthy[0] = False
+    assert await forecast(38.9) == 42
+    await asyncio.gather(*cache._background_tasks)
+
+    assert await forecast(38.9) == 42
+    await asyncio.gather(*cache._background_tasks)
+    stats = cache.cache_stats.get_stats()
+    assert stats["degraded"] == 2
+    assert stats["refreshes"] == 0
+
+def test_quantized_codec_round_trip():
+    """Test compact encodings stay within their documented precision"""
+    for value in [0.0, 0.123456, 0.5, 1.0]:
+        encoded = cache.UNIT_INTERVAL_CODEC.encode(value)
+        assert len(encoded) == 2
+        assert cache.UNIT_INTERVAL_CODEC.decode(encoded) == pytest.approx(value, abs=1e-5)
+
+    assert cache.PERCENT_CODEC.decode(cache.PERCENT_CODEC.encode(75.0)) == 75.0
+    assert len(cache.PERCENT_CODEC.encode(75.0)) == 1
+    assert cache.PERCENT_CODEC.decode(cache.PERCENT_CODEC.encode(None)) is None
+
+@pytest.mark.asyncio
+async def test_cell_keys_and_lossy_codec(fake_redis):
+    """Test key_builder keys and that misses return the same decoded value as hits"""
+    @cache.cache_response(ttl_seconds=60, prefix="test", key_builder=lambda lat, lon: f"{round(lat)}_{round(lon)}",
+                          codec=cache.UNIT_INTERVAL_CODEC)
+    async def score(lat, lon):
+        return 1 / 3
+
+    first = await score(38.96, -92.33)
+    cache.local_cache.clear()
+    second = await score(39.0000001, -92.0)
+
+    assert first == second
+    assert list(fake_redis.store) == ["test:v0:score:39_-92"]
+    assert len(fake_redis.store["test:v0:score:39_-92"]) == 2
+
+@pytest.mark.asyncio
+async def test_cache_tiles_stores_one_entry_per_tile(fake_redis):
+    """Test that tiled caching fetches whole tiles once and slices points out of them"""
+    tiles_computed = []
+
+    @cache.cache_tiles(ttl_seconds=60, prefix="test", cell_degrees=0.1, tile_degrees=1.0)
+    async def lat_field(lats, lons):
+        tiles_computed.append((lats.min(), lons.min()))
+        return (lats - np.floor(lats)) * 0.5 + (lons - np.floor(lons)) * 0.25
+
+    points = [(38.3, -92.6), (38.31, -92.64), (38.9, -92.1), (39.2, -92.1), (-0.1, -0.1)]
+    expected = [(lat - np.floor(lat)) * 0.5 + (lon - np.floor(lon)) * 0.25
+                for lat, lon in [(38.3, -92.6), (38.3, -92.6), (38.9, -92.1), (39.2, -92.1), (-0.1, -0.1)]]
+
+    assert await lat_field(points) == pytest.approx(expected, abs=1e-4)
+    assert len(tiles_computed) == 3
+    assert set(fake_redis.store) == {"test:v0:lat_field:tile10:38:-93", "test:v0:lat_field:tile10:39:-93",
+                                     "test:v0:lat_field:tile10:-1:-1"}
+    assert all(len(blob) == 100 * 2 for blob in fake_redis.store.values())
+
+    # Served from Redis without recomputing
+    cache.local_cache.clear()
+    assert await lat_field(points[:2]) == pytest.approx(expected[:2], abs=1e-4)
+    assert len(tiles_computed) == 3
+    assert fake_redis.mget_calls == 2
+
+@pytest.mark.asyncio
+async def test_background_invalidation_scans_and_unlinks(fake_redis, monkeypatch):
+    """Test that invalidation runs as a background SCAN with batched UNLINK"""
+    monkeypatch.setattr(cache, "INVALIDATION_UNLINK_BATCH", 2)
+    for i in range(5):
+        await fake_redis.setex(f"layer:v0:f:{i}", 60, b"1")
+    await fake_redis.setex("other:v0:f:0", 60, b"1")
+
+    job = cache.start_invalidation("layer:*")
+    await asyncio.gather(*cache._background_tasks)
+
+    progress = cache.get_invalidation_job(job["id"])
+    assert (progress["status"], progress["scanned"], progress["deleted"]) == ("done", 5, 5)
+    assert fake_redis.unlink_calls == 3
+    assert list(fake_redis.store) == ["other:v0:f:0"]
+
+def test_invalidation_patterns_must_not_reach_namespace_keys():
+    """Test that patterns without a literal prefix, or matching ns: version keys, are refused"""
+    for pattern in ("*", "?s:layer", "[n]s:*", "ns:*", "ns", "n*"):
+        with pytest.raises(ValueError):
+            cache.check_invalidation_pattern(pattern)
+    for pattern in ("layer:*", "cloud_cover:v2:*", "nsx:*"):
+        cache.check_invalidation_pattern(pattern)
+
+@pytest.mark.asyncio
+async def test_bump_namespace_invalidates_layer(fake_redis):
+    """Test that bumping a namespace version makes old entries unreachable"""
+    version = [1]
+
+    @cache.cache_response(ttl_seconds=60, prefix="layer")
+    async def lookup(x):
+        return version[0]
+
+    assert await lookup(1) == 1
+    version[0] = 2
+    assert await lookup(1) == 1
+
+    result = await cache.bump_namespace("layer")
+    await asyncio.gather(*cache._background_tasks)
+
+    assert (result["old_version"], result["version"]) == (0, 1)
+    assert await lookup(1) == 2
+    assert not any(key.startswith("layer:v0:") for key in fake_redis.store)
@@ -0,0 +1,191 @@
+import math
+import numpy as np
+import pytest
+import services.cloud_cover_strategy as strategy
+from services.cloud_cover_strategy import (
+    cloud_sample_lattice,
+    estimate_api_calls,
+    get_cloud_cover_grid,
+    interpolate_cloud_cover
+)
+from services.isochrone import SearchGrid, get_radius_polygon
+
+SAMPLE_LATS = np.array([38.0, 38.0, 39.0])
+SAMPLE_LONS = np.array([-92.0, -91.0, -92.0])
+SAMPLE_CLOUDS = np.array([0.0, 100.0, 50.0])
+
+def test_idw_weights_by_inverse_distance():
+    """Test that IDW blends samples by distance ** -power"""
+    lats, lons = np.array([38.0]), np.array([-91.5])
+
+    result = interpolate_cloud_cover(lats, lons, SAMPLE_LATS, SAMPLE_LONS, SAMPLE_CLOUDS,
+                                     method="idw", power=2, radius_miles=1000)
+
+    scale = math.cos(math.radians(38.0))
+    dist = np.array([0.5 * scale, 0.5 * scale, math.hypot(1.0, 0.5 * scale)])
+    weights = dist ** -2
+    assert result[0] == pytest.approx((weights * SAMPLE_CLOUDS).sum() / weights.sum())
+
+def test_idw_exact_hits_and_radius_fallback():
+    """Test that points on a sample take its value and points out of range take the nearest"""
+    lats = np.array([38.0, 39.0, 45.0])
+    lons = np.array([-91.0, -92.0, -92.0])
+
+    result = interpolate_cloud_cover(lats, lons, SAMPLE_LATS, SAMPLE_LONS, SAMPLE_CLOUDS,
+                                     method="idw", radius_miles=30)
+
+    np.testing.assert_allclose(result, [100.0, 50.0, 50.0])
+
+def test_nearest_matches_per_point_search():
+    """Test that nearest mode agrees with a brute-force nearest-sample search"""
+    rng = np.random.default_rng(0)
+    lats = rng.uniform(37.5, 39.5, 500)
+    lons = rng.uniform(-92.5, -90.5, 500)
+
+    result = interpolate_cloud_cover(lats, lons, SAMPLE_LATS, SAMPLE_LONS, SAMPLE_CLOUDS, method="nearest")
+
+    for lat, lon, value in zip(lats, lons, result):
+        scale = math.cos(math.radians(lat))
+        dist = [math.hypot(lat - slat, (lon - slon) * scale) for slat, slon in zip(SAMPLE_LATS, SAMPLE_LONS)]
+        assert value == SAMPLE_CLOUDS[int(np.argmin(dist))]
+
+def test_unknown_samples_are_ignored():
+    """Test that NaN samples are skipped and all-unknown samples give NaN"""
+    clouds = np.array([np.nan, 100.0, np.nan])
+    lats, lons = np.array([38.0, 39.0]), np.array([-92.0, -92.0])
+
+    np.testing.assert_allclose(interpolate_cloud_cover(lats, lons, SAMPLE_LATS, SAMPLE_LONS, clouds), [100.0, 100.0])
+    assert np.isnan(interpolate_cloud_cover(lats, lons, SAMPLE_LATS, SAMPLE_LONS, np.full(3, np.nan))).all()
+
+@pytest.mark.asyncio
+async def test_cloud_cover_grid_samples_and_interpolates(monkeypatch):
+    """Test that the grid layer needs only the sample calls and is filled inside the mask"""
+    calls = []
+
+    async def fake_cloud_cover(lat, lon):
+        calls.append((lat, lon))
+        return 10.0 if lon < -92.3 else 90.0
+
+    monkeypatch.setattr(strategy, "get_cloud_cover", fake_cloud_cover)
+    grid = SearchGrid.from_polygon(get_radius_polygon(38.9634, -92.3293, 20))
+
+    layer = await get_cloud_cover_grid(grid, "moderate")
+
+    assert len(calls) == estimate_api_calls(grid.points(), "moderate") <= 25
+    assert layer.shape == grid.shape
+    assert not np.isnan(layer[grid.mask]).any()
+    assert np.isnan(layer[~grid.mask]).all()
+    assert 10.0 <= layer[grid.mask].min() and layer[grid.mask].max() <= 90.0
+
+def test_sample_lattice_is_shared_by_overlapping_searches():
+    """Test that overlapping searches sample the same global lattice nodes regardless of point order"""
+    a = SearchGrid.from_polygon(get_radius_polygon(38.9634, -92.3293, 25)).points()
+    b = SearchGrid.from_polygon(get_radius_polygon(39.05, -92.2, 25)).points()
+
+    a_lats, a_lons, a_spacing = cloud_sample_lattice(a[:, 0], a[:, 1], 25)
+    shuffled = np.random.default_rng(0).permutation(a)
+    assert np.array_equal(np.column_stack(cloud_sample_lattice(shuffled[:, 0], shuffled[:, 1], 25)[:2]),
+                          np.column_stack([a_lats, a_lons]))
+
+    b_lats, b_lons, b_spacing = cloud_sample_lattice(b[:, 0], b[:, 1], 25)
+    assert a_spacing == b_spacing == 0.25
+    shared = set(zip(a_lats.tolist(), a_lons.tolist())) & set(zip(b_lats.tolist(), b_lons.tolist()))
+    assert len(shared) >= len(a_lats) // 2
+
+def test_sample_lattice_coarsens_to_fit_budget():
+    """Test that large areas double the lattice spacing until the sample budget fits"""
+    points = SearchGrid.from_polygon(get_radius_polygon(38.9634, -92.3293, 100)).points()
+
+    lats, lons, spacing = cloud_sample_lattice(points[:, 0], points[:, 1], 10)
+
+    assert len(lats) <= 10
+    assert spacing in (0.5, 1.0, 2.0)
+    np.testing.assert_allclose(lats / spacing, np.round(lats / spacing), atol=1e-9)
+    assert estimate_api_calls(points, "sparse") == len(lats)
+
+def _fake_clouds(monkeypatch, cloud_at):
+    calls = []
+
+    async def fake_cloud_cover(lat, lon):
+        calls.append((lat, lon))
+        return cloud_at(lat, lon)
+
+    monkeypatch.setattr(strategy, "get_cloud_cover", fake_cloud_cover)
+    return calls
+
+@pytest.mark.asyncio
+async def test_adaptive_sampling_stays_cheap_for_small_uniform_areas(monkeypatch):
+    """Test that a small search with uniform skies costs only a few calls"""
+    calls = _fake_clouds(monkeypatch, lambda lat, lon: 30.0)
+    grid = SearchGrid.from_polygon(get_radius_polygon(38.9634, -92.3293, 5))
+
+    layer, sampling = await strategy.sample_cloud_cover_grid(grid, "adaptive")
+
+    assert 1 <= len(calls) <= 3
+    assert sampling["samples"] == len(calls)
+    assert sampling["variance"] == 0.0
+    np.testing.assert_allclose(layer[grid.mask], 30.0)
+
+@pytest.mark.asyncio
+async def test_adaptive_sampling_refines_where_samples_disagree(monkeypatch):
+    """Test that a patchy large area gets extra samples near the front, within the budget"""
+    monkeypatch.setattr(strategy.settings, "cloud_adaptive_max_samples", 20)
+    # A weather front at longitude -92.3: clear to the west, overcast to the east
+    calls = _fake_clouds(monkeypatch, lambda lat, lon: 0.0 if lon < -92.3 else 100.0)
+    grid = SearchGrid.from_polygon(get_radius_polygon(38.9634, -92.3293, 100))
+
+    layer, sampling = await strategy.sample_cloud_cover_grid(grid, "adaptive")
+
+    assert 3 < len(calls) <= 20
+    assert len(set(calls)) == len(calls)
+    assert sampling["lattice_degrees"] < 1.0
+    assert sampling["variance"] > 1000
+
+    # Half-degree refinements only happen in the 1° cells on either side of the front
+    refined = [(lat, lon) for lat, lon in calls if lat % 1 or lon % 1]
+    assert refined
+    assert all(-93.5 <= lon <= -91.5 for _, lon in refined)
+
+@pytest.mark.asyncio
+async def test_adaptive_sampling_covers_large_areas_from_inside(monkeypatch):
+    """Test that a large search starts from several nearby nodes, never one distant coarse sample"""
+    calls = _fake_clouds(monkeypatch, lambda lat, lon: 30.0)
+    grid = SearchGrid.from_polygon(get_radius_polygon(39.9, -92.1, 69))
+    points = grid.points()
+
+    layer, sampling = await strategy.sample_cloud_cover_grid(grid, "adaptive")
+
+    assert len(calls) >= 4
+    assert sampling["lattice_degrees"] <= 1.0
+    margin = sampling["lattice_degrees"] / 2
+    for lat, lon in calls:
+        assert points[:, 0].min() - margin <= lat <= points[:, 0].max() + margin
+        assert points[:, 1].min() - margin <= lon <= points[:, 1].max() + margin
+    np.testing.assert_allclose(layer[grid.mask], 30.0)
+
+@pytest.mark.asyncio
+async def test_adaptive_sampling_refines_nodes_without_measured_neighbours(monkeypatch):
+    """Test that a coarse node with no known neighbour is refined instead of painted across its cell"""
+    monkeypatch.setattr(strategy.settings, "cloud_adaptive_initial_nodes_per_axis", 1)
+    calls = _fake_clouds(monkeypatch, lambda lat, lon: None if (lat, lon) != (39.0, -92.0) else 50.0)
+    grid = SearchGrid.from_polygon(get_radius_polygon(39.0, -92.0, 40))
+
+    _, sampling = await strategy.sample_cloud_cover_grid(grid, "adaptive")
+
+    assert (39.0, -92.0) in calls
+    assert len(calls) > 1
+    assert sampling["lattice_degrees"] < 1.0
+
+@pytest.mark.asyncio
+async def test_adaptive_sampling_does_not_refine_during_an_outage(monkeypatch):
+    """Test that unknown samples (API failing) are not refined, so an outage costs only the starting lattice"""
+    calls = _fake_clouds(monkeypatch, lambda lat, lon: None)
+    grid = SearchGrid.from_polygon(get_radius_polygon(39.9, -92.1, 69))
+    points = grid.points()
+    start_lats, _, _ = cloud_sample_lattice(points[:, 0], points[:, 1], strategy.settings.cloud_adaptive_max_samples,
+                                            strategy._initial_spacing(points[:, 0], points[:, 1]))
+
+    layer, sampling = await strategy.sample_cloud_cover_grid(grid, "adaptive")
+
+    assert len(calls) == len(start_lats) == sampling["samples"]
+    assert np.isnan(layer[grid.mask]).all()
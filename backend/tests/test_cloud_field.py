@@ -0,0 +1,95 @@
+import os
+import numpy as np
+import pytest
+import rasterio
+from rasterio.transform import from_origin
+import services.cloud_cover_strategy as strategy
+import services.cloud_field as cloud_field
+from config import settings
+from services.cloud_cover import get_cloud_cover
+from services.cloud_cover_strategy import sample_cloud_cover_grid
+from services.isochrone import SearchGrid, get_radius_polygon
+
+def _write_field(path, values, west=-95.0, north=41.0, res=0.25, nodata=None):
+    with rasterio.open(path, "w", driver="GTiff", width=values.shape[1], height=values.shape[0], count=1,
+                       dtype="float32", crs="EPSG:4326", transform=from_origin(west, north, res, res),
+                       nodata=nodata) as dataset:
+        dataset.write(values.astype(np.float32), 1)
+
+@pytest.fixture
+def field_source(tmp_path, monkeypatch):
+    """A 4° x 6° field over Missouri: cloud cover rises 10% per column from 0 in the west"""
+    path = str(tmp_path / "clouds.tif")
+    values = np.tile(np.arange(24, dtype=np.float32) * 10 % 100, (16, 1))
+    values[0, 0] = -1  # nodata
+    _write_field(path, values, nodata=-1)
+
+    monkeypatch.setattr(settings, "cloud_field_source", path)
+    monkeypatch.setattr(cloud_field, "_cloud_field", None)
+    return path
+
+@pytest.mark.asyncio
+async def test_field_lookups_replace_api_calls(field_source, monkeypatch):
+    """Test that a loaded field answers point and grid lookups without any API call"""
+    async def no_api(lat, lon):
+        raise AssertionError("cloud API called")
+
+    monkeypatch.setattr(strategy, "get_cloud_cover", no_api)
+    assert await cloud_field.refresh_cloud_field()
+
+    # Column 10 of the field spans -92.5 to -92.25
+    assert await get_cloud_cover(38.9, -92.3) == 0.0
+    assert await get_cloud_cover(38.9, -92.6) == 90.0
+
+    grid = SearchGrid.from_polygon(get_radius_polygon(38.9634, -92.3293, 30))
+    layer, sampling = await sample_cloud_cover_grid(grid, "adaptive")
+
+    assert sampling["strategy"] == "field"
+    assert sampling["samples"] == 0
+    expected = cloud_field.get_cloud_field().sample(grid.points()[:, 0], grid.points()[:, 1])
+    np.testing.assert_array_equal(layer[grid.mask], expected)
+
+def test_field_sampling_edges_and_nodata(field_source):
+    """Test that nodata and points outside the field are NaN"""
+    field = cloud_field.load_cloud_field(field_source)
+
+    values = field.sample([40.9, 36.0, 38.0], [-94.9, -92.0, -88.9])
+
+    assert np.isnan(values[0])
+    assert np.isnan(values[1]) and np.isnan(values[2])
+    assert not field.covers([38.0, 36.0], [-92.0, -92.0])
+
+@pytest.mark.asyncio
+async def test_refresh_swaps_only_when_the_drop_changes(field_source):
+    """Test that an unchanged file is not reloaded and a new drop replaces the field"""
+    assert await cloud_field.refresh_cloud_field()
+    first = cloud_field.get_cloud_field()
+    assert not await cloud_field.refresh_cloud_field()
+    assert cloud_field.get_cloud_field() is first
+
+    _write_field(field_source, np.full((16, 24), 55.0))
+    os.utime(field_source, (first.source_mtime + 10, first.source_mtime + 10))
+    assert await cloud_field.refresh_cloud_field()
+
+    assert cloud_field.get_cloud_field() is not first
+    assert cloud_field.get_cloud_field().sample([38.9], [-92.3])[0] == 55.0
+
+@pytest.mark.asyncio
+async def test_stale_or_partial_field_falls_back_to_sampling(field_source, monkeypatch):
+    """Test that searches outside the field, or with an aged-out field, use the API again"""
+    calls = []
+
+    async def fake_cloud_cover(lat, lon):
+        calls.append((lat, lon))
+        return 20.0
+
+    monkeypatch.setattr(strategy, "get_cloud_cover", fake_cloud_cover)
+    await cloud_field.refresh_cloud_field()
+
+    # Reaches past the field's southern edge (37°)
+    grid = SearchGrid.from_polygon(get_radius_polygon(37.2, -92.3293, 30))
+    _, sampling = await sample_cloud_cover_grid(grid, "sparse")
+    assert sampling["strategy"] == "sparse" and len(calls) > 0
+
+    monkeypatch.setattr(settings, "cloud_field_max_age_seconds", -1)
+    assert cloud_field.get_cloud_field() is None
@@ -0,0 +1,175 @@
+import pytest
+import cache
+import services.cloud_cover as cloud_cover
+from cache import cache_response
+from config import Settings, settings
+from disk_cache import AsyncDiskCache, DiskCache
+from services.cloud_prefetch import CloudPrefetcher, PopularityCounter
+from services.outbound import TokenBucket
+from tests.test_cache import FakeAsyncRedis
+
+def test_popularity_decays_and_ranks():
+    """Test that scores halve every half-life and recent demand outranks old demand"""
+    counter = PopularityCounter(half_life_seconds=3600, max_keys=100)
+    for _ in range(4):
+        counter.record("old", now=0)
+    for _ in range(3):
+        counter.record("new", now=3600)
+
+    assert counter.score("old", now=3600) == pytest.approx(2.0)
+    assert [key for key, _ in counter.top(5, now=3600)] == ["new", "old"]
+    assert [key for key, _ in counter.top(5, min_score=2.5, now=3600)] == ["new"]
+
+def test_popularity_drops_least_popular_beyond_max_keys():
+    """Test that the counter stays bounded and keeps the hottest keys"""
+    counter = PopularityCounter(half_life_seconds=3600, max_keys=8)
+    for _ in range(5):
+        counter.record("hot", now=0)
+    for i in range(20):
+        counter.record(i, now=0)
+
+    assert len(counter) <= 8
+    assert counter.score("hot", now=0) == 5.0
+
+@pytest.fixture
+def prefetcher(monkeypatch):
+    monkeypatch.setattr(cache, "get_async_redis", lambda: None)
+    monkeypatch.setattr(settings, "cloud_prefetch_hourly_budget", 10)
+    monkeypatch.setattr(settings, "cloud_prefetch_min_score", 2.0)
+    monkeypatch.setattr(settings, "cloud_prefetch_lead_seconds", 300)
+    cache.cache_stats.reset()
+    calls = []
+
+    @cache_response(ttl_seconds=3600, soft_ttl_seconds=1800, prefix="prefetch_test")
+    async def lookup(lat, lon):
+        calls.append((lat, lon))
+        return 42.0
+
+    prefetcher = CloudPrefetcher("test", lookup, 1800, PopularityCounter(3600, 100))
+    yield prefetcher, lookup, calls
+    cache.cache_stats.reset()
+
+@pytest.mark.asyncio
+async def test_prefetches_popular_cells_before_they_go_stale(prefetcher, monkeypatch):
+    """Test that popular cells are fetched ahead of requests, skipped while fresh and refreshed near the soft TTL"""
+    prefetcher, lookup, calls = prefetcher
+    for _ in range(3):
+        prefetcher.record(39.0, -92.3)
+    prefetcher.record(40.0, -90.0)  # Requested once: not worth a call
+
+    assert await prefetcher.run_once() == 1
+    assert calls == [(39.0, -92.3)]
+
+    # The next request is a hit the prefetcher paid for
+    assert await lookup(39.0, -92.3) == 42.0
+    assert len(calls) == 1
+    assert (await prefetcher.get_stats())["prefetch_hits"] == 1
+
+    assert await prefetcher.run_once() == 0
+    assert prefetcher.skipped_fresh == 1
+
+    # Entries within the lead time of their soft TTL are refreshed
+    monkeypatch.setattr(settings, "cloud_prefetch_lead_seconds", 1800)
+    assert await prefetcher.run_once() == 1
+    assert len(calls) == 2
+
+@pytest.mark.asyncio
+async def test_prefetching_stays_within_hourly_budget(prefetcher, monkeypatch):
+    """Test that only the hottest cells are fetched once the hourly budget runs out"""
+    prefetcher, _, calls = prefetcher
+    monkeypatch.setattr(settings, "cloud_prefetch_hourly_budget", 2)
+    for count, lat in zip((5, 4, 3), (38.0, 39.0, 40.0)):
+        for _ in range(count):
+            prefetcher.record(lat, -92.0)
+
+    assert await prefetcher.run_once() == 2
+    assert calls == [(38.0, -92.0), (39.0, -92.0)]
+    assert await prefetcher.budget_remaining() == 0
+    assert (await prefetcher.get_stats())["skipped_budget"] == 1
+
+@pytest.mark.asyncio
+async def test_hourly_budget_is_shared_by_workers(prefetcher, monkeypatch):
+    """Test that prefetchers in several workers draw on one Redis budget"""
+    _, lookup, calls = prefetcher
+    client = FakeAsyncRedis()
+    monkeypatch.setattr(cache, "get_async_redis", lambda: client)
+    monkeypatch.setattr(settings, "cloud_prefetch_hourly_budget", 3)
+
+    workers = [CloudPrefetcher("shared", lookup, 1800, PopularityCounter(3600, 100)) for _ in range(2)]
+    for offset, worker in enumerate(workers):
+        for lat in (38.0, 39.0):
+            for _ in range(3):
+                worker.record(lat + offset * 10, -92.0)
+
+    refreshed = [await worker.run_once() for worker in workers]
+
+    assert refreshed == [2, 1]
+    assert len(calls) == 3
+    assert await workers[0].budget_remaining() == 0
+    assert 3600 in client.ttls.values()
+
+@pytest.mark.asyncio
+async def test_hourly_budget_on_disk_backend(prefetcher, tmp_path, monkeypatch):
+    """Test that the shared budget works, and expires, on the SQLite cache backend"""
+    prefetcher, _, calls = prefetcher
+    disk = DiskCache(str(tmp_path / "cache.sqlite3"), max_bytes=100_000)
+    monkeypatch.setattr(cache, "get_async_redis", lambda: AsyncDiskCache(disk))
+    monkeypatch.setattr(settings, "cloud_prefetch_hourly_budget", 1)
+    for lat in (38.0, 39.0):
+        for _ in range(3):
+            prefetcher.record(lat, -92.0)
+
+    assert await prefetcher.run_once() == 1
+    assert prefetcher.skipped_budget == 1
+    assert prefetcher._local_spent() == 0  # Counted on disk, not in the per-process fallback
+    assert await prefetcher.budget_remaining() == 0
+
+    expires_at = disk._conn.execute("SELECT expires_at FROM cache WHERE key LIKE 'prefetch_budget:%'").fetchone()[0]
+    assert expires_at is not None
+    disk.close()
+
+@pytest.mark.asyncio
+async def test_prefetching_yields_to_user_traffic(prefetcher):
+    """Test that prefetching pauses while the provider's rate limit is mostly used"""
+    _, lookup, calls = prefetcher
+
+    class BusyProvider:
+        bucket = TokenBucket(rate_per_second=0.001, burst=10)
+
+    BusyProvider.bucket.tokens = 2
+    busy = CloudPrefetcher("busy", lookup, 1800, PopularityCounter(3600, 100), provider=BusyProvider())
+    for _ in range(3):
+        busy.record(39.0, -92.3)
+
+    assert await busy.run_once() == 0
+    assert calls == []
+    assert busy.skipped_busy == 1
+
+def test_prefetching_is_off_by_default():
+    """Test that no OpenWeather budget is spent unless one is configured"""
+    assert Settings.model_fields["cloud_prefetch_hourly_budget"].default == 0
+
+@pytest.mark.asyncio
+async def test_cloud_lookups_record_their_cell(monkeypatch):
+    """Test that get_cloud_cover counts demand per 0.1° cloud cell"""
+    monkeypatch.setattr(settings, "cloud_prefetch_hourly_budget", 10)
+
+    async def fake_cached(lat, lon):
+        return 10.0
+
+    monkeypatch.setattr(cloud_cover, "_get_cloud_cover_cached", fake_cached)
+    monkeypatch.setattr(cloud_cover.cloud_prefetcher, "popularity", PopularityCounter(3600, 100))
+
+    await cloud_cover.get_cloud_cover(38.9634, -92.3293)
+    await cloud_cover.get_cloud_cover(39.01, -92.27)
+
+    assert cloud_cover.cloud_prefetcher.popularity.score((39.0, -92.3)) == pytest.approx(2.0, rel=1e-3)
+
+def test_debug_cloud_prefetch_endpoint(client):
+    """Test that prefetch budget and hit contribution are exposed"""
+    response = client.get("/debug/cloud-prefetch")
+    assert response.status_code == 200
+
+    data = response.json()
+    assert data["budget_per_hour"] == settings.cloud_prefetch_hourly_budget
+    assert "prefetch_hits" in data and "hottest" in data
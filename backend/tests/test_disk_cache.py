@@ -0,0 +1,91 @@
+import asyncio
+import pytest
+import cache
+from disk_cache import DiskCache, AsyncDiskCache
+
+@pytest.fixture
+def disk(tmp_path):
+    disk = DiskCache(str(tmp_path / "cache.sqlite3"), max_bytes=10_000)
+    yield disk
+    disk.close()
+
+def test_disk_cache_expires_entries(disk, monkeypatch):
+    """Test per-entry TTL in the disk backend"""
+    now = [1000.0]
+    monkeypatch.setattr("disk_cache.time.time", lambda: now[0])
+
+    disk.setex("short", 5, b"1")
+    disk.setex("long", 500, b"2")
+    now[0] += 10
+
+    assert disk.mget(["short", "long", "missing"]) == [None, b"2", None]
+    assert disk.get_stats()["expirations"] == 1
+
+def test_disk_cache_counter_expiry(disk, monkeypatch):
+    """Test that EXPIRE sets a counter's TTL and INCR keeps it, as in Redis"""
+    now = [1000.0]
+    monkeypatch.setattr("disk_cache.time.time", lambda: now[0])
+
+    assert not disk.expire("missing", 60)
+    assert disk.incr("counter") == 1
+    assert disk.expire("counter", 60)
+    now[0] += 30
+    assert disk.incr("counter") == 2
+    now[0] += 31
+
+    assert disk.get("counter") is None
+    assert disk.incr("counter") == 1
+
+def test_disk_cache_evicts_lru_within_budget(disk):
+    """Test that least recently used entries are evicted to stay under budget"""
+    for i in range(5):
+        disk.setex(f"k{i}", 60, b"v" * 3000)
+        disk.get("k0")  # Keep k0 recently used
+
+    assert disk.get("k0") is not None
+    assert disk.get("k1") is None
+    assert disk.current_bytes <= disk.max_bytes
+    assert disk.get_stats()["evictions"] > 0
+
+def test_disk_cache_survives_restart(tmp_path):
+    """Test that entries and counters persist across reopening the file"""
+    path = str(tmp_path / "cache.sqlite3")
+    disk = DiskCache(path, max_bytes=10_000)
+    disk.setex("key", 60, b"value")
+    assert disk.incr("ns:test") == 1
+    disk.close()
+
+    reopened = DiskCache(path, max_bytes=10_000)
+    assert reopened.get("key") == b"value"
+    assert reopened.incr("ns:test") == 2
+    assert reopened.current_bytes == disk.current_bytes
+    reopened.close()
+
+def test_disk_cache_lock_and_scan(disk):
+    """Test SET NX semantics and Redis-style pattern scans"""
+    assert disk.set("lock:a", "token", nx=True, px=1000)
+    assert disk.set("lock:a", "other", nx=True, px=1000) is None
+    assert disk.get("lock:a") == b"token"
+
+    disk.setex("layer:v0:a", 60, b"1")
+    disk.setex("layer:v0:b", 60, b"1")
+    assert sorted(disk.scan_iter(match="layer:*")) == ["layer:v0:a", "layer:v0:b"]
+    assert disk.unlink("layer:v0:a", "layer:v0:missing") == 1
+
+@pytest.mark.asyncio
+async def test_cache_response_on_disk_backend(disk, monkeypatch):
+    """Test that the decorators cache through the disk backend without Redis"""
+    monkeypatch.setattr(cache, "get_async_redis", lambda: AsyncDiskCache(disk))
+    calls = []
+
+    @cache.cache_response(ttl_seconds=60, prefix="test")
+    async def lookup(x):
+        calls.append(x)
+        return {"value": x}
+
+    assert await lookup(1) == {"value": 1}
+    cache.local_cache.clear()
+    assert await lookup(1) == {"value": 1}
+    assert await lookup(2) == {"value": 2}
+    assert calls == [1, 2]
+    assert disk.dbsize() == 2
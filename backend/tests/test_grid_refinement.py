@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+from services.isochrone import SearchGrid, get_radius_polygon
+from services.grid_refinement import refine_search_grid
+
+@pytest.fixture
+def large_grid():
+    """Search grid for a 120-mile radius (~30k cells at the default spacing)"""
+    return SearchGrid.from_polygon(get_radius_polygon(38.9634, -92.3293, 120))
+
+def _score_field(grid):
+    """Smooth background with two dark-sky peaks, one slightly better than the other"""
+    lats, lons = np.meshgrid(grid.lats, grid.lons, indexing="ij")
+    background = 0.3 + 0.05 * np.sin(lats * 3) * np.cos(lons * 2)
+    peak_a = 0.5 * np.exp(-((lats - 39.8) ** 2 + (lons + 91.2) ** 2) / 0.02)
+    peak_b = 0.45 * np.exp(-((lats - 38.1) ** 2 + (lons + 93.4) ** 2) / 0.05)
+    return background + peak_a + peak_b
+
+@pytest.mark.asyncio
+async def test_refinement_finds_best_cells_within_budget(large_grid):
+    """Test that coarse-to-fine refinement stays in budget and keeps the best spots"""
+    field = _score_field(large_grid)
+    evaluated = []
+
+    async def evaluate(rows, cols):
+        evaluated.append(len(rows))
+        return field[rows, cols]
+
+    refined = await refine_search_grid(large_grid, evaluate, point_budget=4000)
+
+    assert sum(evaluated) <= 4000
+    assert refined.size <= 4000
+    assert not (refined.mask & ~large_grid.mask).any()
+
+    full_scores = np.where(large_grid.mask, field, -np.inf)
+    refined_scores = np.where(refined.mask, field, -np.inf)
+    assert refined_scores.max() == full_scores.max()
+
+    # The best ten cells of the full grid are all found
+    best_full = np.sort(full_scores.ravel())[-10:]
+    best_refined = np.sort(refined_scores.ravel())[-10:]
+    np.testing.assert_allclose(best_refined, best_full)
+
+@pytest.mark.asyncio
+async def test_refinement_skips_grids_within_budget():
+    """Test that small grids are evaluated in full, untouched"""
+    grid = SearchGrid.from_polygon(get_radius_polygon(38.9634, -92.3293, 10))
+
+    async def evaluate(rows, cols):
+        raise AssertionError("should not be called")
+
+    assert await refine_search_grid(grid, evaluate, point_budget=grid.size) is grid
+    assert await refine_search_grid(grid, evaluate, point_budget=0) is grid
@@ -1,5 +1,23 @@
+import httpx
 import pytest
 from fastapi import status
+from shapely.geometry import Point, Polygon
+import numpy as np
+import cache
+from config import settings
+from services.outbound import get_provider
+from services.isochrone import (
+    global_cell_id,
+    snap_to_global_grid,
+    generate_grid_points,
+    get_radius_polygon,
+    equal_area_lon_spacing,
+    get_isochrone_polygon,
+    nearest_ladder_step,
+    served_drive_time_minutes,
+    simplify_to_vertex_budget,
+    SearchGrid
+)
 
 def test_root_endpoint(client):
     """Test the root endpoint"""
@@ -110,3 +128,159 @@ def test_search_area_geojson_structure(client, sample_request):
         assert "type" in data["search_area"]
         assert "coordinates" in data["search_area"]
         assert data["search_area"]["type"] == "Polygon"
+
+def test_global_cell_id_is_stable_under_float_noise():
+    """Test that coordinates snapping to the same grid point share a cell ID"""
+    assert global_cell_id(38.96, -92.33, 0.01) == global_cell_id(38.960000001, -92.3299999, 0.01)
+    assert global_cell_id(38.96, -92.33, 0.01) != global_cell_id(38.97, -92.33, 0.01)
+    assert global_cell_id(38.96, -92.33, 0.01) != global_cell_id(38.96, -92.32, 0.01)
+
+def test_global_cell_id_matches_snapped_point():
+    """Test that the cell ID is derived from the snap_to_global_grid lattice"""
+    spacing = 0.02
+    lat, lon = 38.9634, -92.3293
+    snapped_lat, snapped_lon = snap_to_global_grid(lat, lon, spacing)
+
+    assert global_cell_id(lat, lon, spacing) == global_cell_id(snapped_lat, snapped_lon, spacing)
+    assert global_cell_id(-90, -180, spacing) == 0
+
+def test_generate_grid_points_row_major_and_complete():
+    """Test that grid points are ordered row-major and match a per-point containment check"""
+    polygon = get_radius_polygon(38.9634, -92.3293, 10)
+    points = generate_grid_points(polygon, 0.02)
+
+    assert points == sorted(points)
+    assert len(points) == len(set(points))
+
+    minlon, minlat, maxlon, maxlat = polygon.bounds
+    expected = {
+        snap_to_global_grid(lat * 0.02, lon * 0.02, 0.02)
+        for lat in range(int(minlat / 0.02) - 1, int(maxlat / 0.02) + 2)
+        for lon in range(int(minlon / 0.02) - 1, int(maxlon / 0.02) + 2)
+        if polygon.contains(Point(lon * 0.02, lat * 0.02))
+    }
+    assert expected <= set(points)
+    assert all(polygon.boundary.distance(Point(lon, lat)) <= 0.002 for lat, lon in set(points) - expected)
+
+def test_generate_grid_points_tiny_polygon_falls_back_to_center():
+    """Test that a polygon smaller than one cell yields its snapped centroid"""
+    offset = 0.0001
+    polygon = Polygon([(-92.33 - offset, 38.96 - offset), (-92.33 + offset, 38.96 - offset),
+                       (-92.33 + offset, 38.96 + offset), (-92.33 - offset, 38.96 + offset)])
+
+    assert generate_grid_points(polygon, 0.02) == [snap_to_global_grid(38.96, -92.33, 0.02)]
+
+def test_search_grid_layers_align_with_points():
+    """Test that 2-D layers scatter and gather in the order of the grid's points"""
+    polygon = get_radius_polygon(38.9634, -92.3293, 5)
+    grid = SearchGrid.from_polygon(polygon, 0.02)
+    points = grid.points()
+
+    assert [tuple(p) for p in points.tolist()] == generate_grid_points(polygon, 0.02)
+    assert grid.size == len(points)
+    assert (grid.origin_lat, grid.origin_lon) == snap_to_global_grid(polygon.bounds[1] - 0.01, polygon.bounds[0] - 0.01, 0.02)
+
+    layer = grid.scatter(points[:, 0] * 10 + points[:, 1])
+    assert layer.shape == grid.shape
+    assert np.isnan(layer[~grid.mask]).all()
+    np.testing.assert_allclose(grid.gather(layer), points[:, 0] * 10 + points[:, 1])
+
+    rows, cols = np.nonzero(grid.mask)
+    np.testing.assert_allclose(grid.lats[rows], points[:, 0])
+    np.testing.assert_allclose(grid.lons[cols], points[:, 1])
+
+def test_equal_area_grid_keeps_density_constant():
+    """Test that equal-area grids sample the same area with similar point counts at any latitude"""
+    south = get_radius_polygon(30.0, -97.0, 40)  # Texas
+    north = get_radius_polygon(47.5, -95.0, 40)  # Northern tier
+
+    square_ratio = SearchGrid.from_polygon(north).size / SearchGrid.from_polygon(south).size
+    equal_area_ratio = (SearchGrid.from_polygon(north, equal_area=True).size /
+                        SearchGrid.from_polygon(south, equal_area=True).size)
+
+    assert square_ratio > 1.25
+    assert 0.9 < equal_area_ratio < 1.1
+
+def test_equal_area_lattice_is_shared_within_band():
+    """Test that grids in one latitude band land on the same longitude lattice"""
+    spacing = equal_area_lon_spacing(46.0)
+    assert spacing == equal_area_lon_spacing(49.9) == equal_area_lon_spacing(-47.0)
+    assert spacing > equal_area_lon_spacing(31.0) >= 0.02
+
+    a = SearchGrid.from_polygon(get_radius_polygon(46.2, -95.0, 20), equal_area=True)
+    b = SearchGrid.from_polygon(get_radius_polygon(46.5, -94.7, 20), equal_area=True)
+    shared = np.intersect1d(a.lons, b.lons)
+    assert len(shared) > 0.5 * len(a.lons)
+    np.testing.assert_allclose(a.lons / spacing, np.round(a.lons / spacing), atol=1e-6)
+
+class FakeOpenRouteClient:
+    """Stands in for the pooled OpenRouteService client, answering isochrone requests with nested circles"""
+    requests = []
+
+    async def post(self, url, json, headers):
+        FakeOpenRouteClient.requests.append(json)
+        lon, lat = json["locations"][0]
+        features = [
+            {
+                "properties": {"value": seconds},
+                "geometry": {"coordinates": [list(get_radius_polygon(lat, lon, seconds / 60).exterior.coords)]}
+            }
+            for seconds in json["range"]
+        ]
+        return httpx.Response(200, json={"features": features}, request=httpx.Request("POST", url))
+
+@pytest.fixture
+def fake_openroute(monkeypatch):
+    monkeypatch.setattr(cache, "get_async_redis", lambda: None)
+    monkeypatch.setattr(get_provider("openroute"), "get_client", FakeOpenRouteClient)
+    FakeOpenRouteClient.requests = []
+    return FakeOpenRouteClient.requests
+
+@pytest.mark.asyncio
+async def test_isochrone_ladder_serves_slider_from_one_call(fake_openroute):
+    """Test that nearby origins and any drive time share one multi-range request"""
+    first = await get_isochrone_polygon(38.9634, -92.3293, 30)
+    second = await get_isochrone_polygon(38.9612, -92.3287, 33)
+    shorter = await get_isochrone_polygon(38.9634, -92.3293, 20)
+    longer = await get_isochrone_polygon(38.9634, -92.3293, 52)
+
+    assert len(fake_openroute) == 1
+    assert fake_openroute[0]["locations"] == [[-92.33, 38.96]]
+    assert fake_openroute[0]["range"] == [600, 1200, 1800, 2700, 3600]
+    assert first == second
+    assert Polygon(first["coordinates"]).contains(Polygon(shorter["coordinates"]))
+    assert Polygon(longer["coordinates"]).contains(Polygon(first["coordinates"]))
+
+@pytest.mark.asyncio
+async def test_isochrone_ranges_stay_within_provider_limit(fake_openroute, monkeypatch):
+    """Test that ladder steps beyond the ORS 3600 s limit are never requested and long drives are capped"""
+    monkeypatch.setattr(settings, "isochrone_ladder_minutes", [10, 20, 30, 45, 60, 90, 120])
+
+    capped = await get_isochrone_polygon(38.9634, -92.3293, 120)
+    hour = await get_isochrone_polygon(38.9634, -92.3293, 60)
+
+    assert len(fake_openroute) == 1
+    assert fake_openroute[0]["range"] == [600, 1200, 1800, 2700, 3600]
+    assert capped == hour
+    assert served_drive_time_minutes(120) == 60
+    assert served_drive_time_minutes(33) == 30
+
+def test_nearest_ladder_step():
+    """Test drive times map to the closest ladder range"""
+    ladder = (10, 20, 30, 45, 60)
+    assert nearest_ladder_step(5, ladder) == 10
+    assert nearest_ladder_step(37, ladder) == 30
+    assert nearest_ladder_step(40, ladder) == 45
+    assert nearest_ladder_step(90, ladder) == 60
+
+def test_simplify_to_vertex_budget():
+    """Test detailed rings are simplified to the vertex budget without losing their shape"""
+    angles = np.linspace(0, 2 * np.pi, 2000, endpoint=False)
+    radii = 0.5 + 0.02 * np.sin(angles * 37)
+    ring = [[float(x), float(y)] for x, y in zip(radii * np.cos(angles), radii * np.sin(angles))]
+    ring.append(ring[0])
+
+    simplified = simplify_to_vertex_budget(ring, 200)
+
+    assert len(simplified) <= 200
+    assert Polygon(simplified).symmetric_difference(Polygon(ring)).area < 0.02 * Polygon(ring).area
@@ -1,6 +1,12 @@
 import pytest
+import numpy as np
+from rasterio.io import MemoryFile
+from rasterio.transform import from_origin
+import cache
+import services.light_pollution as light_pollution
 from services.light_pollution import (
     get_light_pollution_score,
+    get_light_pollution_scores_batch,
     pollution_score_to_bortle,
     get_quality_description
 )
@@ -46,6 +52,73 @@ async def test_light_pollution_caching():
 
     assert score1 == score2
 
+@pytest.fixture
+def synthetic_dataset(monkeypatch):
+    """Small in-memory VIIRS-like raster covering central Missouri"""
+    # Tiles cached from the real dataset must not leak into these lookups
+    monkeypatch.setattr(cache, "get_async_redis", lambda: None)
+
+    data = np.linspace(0, 50, 200 * 200, dtype=np.float32).reshape(200, 200)
+    data[100:110, 100:110] = -999.0  # NoData patch
+
+    with MemoryFile() as memfile:
+        with memfile.open(driver="GTiff", width=200, height=200, count=1, dtype="float32",
+                          crs="EPSG:4326", transform=from_origin(-93.0, 40.0, 0.01, 0.01),
+                          nodata=-999.0) as dataset:
+            dataset.write(data, 1)
+        with memfile.open() as dataset:
+            monkeypatch.setattr(light_pollution, "_light_pollution_dataset", dataset)
+            yield dataset
+
+@pytest.mark.asyncio
+async def test_light_pollution_tiles_match_raster(synthetic_dataset):
+    """Test that tile-cached scores match the raster pixel, or the fallback model"""
+    points = [
+        (39.5, -92.5),      # Inside raster
+        (38.97, -92.31),    # Inside raster
+        (38.95, -91.95),    # NoData patch -> distance fallback
+        (45.0, -100.0),     # Outside raster -> distance fallback
+    ]
+    data = synthetic_dataset.read(1)
+
+    def pixel_score(lat, lon):
+        row, col = synthetic_dataset.index(lon, lat)
+        return light_pollution._radiance_to_score(data[row, col])
+
+    expected = [
+        pixel_score(39.5, -92.5),
+        pixel_score(38.97, -92.31),
+        *light_pollution._distance_based_scores(np.array([38.95, 45.0]), np.array([-91.95, -100.0])),
+    ]
+
+    batch_scores = await get_light_pollution_scores_batch(points)
+    single_scores = [await get_light_pollution_score(lat, lon) for lat, lon in points]
+
+    assert batch_scores == pytest.approx(expected, abs=1e-4)
+    assert single_scores == batch_scores
+
+@pytest.mark.asyncio
+async def test_failed_raster_read_is_not_cached(synthetic_dataset, monkeypatch):
+    """Test that a failed tile read falls back to the distance model without caching it"""
+    read_window = light_pollution._read_light_pollution_window
+
+    def failing_read(dataset, lats, lons):
+        raise OSError("transient read error")
+
+    monkeypatch.setattr(light_pollution, "_read_light_pollution_window", failing_read)
+    fallback = await get_light_pollution_score(39.51, -92.51)
+    assert fallback == pytest.approx(light_pollution._distance_based_scores(np.array([39.51]), np.array([-92.51]))[0])
+
+    monkeypatch.setattr(light_pollution, "_read_light_pollution_window", read_window)
+    row, col = synthetic_dataset.index(-92.51, 39.51)
+    expected = light_pollution._radiance_to_score(synthetic_dataset.read(1)[row, col])
+    assert await get_light_pollution_score(39.51, -92.51) == pytest.approx(expected, abs=1e-4)
+
+@pytest.mark.asyncio
+async def test_light_pollution_batch_empty():
+    """Test batch lookup with no points"""
+    assert await get_light_pollution_scores_batch([]) == []
+
 def test_pollution_score_to_bortle():
     """Test Bortle scale conversion"""
     # Test boundary conditions
@@ -0,0 +1,152 @@
+import asyncio
+import httpx
+import pytest
+import services.outbound as outbound
+from config import settings
+from services.outbound import CircuitOpenError, Provider, RateLimitExceeded
+
+def _provider(**overrides) -> Provider:
+    limits = {"rate_per_second": 100.0, "burst": 100, "max_concurrency": 10, "failure_threshold": 3,
+              "recovery_seconds": 30.0}
+    limits.update(overrides)
+    return Provider("test", **limits)
+
+def _http_error(status: int) -> httpx.HTTPStatusError:
+    request = httpx.Request("GET", "https://example.com")
+    return httpx.HTTPStatusError("error", request=request, response=httpx.Response(status, request=request))
+
+async def _fail(provider: Provider, error: Exception):
+    with pytest.raises(type(error)):
+        async with provider.call():
+            raise error
+
+@pytest.mark.asyncio
+async def test_circuit_opens_after_repeated_failures_and_recovers(monkeypatch):
+    """Test that the breaker fails fast once open and closes after a successful probe"""
+    now = [1000.0]
+    monkeypatch.setattr(outbound.time, "monotonic", lambda: now[0])
+    provider = _provider()
+
+    for _ in range(3):
+        await _fail(provider, httpx.ConnectTimeout("timed out"))
+    assert provider.breaker.state == "open"
+
+    with pytest.raises(CircuitOpenError):
+        async with provider.call():
+            pass
+    assert provider.calls == 3
+
+    # After the recovery period a single probe goes through and closes the circuit
+    now[0] += 31
+    async with provider.call():
+        pass
+    assert provider.breaker.state == "closed"
+    assert provider.get_stats()["rejected_open"] == 1
+
+@pytest.mark.asyncio
+async def test_failed_probe_reopens_circuit(monkeypatch):
+    """Test that a failing half-open probe keeps the circuit open for another period"""
+    now = [1000.0]
+    monkeypatch.setattr(outbound.time, "monotonic", lambda: now[0])
+    provider = _provider(failure_threshold=1)
+
+    await _fail(provider, _http_error(503))
+    now[0] += 31
+    await _fail(provider, _http_error(502))
+
+    assert provider.breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        async with provider.call():
+            pass
+
+@pytest.mark.asyncio
+async def test_client_errors_do_not_trip_breaker():
+    """Test that 4xx responses (other than 429) count as the provider being up"""
+    provider = _provider(failure_threshold=1)
+
+    await _fail(provider, _http_error(404))
+    assert provider.breaker.state == "closed"
+
+    await _fail(provider, _http_error(429))
+    assert provider.breaker.state == "open"
+
+@pytest.mark.asyncio
+async def test_our_own_errors_do_not_trip_breaker(monkeypatch):
+    """Test that errors raised by our code inside call() neither count as failures nor close the circuit"""
+    now = [1000.0]
+    monkeypatch.setattr(outbound.time, "monotonic", lambda: now[0])
+    provider = _provider(failure_threshold=2)
+
+    await _fail(provider, httpx.ReadTimeout("timed out"))
+    await _fail(provider, KeyError("data"))
+    await _fail(provider, ValueError("bad JSON"))
+    assert provider.breaker.state == "closed"
+    assert provider.breaker.consecutive_failures == 1
+    assert provider.failures == 1
+
+    # A parse error in a half-open probe leaves the circuit for the next probe to decide
+    await _fail(provider, _http_error(503))
+    now[0] += 31
+    await _fail(provider, ValueError("bad JSON"))
+    assert provider.breaker.state == "half_open"
+    await _fail(provider, _http_error(500))
+    assert provider.breaker.state == "open"
+
+@pytest.mark.asyncio
+async def test_rate_limit_rejects_beyond_burst(monkeypatch):
+    """Test that calls which would queue longer than the max wait are refused"""
+    monkeypatch.setattr(settings, "outbound_max_wait_seconds", 0.0)
+    provider = _provider(rate_per_second=0.01, burst=2)
+
+    for _ in range(2):
+        async with provider.call():
+            pass
+    with pytest.raises(RateLimitExceeded):
+        async with provider.call():
+            pass
+    assert provider.get_stats()["rejected_rate_limit"] == 1
+    assert provider.breaker.state == "closed"
+
+@pytest.mark.asyncio
+async def test_concurrency_is_capped():
+    """Test that no more than max_concurrency calls run at once"""
+    provider = _provider(max_concurrency=2)
+    peak = [0]
+
+    async def call():
+        async with provider.call():
+            peak[0] = max(peak[0], provider.in_flight)
+            await asyncio.sleep(0.01)
+
+    await asyncio.gather(*[call() for _ in range(6)])
+
+    assert peak[0] == 2
+    assert provider.calls == 6
+
+def test_debug_providers_endpoint(client):
+    """Test that every outbound provider's breaker state is exposed"""
+    response = client.get("/debug/providers")
+    assert response.status_code == 200
+
+    data = response.json()
+    assert set(data) == {"openweather", "openroute", "google_places", "astronomy"}
+    assert data["openweather"]["state"] in ("closed", "open", "half_open")
+
+@pytest.mark.asyncio
+async def test_calls_share_one_pooled_client():
+    """Test that every call lends the same keep-alive client until it is closed"""
+    provider = _provider(max_concurrency=3)
+
+    async with provider.call() as first:
+        pass
+    async with provider.call() as second:
+        pass
+
+    assert first is second
+    assert first.timeout.read == provider.timeout_seconds
+
+    await provider.close()
+    assert first.is_closed
+    async with provider.call() as reopened:
+        assert reopened is not first
+    await provider.close()
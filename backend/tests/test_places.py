@@ -1,6 +1,12 @@
 import pytest
+import numpy as np
 from unittest.mock import AsyncMock, patch
-from services.places import search_nearby_places, find_best_stargazing_spots
+from services.places import (
+    search_nearby_places,
+    find_best_stargazing_spots,
+    calculate_stargazing_score,
+    calculate_stargazing_scores
+)
 
 @pytest.mark.asyncio
 async def test_search_nearby_places_no_api_key():
@@ -96,3 +102,16 @@ async def test_find_best_stargazing_spots_structure():
     assert isinstance(spot['lon'], float)
     assert isinstance(spot['place_type'], str)
     assert isinstance(spot['pollution_score'], float)
+
+def test_calculate_stargazing_scores_matches_scalar():
+    """Test that the vectorized score matches the per-point score, NaN acting as None"""
+    pollution = [0.1, 0.5, 0.9, 0.3]
+    clouds = [0.0, None, 80.0, 40.0]
+    trees = [0.2, 0.7, None, 0.0]
+
+    expected = [calculate_stargazing_score(p, c, t, 0.5, 0.3, 0.2) for p, c, t in zip(pollution, clouds, trees)]
+    scores = calculate_stargazing_scores(
+        np.array(pollution), np.array(clouds, dtype=float), np.array(trees, dtype=float), 0.5, 0.3, 0.2
+    )
+
+    assert scores.tolist() == pytest.approx(expected)
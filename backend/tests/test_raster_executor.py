@@ -0,0 +1,57 @@
+import asyncio
+import threading
+import pytest
+import numpy as np
+from rasterio.io import MemoryFile
+from rasterio.transform import from_origin
+from services.raster_executor import RasterExecutor
+
+@pytest.fixture
+def raster_path():
+    """Path of a small in-memory raster that worker threads can open"""
+    with MemoryFile() as memfile:
+        with memfile.open(driver="GTiff", width=10, height=10, count=1, dtype="float32",
+                          crs="EPSG:4326", transform=from_origin(-93.0, 40.0, 0.1, 0.1)) as dataset:
+            dataset.write(np.arange(100, dtype=np.float32).reshape(10, 10), 1)
+        yield memfile.name
+
+def _read_pixel(dataset, row, col):
+    return float(dataset.read(1, window=((row, row + 1), (col, col + 1)))[0, 0]), id(dataset), threading.get_ident()
+
+@pytest.mark.asyncio
+async def test_raster_executor_reads_with_per_thread_handles(raster_path):
+    """Test that each worker thread reads through its own dataset handle"""
+    executor = RasterExecutor(max_workers=2)
+    try:
+        results = await asyncio.gather(*[
+            executor.run(raster_path, _read_pixel, i % 10, i % 10) for i in range(20)
+        ])
+
+        assert [value for value, _, _ in results] == [float((i % 10) * 11) for i in range(20)]
+
+        # One handle per worker thread, never shared between threads
+        handles_by_thread = {}
+        for _, handle, thread in results:
+            handles_by_thread.setdefault(thread, set()).add(handle)
+        assert all(len(handles) == 1 for handles in handles_by_thread.values())
+        assert len(handles_by_thread) <= 2
+    finally:
+        executor.shutdown()
+
+@pytest.mark.asyncio
+async def test_raster_executor_stats(raster_path):
+    """Test that queue depth and wait time are reported"""
+    executor = RasterExecutor(max_workers=1)
+    try:
+        await asyncio.gather(*[executor.run(raster_path, _read_pixel, 0, 0) for _ in range(5)])
+
+        stats = executor.get_stats()
+        assert stats["completed"] == 5
+        assert stats["queue_depth"] == 0
+        assert stats["active"] == 0
+        assert stats["max_wait_ms"] >= stats["avg_wait_ms"] >= 0
+        assert stats["open_handles"] == 1
+    finally:
+        executor.shutdown()
+
+    assert executor.get_stats()["open_handles"] == 0
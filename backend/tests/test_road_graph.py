@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+from shapely.geometry import Point, Polygon
+import cache
+import services.road_graph as road_graph
+from config import settings
+from services.isochrone import get_isochrone_polygon
+from services.road_graph import RoadGraph
+
+@pytest.fixture
+def lattice_graph():
+    """41x41 two-way street lattice, 0.01° apart, one minute per block, centred on (39.0, -92.0)"""
+    size = 41
+    rows, cols = np.divmod(np.arange(size * size), size)
+    lat = 38.8 + rows * 0.01
+    lon = -92.2 + cols * 0.01
+
+    node = np.arange(size * size).reshape(size, size)
+    horizontal = np.column_stack([node[:, :-1].ravel(), node[:, 1:].ravel()])
+    vertical = np.column_stack([node[:-1, :].ravel(), node[1:, :].ravel()])
+    edges = np.vstack([horizontal, vertical])
+    sources = np.concatenate([edges[:, 0], edges[:, 1]])
+    targets = np.concatenate([edges[:, 1], edges[:, 0]])
+    return RoadGraph.from_edges(lat, lon, sources, targets, np.full(len(sources), 60.0))
+
+def test_nearest_node(lattice_graph):
+    """Test that points snap to the closest intersection, even far off the network"""
+    node = lattice_graph.nearest_node(39.004, -91.996)
+    assert (lattice_graph.lat[node], lattice_graph.lon[node]) == pytest.approx((39.0, -92.0))
+
+    corner = lattice_graph.nearest_node(45.0, -80.0)
+    assert (lattice_graph.lat[corner], lattice_graph.lon[corner]) == pytest.approx((39.2, -91.8))
+
+def test_reachable_is_bounded_by_drive_time(lattice_graph):
+    """Test that the bounded search reaches exactly the blocks within the time budget"""
+    source = lattice_graph.nearest_node(39.0, -92.0)
+    lats, lons = lattice_graph.reachable(source, 5 * 60)
+
+    blocks = np.round(np.abs(lats - 39.0) / 0.01) + np.round(np.abs(lons + 92.0) / 0.01)
+    intersections = np.isclose(lats * 100, np.round(lats * 100)) & np.isclose(lons * 100, np.round(lons * 100))
+    # A diamond of 5 blocks' Manhattan radius: 2 * 5 * 6 + 1 intersections
+    assert intersections.sum() == 61
+    assert blocks.max() <= 5
+
+def test_isochrone_grows_with_drive_time(lattice_graph):
+    """Test that longer drives give larger, nested polygons around the origin"""
+    short = lattice_graph.isochrone(39.0, -92.0, 5)
+    long = lattice_graph.isochrone(39.0, -92.0, 10)
+
+    assert short.contains(Point(-92.0, 39.0))
+    assert long.buffer(1e-9).contains(short)
+    assert long.area > 3 * short.area
+
+def test_road_graph_round_trips_through_npz(lattice_graph, tmp_path):
+    """Test that a saved graph loads back with identical CSR arrays"""
+    path = tmp_path / "graph.npz"
+    lattice_graph.save(str(path))
+    loaded = RoadGraph.load(str(path))
+
+    assert loaded.node_count == lattice_graph.node_count
+    np.testing.assert_array_equal(loaded.indptr, lattice_graph.indptr)
+    np.testing.assert_array_equal(loaded.indices, lattice_graph.indices)
+    np.testing.assert_array_equal(loaded.travel_seconds, lattice_graph.travel_seconds)
+
+@pytest.mark.asyncio
+async def test_local_provider_serves_drive_time_searches(lattice_graph, monkeypatch):
+    """Test that the local provider answers get_isochrone_polygon without OpenRouteService"""
+    monkeypatch.setattr(cache, "get_async_redis", lambda: None)
+    monkeypatch.setattr(road_graph, "_road_graph", lattice_graph)
+    monkeypatch.setattr(settings, "isochrone_provider", "local")
+
+    polygon = Polygon((await get_isochrone_polygon(39.0, -92.0, 5))["coordinates"])
+
+    # Five one-minute blocks in each direction
+    assert polygon.contains(Point(-92.0, 39.04))
+    assert not polygon.contains(Point(-92.0, 39.07))
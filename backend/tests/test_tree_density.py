@@ -0,0 +1,41 @@
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin, rowcol
+from rasterio.warp import transform
+from services.tree_density import _read_tree_density_window
+
+def _albers_raster(path):
+    """A 30 m EPSG:5070 ALSTK raster over central Missouri, rising smoothly west to east (0-150 t/ac)"""
+    west, north = 300000.0, 1750000.0
+    width, height = 3000, 2400
+    values = np.tile(np.linspace(0, 150, width, dtype=np.float32), (height, 1))
+    values[:50, :50] = -9999  # nodata
+    with rasterio.open(path, "w", driver="GTiff", width=width, height=height, count=1, dtype="float32",
+                       crs="EPSG:5070", transform=from_origin(west, north, 30.0, 30.0), nodata=-9999,
+                       tiled=True, blockxsize=256, blockysize=256) as dataset:
+        dataset.write(values, 1)
+
+def test_tile_reads_are_decimated_to_the_points(tmp_path):
+    """Test that a tile's read stays near its point count and matches per-point sampling"""
+    path = str(tmp_path / "alstk.tif")
+    _albers_raster(path)
+    lats, lons = np.meshgrid(np.arange(38.2, 38.6, 0.01), np.arange(-92.4, -91.5, 0.01), indexing="ij")
+    lats, lons = lats.ravel(), lons.ravel()
+
+    with rasterio.open(path) as dataset:
+        reads = []
+        read = dataset.read
+        dataset.read = lambda *args, **kwargs: reads.append(kwargs.get("out_shape")) or read(*args, **kwargs)
+        scores = _read_tree_density_window(dataset, lats, lons)
+
+        xs, ys = transform("EPSG:4326", dataset.crs, list(lons), list(lats))
+        rows, cols = rowcol(dataset.transform, xs, ys)
+        inside = (np.asarray(rows) >= 0) & (np.asarray(rows) < dataset.height) \
+            & (np.asarray(cols) >= 0) & (np.asarray(cols) < dataset.width)
+        exact = np.array([value[0] for value in dataset.sample(zip(np.asarray(xs)[inside], np.asarray(ys)[inside]))])
+
+    assert inside.sum() > 1000
+    assert reads[0][0] * reads[0][1] <= 8 * len(lats)
+    # Nearest-pixel decimation moves each sample by a few 30 m pixels at most
+    np.testing.assert_allclose(scores[inside], np.minimum(exact / 150.0, 1.0), atol=0.01)
+    assert (scores[~inside] == 0.0).all()